@@ -0,0 +1,107 @@
+import json
+import re
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from benchmarks.synthetic_archive import SyntheticArchive
+
+RANGE_HEADER = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+class ArchiveServer:
+    """
+    Serves a SyntheticArchive on localhost: Apache-style directory listings and CDF files with range requests like
+    CDAWeb, and the /query and /download/ endpoints of the IMAP data access API. Every request waits latency_seconds.
+    """
+
+    def __init__(self, archive: SyntheticArchive, latency_seconds: float = 0.0):
+        self.archive = archive
+        self.latency_seconds = latency_seconds
+        self.request_count = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> 'ArchiveServer':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _handler_for(archive_server: ArchiveServer):
+    class ArchiveRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # headers and body are separate writes, so with Nagle's algorithm every keep-alive response would wait for
+        # the client's delayed ACK, about 40 ms, and the benchmark would mostly measure that stall
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            archive_server.request_count += 1
+            if archive_server.latency_seconds:
+                time.sleep(archive_server.latency_seconds)
+
+            url = urlsplit(self.path)
+            archive = archive_server.archive
+            if url.path == '/query':
+                self._send(200, json.dumps(_query(archive, parse_qs(url.query))).encode(), 'application/json')
+            elif url.path in archive.listings:
+                self._send(200, _listing_html(url.path, archive.listings[url.path]).encode(), 'text/html')
+            elif url.path in archive.files:
+                self._send_file(archive.files[url.path])
+            else:
+                self._send(404, b'Not Found', 'text/plain')
+
+        def _send_file(self, content: bytes):
+            requested_range = RANGE_HEADER.fullmatch(self.headers.get('Range', ''))
+            if requested_range is None:
+                self._send(200, content, 'application/x-cdf')
+                return
+            start = int(requested_range.group(1))
+            end = min(int(requested_range.group(2) or len(content) - 1), len(content) - 1)
+            self._send(206, content[start:end + 1], 'application/x-cdf',
+                       {'Content-Range': f'bytes {start}-{end}/{len(content)}'})
+
+        def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ArchiveRequestHandler
+
+
+def _query(archive: SyntheticArchive, parameters: dict) -> list:
+    def matches(record):
+        return all(record.get(name) == values[0] for name, values in parameters.items()
+                   if name in ('instrument', 'data_level', 'descriptor')) \
+            and record['start_date'] >= parameters.get('start_date', [''])[0] \
+            and ('end_date' not in parameters or record['start_date'] < parameters['end_date'][0])
+
+    return [record for record in archive.imap_records if matches(record)]
+
+
+def _listing_html(path: str, names: list) -> str:
+    rows = "".join(f'<tr><td valign="top"><img src="/icons/unknown.gif" alt="[   ]"></td>'
+                   f'<td><a href="{escape(name)}">{escape(name)}</a></td><td align="right">2024-01-01 00:00</td></tr>'
+                   for name in sorted(names))
+    return (f'<html><head><title>Index of {escape(path)}</title></head><body><h1>Index of {escape(path)}</h1>'
+            f'<table><tr><th>Name</th><th>Last modified</th></tr>'
+            f'<tr><td valign="top"><img src="/icons/back.gif" alt="[PARENTDIR]"></td>'
+            f'<td><a href="/">Parent Directory</a></td><td>&nbsp;</td></tr>{rows}</table></body></html>')
@@ -0,0 +1,85 @@
+"""
+Offline end-to-end benchmark: generates a synthetic archive, serves it on localhost and times main.py against it.
+
+    python -m benchmarks.benchmark imap --products 40 --files-per-product 365 --latency-ms 20 -- --workers 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.archive_server import ArchiveServer
+from benchmarks.synthetic_archive import build_imap_archive, build_psp_archive
+from data_indexer.index_file import read_index
+
+REPOSITORY_ROOT = Path(__file__).resolve().parent.parent
+ARCHIVE_BUILDERS = {'imap': build_imap_archive, 'psp': build_psp_archive}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Time main.py against a synthetic local archive")
+    parser.add_argument('indexer', choices=sorted(ARCHIVE_BUILDERS))
+    parser.add_argument('--products', type=int, default=12, help="number of data products")
+    parser.add_argument('--files-per-product', type=int, default=30, help="number of daily files per product")
+    parser.add_argument('--variables', type=int, default=8, help="data variables per synthetic CDF")
+    parser.add_argument('--records', type=int, default=1440, help="records per synthetic CDF")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="delay added to every server response")
+    parser.add_argument('--report', metavar='PATH', help="also write the results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="show the indexer's output")
+    parser.epilog = "Arguments after -- are passed on to main.py, e.g. -- --workers 4"
+    separator = argv.index('--') if '--' in argv else len(argv)
+    args = parser.parse_args(argv[:separator])
+    args.indexer_arguments = argv[separator + 1:]
+    return args
+
+
+def run_benchmark(args) -> dict:
+    indexer_arguments = args.indexer_arguments
+    with tempfile.TemporaryDirectory() as work_directory:
+        setup_started_at = time.perf_counter()
+        archive = ARCHIVE_BUILDERS[args.indexer](work_directory, args.products, args.files_per_product,
+                                                 args.variables, args.records)
+        setup_seconds = time.perf_counter() - setup_started_at
+
+        environment = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [str(REPOSITORY_ROOT),
+                                                                                 os.environ.get('PYTHONPATH')]))}
+        output = None if args.verbose else subprocess.DEVNULL
+        with ArchiveServer(archive, args.latency_ms / 1000) as server:
+            started_at = time.perf_counter()
+            subprocess.run([sys.executable, '-m', 'benchmarks.run_indexer', server.url, args.indexer,
+                            *indexer_arguments], cwd=work_directory, env=environment, stdout=output, check=True)
+            wall_seconds = time.perf_counter() - started_at
+            request_count = server.request_count
+
+        index_entries = read_index(os.path.join(work_directory, f'index_{args.indexer}.v2.json'))
+
+    # ru_maxrss is the largest resident set of any finished child process, reported in KiB on Linux
+    peak_rss_kib = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss_kib //= 1024
+    indexed_files = sum(len(entry["file_timeranges"]) for entry in index_entries)
+    return {"indexer": args.indexer, "products": args.products, "files_per_product": args.files_per_product,
+            "latency_ms": args.latency_ms, "indexer_arguments": indexer_arguments,
+            "setup_seconds": round(setup_seconds, 3), "wall_seconds": round(wall_seconds, 3),
+            "indexed_products": len(index_entries), "indexed_files": indexed_files,
+            "products_per_second": round(len(index_entries) / wall_seconds, 2),
+            "files_per_second": round(indexed_files / wall_seconds, 1),
+            "server_requests": request_count, "peak_rss_mib": round(peak_rss_kib / 1024, 1)}
+
+
+def main():
+    args = parse_arguments(sys.argv[1:])
+    results = run_benchmark(args)
+    for name, value in results.items():
+        print(f"{name}: {value}")
+    if args.report:
+        Path(args.report).write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == '__main__':
+    main()
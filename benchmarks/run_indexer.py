@@ -0,0 +1,22 @@
+"""Runs main.py with the CDAWeb and IMAP API URLs pointed at a local ArchiveServer: run_indexer.py SERVER_URL ARGS..."""
+import sys
+
+import imap_data_access
+
+import main
+from data_indexer import imap_data_processor
+from data_indexer.cdf_downloader import psp_downloader
+
+
+def point_indexer_at(server_url: str):
+    imap_data_access.config['DATA_ACCESS_URL'] = server_url
+    imap_data_processor.imap_dev_server = server_url + '/'
+    psp_downloader.psp_isois_cda_base_url = server_url + '/pub/data/psp/isois/{}/l2/'
+    psp_downloader.psp_fields_cda_base_url = server_url + '/pub/data/psp/fields/l2/{}/'
+    psp_downloader.omni_cda_base_url = server_url + '/pub/data/omni/omni_cdaweb/{}/'
+
+
+if __name__ == '__main__':
+    point_indexer_at(sys.argv[1])
+    sys.argv = ['main.py', *sys.argv[2:]]
+    main.main()
@@ -0,0 +1,137 @@
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from spacepy import pycdf
+
+IMAP_INSTRUMENTS = ["swapi", "codice", "mag", "hit", "swe", "glows"]
+IMAP_DATA_LEVELS = ["l3", "l3a", "l3b"]
+PSP_ISOIS_DETECTORS = ["epihi", "epilo", "merged"]
+PSP_FIELDS_DATA_SETS = ["mag_rtn_4_per_cycle", "mag_rtn_1min"]
+OMNI_DATA_SET = "hourly"
+FIRST_FILE_DATE = date(2024, 1, 1)
+
+
+@dataclass
+class SyntheticArchive:
+    """CDF bytes by URL path, directory listings by URL path and IMAP query records, as served by ArchiveServer."""
+    files: Dict[str, bytes] = field(default_factory=dict)
+    listings: Dict[str, List[str]] = field(default_factory=dict)
+    imap_records: List[Dict] = field(default_factory=list)
+
+    def add_file(self, path: str, content: bytes):
+        self.files[path] = content
+        directory, name = path.rsplit('/', 1)
+        self._add_listing_entry(directory + '/', name)
+
+    def _add_listing_entry(self, directory: str, name: str):
+        if directory not in self.listings:
+            self.listings[directory] = []
+            parent, child = directory.rstrip('/').rsplit('/', 1)
+            if parent:
+                self._add_listing_entry(parent + '/', child + '/')
+        if name not in self.listings[directory]:
+            self.listings[directory].append(name)
+
+
+def write_synthetic_cdf(path: str, logical_source: str, data_version: str, variable_count: int,
+                        record_count: int) -> bytes:
+    """Writes a CDF with ISTP-style global and variable attributes and returns its bytes."""
+    if os.path.exists(path):
+        os.remove(path)
+    epoch = [datetime(2024, 1, 1) + timedelta(minutes=minute) for minute in range(record_count)]
+    with pycdf.CDF(path, '') as cdf:
+        cdf.attrs['Logical_source'] = logical_source
+        cdf.attrs['Logical_source_description'] = f"Synthetic {logical_source} data for benchmarking"
+        cdf.attrs['Data_version'] = data_version
+        cdf.attrs['Generation_date'] = '20240101'
+        cdf.attrs['Mission_group'] = 'Benchmark'
+        cdf.attrs['PI_name'] = 'Synthetic'
+
+        cdf.new('epoch', data=epoch, type=pycdf.const.CDF_TIME_TT2000)
+        cdf['epoch'].attrs['VAR_TYPE'] = 'support_data'
+        cdf['epoch'].attrs['UNITS'] = 'ns'
+        cdf['epoch'].attrs['CATDESC'] = 'Time'
+        cdf['epoch'].attrs['DISPLAY_TYPE'] = 'no_plot'
+
+        cdf.new('energy', data=np.linspace(1, 100, 16, dtype='float32'), recVary=False)
+        cdf['energy'].attrs['VAR_TYPE'] = 'support_data'
+        cdf['energy'].attrs['UNITS'] = 'keV'
+
+        random = np.random.default_rng(len(logical_source))
+        for variable_number in range(variable_count):
+            spectrogram = variable_number % 4 == 3
+            shape = (record_count, 16) if spectrogram else (record_count,)
+            name = f"{'flux' if spectrogram else 'value'}_{variable_number}"
+            cdf.new(name, data=random.random(shape, dtype='float32'))
+            cdf[name].attrs['VAR_TYPE'] = 'data'
+            cdf[name].attrs['CATDESC'] = f"Synthetic {name} of {logical_source}"
+            cdf[name].attrs['DISPLAY_TYPE'] = 'spectrogram' if spectrogram else 'time_series'
+            cdf[name].attrs['DEPEND_0'] = 'epoch'
+            cdf[name].attrs['UNITS'] = 'counts/s' if spectrogram else 'nT'
+            cdf[name].attrs['LABLAXIS'] = name
+            cdf[name].attrs['SCALETYP'] = 'log' if spectrogram else 'linear'
+            cdf[name].attrs['SCALEMIN'] = 0.1 if spectrogram else 0.0
+            cdf[name].attrs['VALIDMIN'] = 0.0
+            cdf[name].attrs['FILLVAL'] = -1e31
+            if spectrogram:
+                cdf[name].attrs['DEPEND_1'] = 'energy'
+    return Path(path).read_bytes()
+
+
+def build_imap_archive(scratch_directory: str, products: int, files_per_product: int, variable_count: int,
+                       record_count: int) -> SyntheticArchive:
+    archive = SyntheticArchive()
+    for product_number in range(products):
+        instrument = IMAP_INSTRUMENTS[product_number % len(IMAP_INSTRUMENTS)]
+        data_level = IMAP_DATA_LEVELS[product_number // len(IMAP_INSTRUMENTS) % len(IMAP_DATA_LEVELS)]
+        descriptor = f"synthetic-{product_number}"
+        logical_source = f"imap_{instrument}_{data_level}_{descriptor}"
+        content = write_synthetic_cdf(os.path.join(scratch_directory, f"{logical_source}.cdf"), logical_source,
+                                      "v001", variable_count, record_count)
+        for file_number in range(files_per_product):
+            file_date = FIRST_FILE_DATE + timedelta(days=file_number)
+            start_date = file_date.strftime('%Y%m%d')
+            file_path = f"imap/{instrument}/{data_level}/{file_date:%Y/%m}/{logical_source}_{start_date}_v001.cdf"
+            archive.imap_records.append({"file_path": file_path, "instrument": instrument, "data_level": data_level,
+                                         "descriptor": descriptor, "start_date": start_date, "version": "v001",
+                                         "extension": "cdf"})
+            archive.files[f"/download/{file_path}"] = content
+    return archive
+
+
+def build_psp_archive(scratch_directory: str, products: int, files_per_product: int, variable_count: int,
+                      record_count: int) -> SyntheticArchive:
+    """
+    Spreads the products over the PSP ISOIS modes, then adds the two FIELDS data sets and OMNI hourly, laid out like
+    the CDAWeb directories crawled by PspDownloader.
+    """
+    archive = SyntheticArchive()
+    isois_products = max(1, products - len(PSP_FIELDS_DATA_SETS) - 1)
+    product_directories = []
+    for product_number in range(isois_products):
+        detector = PSP_ISOIS_DETECTORS[product_number % len(PSP_ISOIS_DETECTORS)]
+        mode = f"mode{product_number // len(PSP_ISOIS_DETECTORS)}"
+        product_directories.append((f"/pub/data/psp/isois/{detector}/l2/{mode}/",
+                                    f"psp_isois-{detector}_l2-{mode}", False))
+    for data_set in PSP_FIELDS_DATA_SETS[:max(0, products - isois_products)]:
+        product_directories.append((f"/pub/data/psp/fields/l2/{data_set}/", f"psp_fld_l2_{data_set}", False))
+    if products > isois_products + len(PSP_FIELDS_DATA_SETS):
+        product_directories.append((f"/pub/data/omni/omni_cdaweb/{OMNI_DATA_SET}/", "omni2_h0_mrg1hr", True))
+
+    for directory, logical_source, six_monthly in product_directories:
+        content = write_synthetic_cdf(os.path.join(scratch_directory, f"{logical_source}.cdf"), logical_source,
+                                      "13", variable_count, record_count)
+        for file_number in range(files_per_product):
+            file_date = _file_date(file_number, six_monthly)
+            archive.add_file(f"{directory}{file_date:%Y}/{logical_source}_{file_date:%Y%m%d}_v13.cdf", content)
+    return archive
+
+
+def _file_date(file_number: int, six_monthly: bool) -> date:
+    if not six_monthly:
+        return FIRST_FILE_DATE + timedelta(days=file_number)
+    return date(FIRST_FILE_DATE.year + file_number // 2, 1 if file_number % 2 == 0 else 7, 1)
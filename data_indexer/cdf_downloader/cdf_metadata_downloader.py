@@ -0,0 +1,219 @@
+import re
+import struct
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from data_indexer.cdf_parser.cdf_parser import CdfSource, SparseCdf
+from data_indexer.http_client import download_once
+from data_indexer.spooled_download import Download, SpooledFile
+
+UNCOMPRESSED_V3_MAGIC = bytes.fromhex("cdf300010000ffff")
+
+INITIAL_RANGE_BYTES = 64 * 1024
+# the rest of a file this small costs less as one more request than as rounds of header records
+SMALL_CDF_BYTES = 1024 * 1024
+RECORD_READ_AHEAD_BYTES = 64 * 1024
+RANGE_COALESCE_GAP_BYTES = 4 * 1024
+# header records this scattered are cheaper to get by downloading the whole file
+MAX_RANGES_PER_ROUND = 8
+MAX_RANGE_ROUNDS = 6
+
+CDR, GDR, RVDR, ADR, AGREDR, ZVDR, AZEDR, UIR = 1, 2, 3, 4, 5, 8, 9, -1
+VDR_COMPRESSION_FLAG = 4
+
+content_range_matcher = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class _FullDownloadRequired(Exception):
+    pass
+
+
+class _WholeFileReceived(Exception):
+    def __init__(self, spooled_file: SpooledFile):
+        super().__init__()
+        self.spooled_file = spooled_file
+
+
+class CdfMetadataDownloader:
+    @staticmethod
+    @contextmanager
+    def get_cdf_metadata(url: str) -> Iterator[CdfSource]:
+        """
+        Yields the header records of the CDF at url, or the whole file when they cannot be fetched by range, spooled to
+        a scratch file that is removed on exit.
+        """
+        cdf = CdfMetadataDownloader._download_cdf_metadata(url)
+        if isinstance(cdf, SparseCdf):
+            yield cdf
+            return
+        with cdf:
+            yield cdf.file
+
+    @staticmethod
+    def _download_cdf_metadata(url: str) -> Union[SparseCdf, SpooledFile]:
+        download = download_once(url, headers=_range_header(0, INITIAL_RANGE_BYTES))
+        if download.file is not None:
+            return download.file
+        response = download.response
+        if response.is_error:
+            response.raise_for_status()
+        content_range = content_range_matcher.fullmatch(response.headers.get("Content-Range", ""))
+        if response.status_code != 206 or content_range is None:
+            return SparseCdf(len(response.content), [(0, response.content)])
+
+        total_size = int(content_range.group(3))
+        if response.content[:8] != UNCOMPRESSED_V3_MAGIC:
+            return CdfMetadataDownloader._get_full_cdf(url)
+
+        reader = _RangeReader(url, total_size, response.content)
+        try:
+            if total_size <= SMALL_CDF_BYTES:
+                reader.fetch([(len(response.content), total_size)])
+            _walk_metadata_records(reader)
+        except _WholeFileReceived as e:
+            return e.spooled_file
+        except _FullDownloadRequired as e:
+            print(f"Could not read CDF header records from {url}, downloading whole file; {e}")
+            return CdfMetadataDownloader._get_full_cdf(url)
+        return SparseCdf(total_size, reader.segments)
+
+    @staticmethod
+    def _get_full_cdf(url: str) -> Union[SparseCdf, SpooledFile]:
+        download = download_once(url)
+        if download.file is not None:
+            return download.file
+        if download.response.is_error:
+            download.response.raise_for_status()
+        return SparseCdf(len(download.response.content), [(0, download.response.content)])
+
+
+class _RangeReader:
+    def __init__(self, url: str, size: int, first_segment: bytes):
+        self.url = url
+        self.size = size
+        self.segments: List[Tuple[int, bytes]] = [(0, first_segment)]
+        self.round_count = 0
+
+    def read(self, offset: int, length: int) -> Optional[bytes]:
+        for segment_start, data in self.segments:
+            if segment_start <= offset and offset + length <= segment_start + len(data):
+                return data[offset - segment_start:offset - segment_start + length]
+        return None
+
+    def fetch(self, ranges: List[Tuple[int, int]]):
+        """Fetches one round of ranges, concurrently, since each round costs a round trip however many it has."""
+        ranges = [(start, min(end, self.size)) for start, end in _coalesce(ranges)]
+        if len(ranges) > MAX_RANGES_PER_ROUND:
+            raise _FullDownloadRequired(f"header records need {len(ranges)} ranges in one round")
+        if self.round_count >= MAX_RANGE_ROUNDS:
+            raise _FullDownloadRequired(f"header records need more than {MAX_RANGE_ROUNDS} rounds of range requests")
+        self.round_count += 1
+        if len(ranges) == 1:
+            downloads = [self._download(*ranges[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                futures = [executor.submit(self._download, *byte_range) for byte_range in ranges]
+            downloads = _results_closing_whole_files_on_failure(futures)
+
+        whole_files = [download.file for download in downloads if download.file is not None]
+        if whole_files:
+            for spooled_file in whole_files[1:]:
+                spooled_file.close()
+            raise _WholeFileReceived(whole_files[0])
+        for (start, end), download in zip(ranges, downloads):
+            response = download.response
+            if response.status_code != 206:
+                raise _FullDownloadRequired(f"expected a partial response at offset {start}, "
+                                            f"received HTTP {response.status_code}")
+            if len(response.content) != end - start:
+                raise _FullDownloadRequired(f"expected {end - start} bytes at offset {start}, "
+                                            f"received {len(response.content)}")
+            self.segments.append((start, response.content))
+
+    def _download(self, start: int, end: int):
+        return download_once(self.url, headers=_range_header(start, end))
+
+
+def _results_closing_whole_files_on_failure(futures: List[Future]) -> List[Download]:
+    """Results of finished downloads; when one of them failed, the whole files the others spooled are closed first."""
+    failure = next((future.exception() for future in futures if future.exception() is not None), None)
+    if failure is None:
+        return [future.result() for future in futures]
+    for future in futures:
+        if future.exception() is None and future.result().file is not None:
+            future.result().file.close()
+    raise failure
+
+
+def _walk_metadata_records(reader: _RangeReader):
+    """
+    Follows the record chains from the CDR to every attribute entry and variable descriptor. Variable index and data
+    records are not fetched: CdfParser opens sparse CDFs with the CDF library's file validation off, and reading the
+    metadata never touches them.
+    """
+    pending: List[int] = [8]
+    visited = set()
+    while pending:
+        missing_ranges = []
+        deferred = []
+        for offset in pending:
+            if offset <= 0 or offset + 12 > reader.size:
+                raise _FullDownloadRequired(f"record offset {offset} outside of file of size {reader.size}")
+            header = reader.read(offset, 12)
+            if header is None:
+                missing_ranges.append((offset, offset + RECORD_READ_AHEAD_BYTES))
+                deferred.append(offset)
+                continue
+
+            record_size, record_type = struct.unpack(">qi", header)
+            if record_size < 12 or offset + record_size > reader.size:
+                raise _FullDownloadRequired(f"record at {offset} has invalid size {record_size}")
+            record = reader.read(offset, record_size)
+            if record is None:
+                missing_ranges.append((offset, offset + record_size))
+                deferred.append(offset)
+                continue
+
+            visited.add(offset)
+            deferred += [pointer for pointer in _record_pointers(record_type, record) if pointer not in visited]
+
+        if missing_ranges:
+            reader.fetch(missing_ranges)
+        pending = [offset for offset in dict.fromkeys(deferred) if offset not in visited]
+
+
+def _record_pointers(record_type: int, record: bytes) -> List[int]:
+    def pointer_at(position):
+        return struct.unpack_from(">q", record, position)[0]
+
+    if record_type == CDR:
+        pointers = [pointer_at(12)]
+    elif record_type == GDR:
+        pointers = [pointer_at(12), pointer_at(20), pointer_at(28), pointer_at(64)]
+    elif record_type == ADR:
+        pointers = [pointer_at(12), pointer_at(20), pointer_at(48)]
+    elif record_type in (AGREDR, AZEDR, UIR):
+        pointers = [pointer_at(12)]
+    elif record_type in (RVDR, ZVDR):
+        pointers = [pointer_at(12)]
+        flags = struct.unpack_from(">i", record, 44)[0]
+        if flags & VDR_COMPRESSION_FLAG:
+            pointers.append(pointer_at(72))
+    else:
+        pointers = []
+    return [pointer for pointer in pointers if pointer > 0]
+
+
+def _coalesce(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    coalesced = []
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1] + RANGE_COALESCE_GAP_BYTES:
+            coalesced[-1] = (coalesced[-1][0], max(end, coalesced[-1][1]))
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+
+def _range_header(start: int, end: int) -> Dict[str, str]:
+    return {"Range": f"bytes={start}-{end - 1}"}
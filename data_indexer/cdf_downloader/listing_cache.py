@@ -0,0 +1,64 @@
+import json
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from data_indexer.cdf_downloader.listing_parser import ListingEntry
+from data_indexer.download_cache import conditional_request_headers, atomic_write
+
+
+@dataclass
+class CachedListing:
+    etag: Optional[str]
+    last_modified: Optional[str]
+    entries: List[ListingEntry]
+
+
+class ListingCache:
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._listings: Dict[str, CachedListing] = self._load()
+
+    def conditional_headers(self, url: str) -> Optional[Dict[str, str]]:
+        listing = self._listings.get(url)
+        if listing is None:
+            return None
+        return conditional_request_headers(listing.etag, listing.last_modified)
+
+    def get_entries(self, url: str, response: httpx.Response) -> Optional[List[ListingEntry]]:
+        listing = self._listings.get(url)
+        if response.status_code == 304 and listing is not None:
+            self.hits += 1
+            return listing.entries
+        self.misses += 1
+        return None
+
+    def put(self, url: str, response: httpx.Response, entries: List[ListingEntry]):
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag is None and last_modified is None:
+            self._listings.pop(url, None)
+            return
+        self._listings[url] = CachedListing(etag, last_modified, entries)
+
+    def save(self):
+        listings = {url: asdict(listing) for url, listing in self._listings.items()}
+        atomic_write(Path(self.path), json.dumps(listings).encode())
+
+    def __str__(self):
+        return f"listing cache: {self.hits} listings not modified, {self.misses} listings fetched"
+
+    def _load(self) -> Dict[str, CachedListing]:
+        try:
+            with open(self.path) as cache_file:
+                stored_listings = json.load(cache_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        # listings saved before the entries kept their last modified and size columns are fetched again
+        return {url: CachedListing(listing['etag'], listing['last_modified'],
+                                   [ListingEntry(*entry) for entry in listing['entries']])
+                for url, listing in stored_listings.items() if 'entries' in listing}
@@ -0,0 +1,135 @@
+import re
+from html import unescape
+from itertools import islice
+from typing import AsyncIterable, Iterable, Iterator, List, NamedTuple, Optional
+
+TOKEN = re.compile(r'<(/?)([A-Za-z][A-Za-z0-9]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>|<!--.*?-->|<[!?][^>]*>|([^<]+)',
+                   re.DOTALL)
+ATTRIBUTE = re.compile(r'([^\s=/>]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+
+class ListingEntry(NamedTuple):
+    href: Optional[str]
+    text: str
+    last_modified: Optional[str] = None
+    size: Optional[str] = None
+
+
+class ListingLinkExtractor:
+    """
+    Incremental scanner for Apache directory listings. Yields every <a> that is a direct child of a <td>, like
+    BeautifulSoup's select("td > a"), together with the text of the following cells in its row (last modified, size),
+    without building a document tree. Feed it the page in chunks of any size.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._open_elements: List[str] = []
+        self._link: Optional[ListingEntry] = None
+        self._link_text: Optional[List[str]] = None
+        self._cells: Optional[List[str]] = None
+
+    def feed(self, chunk: str) -> Iterator[ListingEntry]:
+        self._buffer += chunk
+        yield from self._scan(final=False)
+
+    def close(self) -> Iterator[ListingEntry]:
+        yield from self._scan(final=True)
+        yield from self._finish_link()
+
+    def _scan(self, final: bool) -> Iterator[ListingEntry]:
+        position = 0
+        while position < len(self._buffer):
+            token = TOKEN.match(self._buffer, position)
+            if token is None:
+                # an unclosed tag may be completed by the next chunk; otherwise the '<' is just text
+                if not final and self._buffer.find('>', position) == -1:
+                    break
+                self._add_text(self._buffer[position])
+                position += 1
+                continue
+            if not final and token.end() == len(self._buffer):
+                break
+            position = token.end()
+            closing, name, attributes, data = token.groups()
+            if data is not None:
+                self._add_text(data)
+            elif name is None:
+                continue
+            elif closing:
+                yield from self._end_element(name.lower())
+            else:
+                yield from self._start_element(name.lower(), attributes)
+        self._buffer = self._buffer[position:]
+
+    def _start_element(self, name: str, attributes: str) -> Iterator[ListingEntry]:
+        if name == 'tr':
+            yield from self._finish_link()
+        elif name == 'a' and self._open_elements and self._open_elements[-1] == 'td':
+            yield from self._finish_link()
+            self._link = ListingEntry(_attribute(attributes, 'href'), "")
+            self._link_text = []
+        elif name == 'td' and self._cells is not None:
+            self._cells.append("")
+        if name not in VOID_ELEMENTS and not attributes.rstrip().endswith('/'):
+            self._open_elements.append(name)
+
+    def _end_element(self, name: str) -> Iterator[ListingEntry]:
+        if name not in self._open_elements:
+            return
+        while self._open_elements.pop() != name:
+            pass
+        if name == 'a' and self._link_text is not None and 'a' not in self._open_elements:
+            self._link = self._link._replace(text="".join(self._link_text))
+            self._link_text = None
+            self._cells = []
+        elif name in ('tr', 'table'):
+            yield from self._finish_link()
+
+    def _add_text(self, data: str):
+        if self._link_text is not None:
+            self._link_text.append(unescape(data))
+        elif self._cells and 'td' in self._open_elements:
+            self._cells[-1] += unescape(data)
+
+    def _finish_link(self) -> Iterator[ListingEntry]:
+        if self._link is None:
+            return
+        link = self._link
+        if self._link_text is not None:
+            link = link._replace(text="".join(self._link_text))
+        cells = [cell.strip() or None for cell in self._cells or []]
+        self._link, self._link_text, self._cells = None, None, None
+        yield link._replace(last_modified=cells[0] if cells else None, size=cells[1] if len(cells) > 1 else None)
+
+
+def extract_listing_entries(chunks: Iterable[str]) -> Iterator[ListingEntry]:
+    """Yields the entries of a directory listing, skipping the first link (the parent directory)."""
+    return islice(_all_entries(chunks), 1, None)
+
+
+async def read_listing_entries(chunks: AsyncIterable[str]) -> List[ListingEntry]:
+    """extract_listing_entries for a listing that is still downloading."""
+    extractor = ListingLinkExtractor()
+    entries = []
+    async for chunk in chunks:
+        entries.extend(extractor.feed(chunk))
+    entries.extend(extractor.close())
+    return entries[1:]
+
+
+def _all_entries(chunks: Iterable[str]) -> Iterator[ListingEntry]:
+    extractor = ListingLinkExtractor()
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+    yield from extractor.close()
+
+
+def _attribute(attributes: str, wanted: str) -> Optional[str]:
+    for match in ATTRIBUTE.finditer(attributes):
+        name, double_quoted, single_quoted, unquoted = match.groups()
+        if name.lower() == wanted:
+            value = next((value for value in (double_quoted, single_quoted, unquoted) if value is not None), "")
+            return unescape(value)
+    return None
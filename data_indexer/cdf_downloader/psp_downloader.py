@@ -1,6 +1,5 @@
 from dataclasses import dataclass
-from enum import Enum
-from typing import List, Dict
+from typing import List, Dict, NamedTuple, Optional
 
 from data_indexer.cdf_downloader.psp_file_parser import PspFileParser, PspFileInfo
 from data_indexer.cdf_parser.variable_selector.default_variable_selector import DefaultVariableSelector
@@ -10,7 +9,7 @@ from data_indexer.cdf_parser.variable_selector.variable_selector import Variable
 from data_indexer.file_cadence.daily_file_cadence import DailyFileCadence
 from data_indexer.file_cadence.file_cadence import FileCadence
 from data_indexer.file_cadence.six_month_file_cadence import SixMonthFileCadence
-from data_indexer.http_client import http_client, get_with_retry
+from data_indexer.sharding import Shard, UNSHARDED
 
 psp_isois_cda_base_url = 'https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois/{}/l2/'
 psp_fields_cda_base_url = 'https://cdaweb.gsfc.nasa.gov/pub/data/psp/fields/l2/{}/'
@@ -26,6 +25,8 @@ class PspDirectoryInfo:
     variable_selector: type[VariableSelector]
     mission: str
     file_cadence: FileCadence
+    # of the data set among all data sets, whichever shard crawled it
+    position: int = 0
 
     def __eq__(self, other):
         return self.base_url == other.base_url and \
@@ -37,52 +38,47 @@ class PspDirectoryInfo:
             self.file_cadence.name == other.file_cadence.name
 
 
-class PspDownloader:
-    @staticmethod
-    def get_all_metadata() -> List[PspDirectoryInfo]:
-        psp_filenames = [
-            PspDownloader._get_metadata_for_multiple_data_sets(psp_isois_cda_base_url, 'ISOIS-EPIHi', 'epihi',
-                                                               DefaultVariableSelector, 'PSP', DailyFileCadence()),
-            PspDownloader._get_metadata_for_multiple_data_sets(psp_isois_cda_base_url, 'ISOIS-EPILo', 'epilo',
-                                                               MultiDimensionVariableSelector, 'PSP',
-                                                               DailyFileCadence()),
-            PspDownloader._get_metadata_for_multiple_data_sets(psp_isois_cda_base_url, 'ISOIS', 'merged',
-                                                               DefaultVariableSelector, 'PSP', DailyFileCadence()),
-            PspDownloader._get_metadata_for_one_data_set(psp_fields_cda_base_url, 'FIELDS', 'mag_rtn_4_per_cycle',
-                                                         MultiDimensionVariableSelector, 'PSP', DailyFileCadence()),
-            PspDownloader._get_metadata_for_one_data_set(psp_fields_cda_base_url, 'FIELDS', 'mag_rtn_1min',
-                                                         MultiDimensionVariableSelector, 'PSP', DailyFileCadence()),
-            PspDownloader._get_metadata_for_one_data_set(omni_cda_base_url, 'OMNI', 'hourly', OmniVariableSelector,
-                                                         'OMNI', SixMonthFileCadence())
-        ]
+class PspDataSet(NamedTuple):
+    base_url: str
+    instrument_human_readable: str
+    instrument_url: str
+    variable_selector: type[VariableSelector]
+    mission: str
+    file_cadence: FileCadence
+    # None when each subdirectory is a mode of its own, '' when the files of all subdirectories make up one data set
+    top_level_link: Optional[str] = None
 
-        return psp_filenames
 
+class PspDownloader:
     @staticmethod
-    def _get_metadata_for_multiple_data_sets(base_url: str, instrument_human_readable: str, detector_url: str,
-                                             variable_selector: type[VariableSelector], mission: str,
-                                             file_cadence: FileCadence) -> PspDirectoryInfo:
-        url = base_url.format(detector_url)
-        file_infos_by_mode = PspFileParser.get_dictionary_of_files(url)
-        return PspDirectoryInfo(base_url, instrument_human_readable, detector_url, file_infos_by_mode,
-                                variable_selector, mission, file_cadence)
+    def get_all_metadata(shard: Shard = UNSHARDED) -> List[PspDirectoryInfo]:
+        data_sets = [
+            PspDataSet(psp_isois_cda_base_url, 'ISOIS-EPIHi', 'epihi', DefaultVariableSelector, 'PSP',
+                       DailyFileCadence()),
+            PspDataSet(psp_isois_cda_base_url, 'ISOIS-EPILo', 'epilo', MultiDimensionVariableSelector, 'PSP',
+                       DailyFileCadence()),
+            PspDataSet(psp_isois_cda_base_url, 'ISOIS', 'merged', DefaultVariableSelector, 'PSP', DailyFileCadence()),
+            PspDataSet(psp_fields_cda_base_url, 'FIELDS', 'mag_rtn_4_per_cycle', MultiDimensionVariableSelector, 'PSP',
+                       DailyFileCadence(), top_level_link=''),
+            PspDataSet(psp_fields_cda_base_url, 'FIELDS', 'mag_rtn_1min', MultiDimensionVariableSelector, 'PSP',
+                       DailyFileCadence(), top_level_link=''),
+            PspDataSet(omni_cda_base_url, 'OMNI', 'hourly', OmniVariableSelector, 'OMNI', SixMonthFileCadence(),
+                       top_level_link=''),
+        ]
 
-    @staticmethod
-    def _get_metadata_for_one_data_set(base_url: str, instrument_human_readable: str, detector_url: str,
-                                       variable_selector: type[VariableSelector], mission: str,
-                                       file_cadence: FileCadence) -> PspDirectoryInfo:
-        url = base_url.format(detector_url)
-        file_infos_by_mode = PspFileParser.get_dictionary_of_files(url, top_level_link='')
-        return PspDirectoryInfo(base_url, instrument_human_readable, detector_url, file_infos_by_mode,
-                                variable_selector, mission, file_cadence)
+        # The data sets are fixed, so dealing them out by position balances the shards; only this shard's
+        # directories are crawled, all in one go
+        owned_data_sets = [(position, data_set) for position, data_set in enumerate(data_sets)
+                           if shard.owns_position(position)]
+        file_infos = PspFileParser.get_dictionaries_of_files(
+            [(data_set.base_url.format(data_set.instrument_url), data_set.top_level_link)
+             for _, data_set in owned_data_sets])
+        return [PspDirectoryInfo(data_set.base_url, data_set.instrument_human_readable, data_set.instrument_url,
+                                 file_infos_by_mode, data_set.variable_selector, data_set.mission,
+                                 data_set.file_cadence, position)
+                for (position, data_set), file_infos_by_mode in zip(owned_data_sets, file_infos)]
 
     @staticmethod
     def get_url(base_url: str, filename: str, instrument: str, category: str, year: str):
         instrument_base_url = base_url.format(instrument)
         return f"{instrument_base_url}{category}{year}/{filename}"
-
-    @staticmethod
-    def get_cdf_file(base_url: str, filename: str, instrument: str, category: str, year: str):
-        instrument_base_url = base_url.format(instrument)
-        file_url = f"{instrument_base_url}{category}{year}/{filename}"
-        return {"link": file_url, "data": get_with_retry(file_url).content}
@@ -1,58 +1,147 @@
+import asyncio
+import re
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple, NamedTuple
+from typing import Dict, List, Optional, Tuple
 
-from bs4 import BeautifulSoup
+import httpx
 
-from data_indexer.http_client import http_client, get_with_retry
+from data_indexer.cdf_downloader.listing_cache import ListingCache
+from data_indexer.cdf_downloader.listing_parser import extract_listing_entries, read_listing_entries, ListingEntry
+from data_indexer.http_client import async_stream_with_retry, HostConcurrencyLimiter, DEFAULT_MAX_REQUESTS_PER_HOST
+from data_indexer.metrics import metrics, LISTING_CRAWL
 
+listing_cache: Optional[ListingCache] = None
 
-class PspFileInfo(NamedTuple):
+
+def enable_listing_cache(path: str) -> ListingCache:
+    global listing_cache
+    listing_cache = ListingCache(path)
+    return listing_cache
+
+
+PSP_FILE_NAME = re.compile(r'_(\d{4})(\d{2})(\d{2})_v(\d+)\.cdf$')
+
+
+@dataclass(frozen=True, slots=True)
+class PspFileInfo:
     link: str
     name: str
     year: str
+    last_modified: Optional[str] = field(default=None, compare=False)
+    size: Optional[str] = field(default=None, compare=False)
+    version: int = field(init=False, compare=False)
+    start_date: datetime = field(init=False, compare=False)
 
-    @property
-    def version(self) -> int:
-        return int(self.name.split('_v')[-1].split('.')[0])
-
-    @property
-    def start_date(self) -> datetime:
-        return datetime.strptime(self.name.split('_')[-2], "%Y%m%d").replace(tzinfo=timezone.utc)
+    def __post_init__(self):
+        match = PSP_FILE_NAME.search(self.name)
+        if match is None:
+            raise ValueError(f"Cannot parse date and version from file name: {self.name}")
+        year, month, day, version = map(int, match.groups())
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'start_date', datetime(year, month, day, tzinfo=timezone.utc))
 
 
 class PspFileParser:
     @staticmethod
-    def get_dictionary_of_files(url: str, file_infos_by_mode=None, top_level_link=None) -> Dict[str, List[PspFileInfo]]:
+    def get_dictionary_of_files(url: str, file_infos_by_mode=None, top_level_link=None,
+                                max_requests_per_host: int = DEFAULT_MAX_REQUESTS_PER_HOST) -> Dict[str, List[PspFileInfo]]:
+        return asyncio.run(PspFileParser.get_dictionary_of_files_async(url, file_infos_by_mode, top_level_link,
+                                                                       max_requests_per_host))
+
+    @staticmethod
+    async def get_dictionary_of_files_async(url: str, file_infos_by_mode=None, top_level_link=None,
+                                            max_requests_per_host: int = DEFAULT_MAX_REQUESTS_PER_HOST) \
+            -> Dict[str, List[PspFileInfo]]:
         if file_infos_by_mode is None:
             file_infos_by_mode = {}
-        list_of_links = PspFileParser._get_all_links(url)
-        for link, element_text in list_of_links:
-            if element_text.strip().endswith('.cdf'):
-                year = url.split('/')[-2]
-                PspFileParser._add_cdf_link_to_file_infos(element_text, link, file_infos_by_mode, top_level_link, year)
-            else:
-                file_infos_by_mode = PspFileParser.get_dictionary_of_files(url + link, file_infos_by_mode,
-                                                                           link if top_level_link is None else top_level_link)
+        [crawled_file_infos] = await PspFileParser.get_dictionaries_of_files_async([(url, top_level_link)],
+                                                                                   max_requests_per_host)
+        for mode, file_infos in crawled_file_infos.items():
+            file_infos_by_mode.setdefault(mode, []).extend(file_infos)
         return file_infos_by_mode
 
     @staticmethod
-    def _add_cdf_link_to_file_infos(element_text: str, link: str, file_infos_by_mode: Dict[str, List[PspFileInfo]],
+    def get_dictionaries_of_files(directories: List[Tuple[str, Optional[str]]],
+                                  max_requests_per_host: int = DEFAULT_MAX_REQUESTS_PER_HOST) \
+            -> List[Dict[str, List[PspFileInfo]]]:
+        """
+        get_dictionary_of_files for each (url, top_level_link) of directories, crawled together in one event loop
+        so that they share the client's connections and the per-host request limit.
+        """
+        return asyncio.run(PspFileParser.get_dictionaries_of_files_async(directories, max_requests_per_host))
+
+    @staticmethod
+    async def get_dictionaries_of_files_async(directories: List[Tuple[str, Optional[str]]],
+                                              max_requests_per_host: int = DEFAULT_MAX_REQUESTS_PER_HOST) \
+            -> List[Dict[str, List[PspFileInfo]]]:
+        limiter = HostConcurrencyLimiter(max_requests_per_host)
+        async with httpx.AsyncClient() as client:
+            crawls = await asyncio.gather(*(PspFileParser._crawl_directory(client, limiter, url, top_level_link)
+                                            for url, top_level_link in directories))
+        if listing_cache is not None:
+            listing_cache.save()
+        dictionaries = []
+        for cdf_links in crawls:
+            file_infos_by_mode = {}
+            for mode, entry, year in cdf_links:
+                PspFileParser._add_cdf_link_to_file_infos(entry, file_infos_by_mode, mode, year)
+            dictionaries.append(file_infos_by_mode)
+        return dictionaries
+
+    @staticmethod
+    async def _crawl_directory(client: httpx.AsyncClient, limiter: HostConcurrencyLimiter, url: str,
+                               top_level_link) -> List[Tuple[str, ListingEntry, str]]:
+        entries = await PspFileParser._get_listing_entries(client, limiter, url)
+
+        year = url.split('/')[-2]
+        cdf_links_per_entry = []
+        subdirectory_crawls = []
+        for entry in entries:
+            if entry.text.strip().endswith('.cdf'):
+                cdf_links_per_entry.append([(top_level_link, entry, year)])
+            else:
+                cdf_links_per_entry.append(None)
+                subdirectory_crawls.append(PspFileParser._crawl_directory(
+                    client, limiter, url + entry.href, entry.href if top_level_link is None else top_level_link))
+
+        subdirectory_results = iter(await asyncio.gather(*subdirectory_crawls))
+        cdf_links = []
+        for entry in cdf_links_per_entry:
+            cdf_links.extend(entry if entry is not None else next(subdirectory_results))
+        return cdf_links
+
+    @staticmethod
+    def _add_cdf_link_to_file_infos(entry: ListingEntry, file_infos_by_mode: Dict[str, List[PspFileInfo]],
                                     top_level_link: str, year: str):
-        new_link = PspFileInfo(link, element_text, year)
+        try:
+            new_link = PspFileInfo(entry.href, entry.text, year, entry.last_modified, entry.size)
+        except ValueError as e:
+            print("skipping file with unexpected name:", entry.href, e)
+            return
         if top_level_link in file_infos_by_mode:
             file_infos_by_mode[top_level_link].append(new_link)
         else:
             file_infos_by_mode[top_level_link] = [new_link]
 
     @staticmethod
-    def _get_all_links(url: str) -> List[Tuple[str, str]]:
-        response = get_with_retry(url)
-        text = response.text
-        list_of_links = []
+    async def _get_listing_entries(client: httpx.AsyncClient, limiter: HostConcurrencyLimiter,
+                                   url: str) -> List[ListingEntry]:
+        with metrics.stage(LISTING_CRAWL) as observation:
+            headers = listing_cache.conditional_headers(url) if listing_cache is not None else None
+            response, entries = await async_stream_with_retry(client, url, PspFileParser._read_listing_entries,
+                                                              headers=headers, limiter=limiter)
+            observation.bytes = response.num_bytes_downloaded
+            if listing_cache is not None:
+                cached_entries = listing_cache.get_entries(url, response)
+                if cached_entries is not None:
+                    return cached_entries
+            if entries is None:
+                entries = list(extract_listing_entries([response.text]))
+            if listing_cache is not None:
+                listing_cache.put(url, response, entries)
+            return entries
 
-        soup = BeautifulSoup(text, 'html.parser')
-        for a_tag in soup.select("td > a")[1:]:
-            link = a_tag.get('href')
-            element_text = a_tag.text
-            list_of_links.append((link, element_text))
-        return list_of_links
+    @staticmethod
+    async def _read_listing_entries(response: httpx.Response) -> List[ListingEntry]:
+        return await read_listing_entries(response.aiter_text())
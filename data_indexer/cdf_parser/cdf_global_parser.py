@@ -2,7 +2,9 @@ from dataclasses import dataclass
 from datetime import date, datetime
 from pathlib import Path
 
-from spacepy import pycdf
+from data_indexer.lazy_import import LazyModule
+
+pycdf = LazyModule('spacepy.pycdf')
 
 
 @dataclass
@@ -16,7 +18,7 @@ class CdfGlobalInfo:
 class CdfGlobalParser:
 
     @staticmethod
-    def parse_global_variables_from_cdf(cdf: pycdf.CDF) -> CdfGlobalInfo:
+    def parse_global_variables_from_cdf(cdf: 'pycdf.CDF') -> CdfGlobalInfo:
         logical_source = str(cdf.attrs['Logical_source'])
         logical_source_description = str(cdf.attrs['Logical_source_description'])
         data_version = str(cdf.attrs['Data_version'])
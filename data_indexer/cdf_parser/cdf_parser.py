@@ -1,13 +1,25 @@
+import ctypes
 import os
+import shutil
+import stat
 import tempfile
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import List
-
-from spacepy import pycdf
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
 
 from data_indexer.cdf_parser.cdf_global_parser import CdfGlobalInfo, CdfGlobalParser
 from data_indexer.cdf_parser.cdf_variable_parser import CdfVariableParser, CdfVariableInfo
 from data_indexer.cdf_parser.variable_selector.variable_selector import VariableSelector
+from data_indexer.lazy_import import LazyModule
+from data_indexer.metrics import metrics, PARSE, TEMP_WRITE
+
+pycdf = LazyModule('spacepy.pycdf')
+
+PROC_FD_DIRECTORY = '/proc/self/fd'
+TMPFS_DIRECTORY = '/dev/shm'
+
+_validation_lock = threading.Lock()
 
 
 @dataclass
@@ -16,14 +28,95 @@ class CdfFileInfo:
     variable_infos: List[CdfVariableInfo]
 
 
+@dataclass
+class SparseCdf:
+    size: int
+    segments: List[Tuple[int, bytes]]
+
+    def write_to(self, file: BinaryIO):
+        file.truncate(self.size)
+        for offset, data in self.segments:
+            file.seek(offset)
+            file.write(data)
+
+
+CdfSource = Union[bytes, bytearray, memoryview, BinaryIO, SparseCdf]
+
+
 class CdfParser:
 
     @staticmethod
-    def parse_cdf_bytes(cdf_bytes: bytes, variable_selector: type[VariableSelector]) -> CdfFileInfo:
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            with open(os.path.join(tmp_dir, 'temp.cdf'), 'wb') as tmp_file:
-                tmp_file.write(cdf_bytes)
-            with pycdf.CDF(tmp_file.name) as cdf:
+    def parse_cdf(cdf_source: CdfSource, variable_selector: type[VariableSelector]) -> CdfFileInfo:
+        with _cdf_path(cdf_source) as cdf_path, metrics.stage(PARSE):
+            with _open_cdf(cdf_path, validate=not isinstance(cdf_source, SparseCdf)) as cdf:
                 cdf_global_info = CdfGlobalParser.parse_global_variables_from_cdf(cdf)
                 cdf_variable_info = CdfVariableParser.parse_info_from_cdf(cdf, variable_selector)
                 return CdfFileInfo(cdf_global_info, cdf_variable_info)
+
+    @staticmethod
+    def parse_cdf_bytes(cdf_bytes: Union[bytes, bytearray, memoryview],
+                        variable_selector: type[VariableSelector]) -> CdfFileInfo:
+        return CdfParser.parse_cdf(cdf_bytes, variable_selector)
+
+    @staticmethod
+    def parse_sparse_cdf(sparse_cdf: SparseCdf, variable_selector: type[VariableSelector]) -> CdfFileInfo:
+        return CdfParser.parse_cdf(sparse_cdf, variable_selector)
+
+
+def _open_cdf(cdf_path: str, validate: bool) -> 'pycdf.CDF':
+    if validate:
+        return pycdf.CDF(cdf_path)
+    # A SparseCdf leaves out the variable index and data records, which the CDF library's file validation checks when
+    # the file is opened but which reading metadata never touches. The setting is process-wide, hence the lock.
+    library = pycdf.lib._library
+    library.CDFgetValidate.restype = ctypes.c_long
+    with _validation_lock:
+        validation_was_on = library.CDFgetValidate() != 0
+        library.CDFsetValidate(ctypes.c_long(pycdf.const.VALIDATEFILEoff.value))
+        try:
+            return pycdf.CDF(cdf_path)
+        finally:
+            if validation_was_on:
+                library.CDFsetValidate(ctypes.c_long(pycdf.const.VALIDATEFILEon.value))
+
+
+@contextmanager
+def _cdf_path(cdf_source: CdfSource) -> Iterator[str]:
+    file_descriptor = _regular_file_descriptor(cdf_source)
+    if file_descriptor is not None and os.path.isdir(PROC_FD_DIRECTORY):
+        cdf_source.flush()
+        yield f"{PROC_FD_DIRECTORY}/{file_descriptor}"
+        return
+
+    with _scratch_file() as (scratch_file, scratch_path):
+        with metrics.stage(TEMP_WRITE) as observation:
+            if isinstance(cdf_source, SparseCdf):
+                cdf_source.write_to(scratch_file)
+            elif isinstance(cdf_source, (bytes, bytearray, memoryview)):
+                scratch_file.write(cdf_source)
+            else:
+                shutil.copyfileobj(cdf_source, scratch_file)
+            scratch_file.flush()
+            observation.bytes = os.fstat(scratch_file.fileno()).st_size
+        yield scratch_path
+
+
+@contextmanager
+def _scratch_file() -> Iterator[Tuple[BinaryIO, str]]:
+    if hasattr(os, 'memfd_create') and os.path.isdir(PROC_FD_DIRECTORY):
+        with os.fdopen(os.memfd_create('cdf', os.MFD_CLOEXEC), 'w+b') as memory_file:
+            yield memory_file, f"{PROC_FD_DIRECTORY}/{memory_file.fileno()}"
+    else:
+        scratch_directory = TMPFS_DIRECTORY if os.path.isdir(TMPFS_DIRECTORY) else None
+        with tempfile.NamedTemporaryFile(suffix='.cdf', dir=scratch_directory) as scratch_file:
+            yield scratch_file, scratch_file.name
+
+
+def _regular_file_descriptor(cdf_source: CdfSource) -> Optional[int]:
+    if isinstance(cdf_source, (bytes, bytearray, memoryview, SparseCdf)):
+        return None
+    try:
+        file_descriptor = cdf_source.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+    return file_descriptor if stat.S_ISREG(os.fstat(file_descriptor).st_mode) else None
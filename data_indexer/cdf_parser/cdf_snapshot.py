@@ -0,0 +1,78 @@
+from typing import Dict, Iterator, Tuple
+
+from data_indexer.lazy_import import LazyModule
+
+pycdf = LazyModule('spacepy.pycdf')
+
+_MISSING = object()
+
+
+class AttributeSnapshot:
+    """Read-only view of a pycdf attribute list that reads each attribute, or its absence, from the CDF only once."""
+
+    def __init__(self, attributes):
+        self._attributes = attributes
+        self._values = {}
+
+    def _value(self, name: str):
+        if name not in self._values:
+            try:
+                self._values[name] = self._attributes[name]
+            except KeyError:
+                self._values[name] = _MISSING
+        return self._values[name]
+
+    def __getitem__(self, name: str):
+        value = self._value(name)
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name: str) -> bool:
+        return self._value(name) is not _MISSING
+
+    def get(self, name: str, default=None):
+        value = self._value(name)
+        return default if value is _MISSING else value
+
+
+class VariableSnapshot:
+    def __init__(self, var: 'pycdf.Var'):
+        self._var = var
+        self.attrs = AttributeSnapshot(var.attrs)
+        self._shape = None
+        self._type = None
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        if self._shape is None:
+            self._shape = self._var.shape
+        return self._shape
+
+    def type(self) -> int:
+        if self._type is None:
+            self._type = self._var.type()
+        return self._type
+
+
+class CdfSnapshot:
+    """
+    Wraps an open CDF for the variable selectors so that every variable attribute they check, including the units
+    of the DEPEND_0 variable shared by most variables, crosses into the CDF library once per file.
+    """
+
+    def __init__(self, cdf: 'pycdf.CDF'):
+        self._cdf = cdf
+        self.attrs = AttributeSnapshot(cdf.attrs)
+        self._variables: Dict[str, VariableSnapshot] = {}
+
+    def __getitem__(self, name: str) -> VariableSnapshot:
+        if name not in self._variables:
+            self._variables[name] = VariableSnapshot(self._cdf[name])
+        return self._variables[name]
+
+    def items(self) -> Iterator[Tuple[str, VariableSnapshot]]:
+        for name, var in self._cdf.items():
+            if name not in self._variables:
+                self._variables[name] = VariableSnapshot(var)
+            yield name, self._variables[name]
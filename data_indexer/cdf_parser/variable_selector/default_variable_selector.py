@@ -1,6 +1,8 @@
-from spacepy import pycdf
-
+from data_indexer.cdf_parser.cdf_snapshot import CdfSnapshot, VariableSnapshot
 from data_indexer.cdf_parser.variable_selector.variable_selector import VariableSelector
+from data_indexer.lazy_import import LazyModule
+
+pycdf = LazyModule('spacepy.pycdf')
 
 
 class DefaultVariableSelector(VariableSelector):
@@ -11,7 +13,7 @@ class DefaultVariableSelector(VariableSelector):
     }
 
     @classmethod
-    def should_include(cls, var: pycdf.Var, cdf: pycdf.CDF) -> bool:
+    def should_include(cls, var: VariableSnapshot, cdf: CdfSnapshot) -> bool:
         if var.attrs["VAR_TYPE"] != "data":
             return False
         display_type = var.attrs.get('DISPLAY_TYPE')
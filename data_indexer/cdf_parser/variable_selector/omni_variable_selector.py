@@ -1,5 +1,4 @@
-from spacepy import pycdf
-
+from data_indexer.cdf_parser.cdf_snapshot import CdfSnapshot, VariableSnapshot
 from data_indexer.cdf_parser.variable_selector.variable_selector import VariableSelector
 
 
@@ -9,7 +8,7 @@ class OmniVariableSelector(VariableSelector):
     }
 
     @classmethod
-    def should_include(cls, var: pycdf.Var, cdf: pycdf.CDF) -> bool:
+    def should_include(cls, var: VariableSnapshot, cdf: CdfSnapshot) -> bool:
         display_type = var.attrs.get('DISPLAY_TYPE')
         has_correct_shape = len(var.shape) in cls.acceptable_dimensions.get(display_type,[])
         zscale = var.attrs['SCALETYP'] if 'SCALETYP' in var.attrs else 'linear'
@@ -1,10 +1,10 @@
 from abc import ABC, abstractmethod
 
-from spacepy import pycdf
+from data_indexer.cdf_parser.cdf_snapshot import CdfSnapshot, VariableSnapshot
 
 
 class VariableSelector(ABC):
     @classmethod
     @abstractmethod
-    def should_include(cls, var: pycdf.Var, cdf: pycdf.CDF) -> bool:
+    def should_include(cls, var: VariableSnapshot, cdf: CdfSnapshot) -> bool:
         raise NotImplementedError
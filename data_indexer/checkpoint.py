@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from data_indexer.metrics import metrics
+
+CHECKPOINT_SUFFIX = '.json'
+
+
+class CheckpointStore:
+    """
+    Saves the index entry of each data product as soon as it completes, one file per product, so that a run that dies
+    partway can be resumed without downloading and parsing the finished products again. Entries are keyed by the URLs
+    of all of a product's files, so a product whose files changed since the checkpoint is indexed again.
+    The store is picklable and used from the worker processes directly.
+    """
+
+    def __init__(self, directory: str, resume: bool = False):
+        self.directory = Path(directory)
+        if not resume:
+            self.remove_all()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def run(self, key: str, task: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """Returns the saved entry for key, or runs the task and saves its entry (None for a skipped product)."""
+        path = self.directory / f"{key}{CHECKPOINT_SUFFIX}"
+        try:
+            with open(path) as checkpoint_file:
+                entry = json.load(checkpoint_file)
+        except (FileNotFoundError, ValueError):
+            pass
+        else:
+            metrics.increment("data_products_resumed")
+            return entry
+
+        entry = task()
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f'.{path.name}.', suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w') as checkpoint_file:
+            json.dump(entry, checkpoint_file)
+        os.replace(temp_path, path)
+        return entry
+
+    def remove_all(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def checkpoint_key(file_urls: Iterable[str]) -> str:
+    return hashlib.sha256("\n".join(file_urls).encode()).hexdigest()
+
+
+def run_with_checkpoint(checkpoints: Optional[CheckpointStore], key: str,
+                        task: Callable[[], Optional[dict]]) -> Optional[dict]:
+    return task() if checkpoints is None else checkpoints.run(key, task)
@@ -0,0 +1,114 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+COMPACT_INDEX_VERSION = "v3"
+
+FILE_NAME_DATE_AND_VERSION = re.compile(r'_(\d{8})([^/_]*)_v(\d+)\.cdf$')
+ONE_DAY = timedelta(days=1)
+
+
+def encode_index_entry(entry: Dict) -> Dict:
+    return {**entry, "file_timeranges": encode_file_timeranges(entry["file_timeranges"])}
+
+
+def decode_index_entry(entry: Dict) -> Dict:
+    return {**entry, "file_timeranges": decode_file_timeranges(entry["file_timeranges"])}
+
+
+def decode_index(entries: List[Dict]) -> List[Dict]:
+    return [decode_index_entry(entry) for entry in entries]
+
+
+def encode_file_timeranges(file_timeranges: List[Dict]) -> Dict:
+    """
+    Encodes expanded file timeranges as {"url_templates": [...], "files": [...]}. Each item in "files" is either
+    [template index, first date, day count, versions] for a run of consecutive daily files, where versions is a single
+    string when the whole run shares it, or [template index, date, version, start time, end time] for any other file.
+    """
+    url_templates = []
+    files = []
+    for file_timerange in file_timeranges:
+        url_template, date, version = _url_template(file_timerange["url"])
+        if url_template not in url_templates:
+            url_templates.append(url_template)
+        template_index = url_templates.index(url_template)
+
+        if not _is_daily_file(date, file_timerange):
+            files.append([template_index, date, version, file_timerange["start_time"], file_timerange["end_time"]])
+        elif files and _extends_daily_run(files[-1], template_index, date):
+            files[-1][2] += 1
+            files[-1][3].append(version)
+        else:
+            files.append([template_index, date, 1, [version]])
+
+    for item in files:
+        if len(item) == 4 and len(set(item[3])) == 1:
+            item[3] = item[3][0]
+    return {"url_templates": url_templates, "files": files}
+
+
+def decode_file_timeranges(encoded: Dict) -> List[Dict]:
+    url_templates = encoded["url_templates"]
+    file_timeranges = []
+    for item in encoded["files"]:
+        if len(item) == 5:
+            template_index, date, version, start_time, end_time = item
+            file_timeranges.append({"start_time": start_time, "end_time": end_time,
+                                    "url": _expand(url_templates[template_index], date, version)})
+            continue
+
+        template_index, first_date, day_count, versions = item
+        for day in range(day_count):
+            date = _date_after(first_date, day)
+            version = versions if isinstance(versions, str) else versions[day]
+            start_time = datetime.strptime(date, '%Y%m%d').replace(tzinfo=timezone.utc)
+            file_timeranges.append({"start_time": start_time.isoformat(),
+                                    "end_time": (start_time + ONE_DAY).isoformat(),
+                                    "url": _expand(url_templates[template_index], date, version)})
+    return file_timeranges
+
+
+def _url_template(url: str) -> Tuple[str, str, str]:
+    match = FILE_NAME_DATE_AND_VERSION.search(url)
+    if match is None:
+        return url, "", ""
+
+    date, qualifier, version = match.groups()
+    try:
+        datetime.strptime(date, '%Y%m%d')
+    except ValueError:
+        return url, "", ""
+    directory = url[:match.start()]
+    for dated_directory, placeholder in ((f"/{date[:4]}/{date[4:6]}/", "/{year}/{month}/"),
+                                         (f"/{date[:4]}/", "/{year}/")):
+        position = directory.rfind(dated_directory)
+        if position != -1:
+            directory = directory[:position] + placeholder + directory[position + len(dated_directory):]
+            break
+    url_template = directory + "_{date}" + qualifier + "_v{version}.cdf"
+
+    if _expand(url_template, date, version) != url:
+        return url, "", ""
+    return url_template, date, version
+
+
+def _expand(url_template: str, date: str, version: str) -> str:
+    return url_template.replace("{year}", date[:4]).replace("{month}", date[4:6]) \
+        .replace("{date}", date).replace("{version}", version)
+
+
+def _is_daily_file(date: str, file_timerange: Dict) -> bool:
+    if not date:
+        return False
+    start_time = datetime.strptime(date, '%Y%m%d').replace(tzinfo=timezone.utc)
+    return file_timerange["start_time"] == start_time.isoformat() \
+        and file_timerange["end_time"] == (start_time + ONE_DAY).isoformat()
+
+
+def _extends_daily_run(item: List, template_index: int, date: str) -> bool:
+    return len(item) == 4 and item[0] == template_index and _date_after(item[1], item[2]) == date
+
+
+def _date_after(date: str, days: int) -> str:
+    return (datetime.strptime(date, '%Y%m%d') + timedelta(days=days)).strftime('%Y%m%d')
@@ -2,7 +2,7 @@ from datetime import date, timedelta,datetime
 from typing import List
 
 from data_indexer.cdf_downloader.psp_file_parser import PspFileInfo
-from data_indexer.file_cadence.file_cadence import FileCadence
+from data_indexer.file_cadence.file_cadence import FileCadence, to_datetime64, from_datetime64
 
 
 def get_date_ranges(sorted_dates: List[date]) -> List[List[date]]:
@@ -30,11 +30,9 @@ def get_contiguous_ranges(ranges: list[tuple[datetime,datetime]]) -> list[tuple[
     contiguous_ranges.append((contiguous_start,contiguous_end))
     return contiguous_ranges
 
-def get_date_ranges_from_file_infos(file_infos: list[PspFileInfo], cadence: type[FileCadence]) -> list[list[date]]:
-    parsed_dates = [datetime.strptime(file_info.name.split('_')[-2], '%Y%m%d') for file_info in
-                    file_infos]
-    date_ranges = []
-    for date in parsed_dates:
-        date_ranges.append(cadence.get_file_time_range(date))
+def get_date_ranges_from_file_infos(file_infos: list[PspFileInfo], cadence: FileCadence) -> list[list[date]]:
+    start_times, end_times = cadence.get_file_time_ranges(to_datetime64([file_info.start_date
+                                                                         for file_info in file_infos]))
+    date_ranges = list(zip(from_datetime64(start_times, tzinfo=None), from_datetime64(end_times, tzinfo=None)))
 
     return [[start.date(), end.date()-timedelta(days=1)] for start, end in get_contiguous_ranges(date_ranges)]
@@ -0,0 +1,238 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+import httpx
+
+from data_indexer.spooled_download import Download, SpooledFile
+
+INDEX_FILENAME = 'index.json'
+INDEX_LOCK_FILENAME = 'index.lock'
+# index changes are merged into index.json in batches, and once more when the run or worker process ends
+FLUSH_EVERY_CHANGES = 256
+STORED_RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'Content-Range', 'Content-Type')
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    range: str
+    status_code: int
+    headers: Dict[str, str]
+    size: int
+    last_used: float
+    # digest of a whole-file body, worked out while it was spooled
+    sha256: Optional[str] = None
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self.headers.get('ETag')
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self.headers.get('Last-Modified')
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bytes_from_cache: int = 0
+    bytes_downloaded: int = 0
+
+    def __str__(self):
+        return (f"download cache: {self.hits} hits, {self.misses} misses, {self.evictions} evictions, "
+                f"{self.bytes_from_cache} bytes reused, {self.bytes_downloaded} bytes downloaded")
+
+
+class DownloadCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries: OrderedDict[str, CacheEntry] = self._load_index()
+        self._total_bytes = sum(entry.size for entry in self._entries.values())
+        self._changed_keys = set()
+        self._removed_keys = set()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, url: str, headers: Optional[dict],
+            send: Callable[[Optional[dict]], httpx.Response]) -> httpx.Response:
+        return self._get(url, headers, lambda request_headers: Download(send(request_headers)), False).response
+
+    def get_download(self, url: str, headers: Optional[dict],
+                     send: Callable[[Optional[dict]], Download]) -> Download:
+        """get for a send that spools whole-file bodies; a cached whole file is handed out as the file on disk."""
+        return self._get(url, headers, send, True)
+
+    def _get(self, url: str, headers: Optional[dict], send: Callable[[Optional[dict]], Download],
+             open_whole_files: bool) -> Download:
+        request_range = (headers or {}).get('Range', '')
+        key = _cache_key(url, request_range)
+        with self._lock:
+            entry = self._entries.get(key)
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            request_headers.update(conditional_request_headers(entry.etag, entry.last_modified))
+
+        download = send(request_headers or None)
+
+        if download.response.status_code == 304 and entry is not None:
+            cached = self._read_blob(key, entry, download.response.request,
+                                     open_whole_files and entry.status_code == 200)
+            if cached is not None:
+                with self._lock:
+                    self.stats.hits += 1
+                    self.stats.bytes_from_cache += cached.size
+                    self._touch(key)
+                return cached
+            download = send(headers)
+
+        with self._lock:
+            self.stats.misses += 1
+            self.stats.bytes_downloaded += download.size
+        if download.response.status_code in (200, 206):
+            self._store(key, url, request_range, download)
+        return download
+
+    def _store(self, key: str, url: str, request_range: str, download: Download):
+        response = download.response
+        stored_headers = {name: response.headers[name] for name in STORED_RESPONSE_HEADERS if name in response.headers}
+        if 'ETag' not in stored_headers and 'Last-Modified' not in stored_headers:
+            return
+        if download.size > self.max_bytes:
+            return
+
+        atomic_write(self.directory / key, download.file.file if download.file is not None else response.content)
+        with self._lock:
+            self._remove_entry(key)
+            self._entries[key] = CacheEntry(url, request_range, response.status_code, stored_headers,
+                                            download.size, time.time(),
+                                            download.file.sha256 if download.file is not None else None)
+            self._total_bytes += download.size
+            self._changed_keys.add(key)
+            self._evict()
+            self._flush_if_due()
+
+    def _touch(self, key: str):
+        self._entries[key].last_used = time.time()
+        self._entries.move_to_end(key)
+        self._changed_keys.add(key)
+        self._flush_if_due()
+
+    def _remove_entry(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry.size
+
+    def _evict(self):
+        # entries are kept in least recently used order
+        while self._total_bytes > self.max_bytes:
+            key, entry = self._entries.popitem(last=False)
+            (self.directory / key).unlink(missing_ok=True)
+            self._total_bytes -= entry.size
+            self._changed_keys.discard(key)
+            self._removed_keys.add(key)
+            self.stats.evictions += 1
+
+    def _read_blob(self, key: str, entry: CacheEntry, request: httpx.Request, open_file: bool) -> Optional[Download]:
+        # a blob that is gone or no longer the size it was stored with, say after another process replaced it, is
+        # dropped and downloaded again
+        path = self.directory / key
+        try:
+            if open_file:
+                cached_file = SpooledFile.open(str(path), entry.sha256)
+                if cached_file.size == entry.size:
+                    return Download(httpx.Response(entry.status_code, headers=entry.headers, request=request),
+                                    cached_file)
+                cached_file.close()
+            else:
+                content = path.read_bytes()
+                if len(content) == entry.size:
+                    return Download(httpx.Response(entry.status_code, headers=entry.headers, content=content,
+                                                   request=request))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._remove_entry(key)
+            self._changed_keys.discard(key)
+            self._removed_keys.add(key)
+        return None
+
+    def _load_index(self) -> OrderedDict:
+        try:
+            with open(self.directory / INDEX_FILENAME) as index_file:
+                stored_entries = json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return OrderedDict()
+        entries = sorted(((key, CacheEntry(**entry)) for key, entry in stored_entries.items()),
+                         key=lambda item: item[1].last_used)
+        return OrderedDict(entries)
+
+    def flush(self):
+        """Merges this process's changes into the index on disk. Call it once the run or worker process is done."""
+        with self._lock:
+            self._flush()
+
+    def _flush_if_due(self):
+        if len(self._changed_keys) + len(self._removed_keys) >= FLUSH_EVERY_CHANGES:
+            self._flush()
+
+    def _flush(self):
+        if not self._changed_keys and not self._removed_keys:
+            return
+        # Worker processes share the cache directory, so merge our changes into the index on disk under a file lock
+        with open(self.directory / INDEX_LOCK_FILENAME, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = self._load_index()
+            for key in self._removed_keys:
+                entries.pop(key, None)
+            for key in self._changed_keys:
+                entries[key] = self._entries[key]
+            self._entries = OrderedDict(sorted(entries.items(), key=lambda item: item[1].last_used))
+            self._total_bytes = sum(entry.size for entry in self._entries.values())
+            self._evict()
+            self._changed_keys.clear()
+            self._removed_keys.clear()
+            index = {key: asdict(entry) for key, entry in self._entries.items()}
+            atomic_write(self.directory / INDEX_FILENAME, json.dumps(index).encode())
+
+
+def conditional_request_headers(etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+    headers = {}
+    if etag is not None:
+        headers['If-None-Match'] = etag
+    if last_modified is not None:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def _cache_key(url: str, request_range: str) -> str:
+    return hashlib.sha256(f"{url}\n{request_range}".encode()).hexdigest()
+
+
+def atomic_write(path: Path, content: Union[bytes, BinaryIO]):
+    file_descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(file_descriptor, 'wb') as temp_file:
+        if isinstance(content, bytes):
+            temp_file.write(content)
+        else:
+            shutil.copyfileobj(content, temp_file)
+            content.seek(0)
+    os.replace(temp_path, path)
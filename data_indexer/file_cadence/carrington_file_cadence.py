@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta, timezone
 
-from data_indexer.file_cadence.file_cadence import FileCadence
+import numpy as np
+
+from data_indexer.file_cadence.file_cadence import FileCadence, to_datetime64
 
 CARRINGTON_ROTATION_IN_DAYS = timedelta(days=27.2753)
 FIRST_CARRINGTON_ROTATION = datetime(1853, 10, 13, 13, 17, 19, 679992, tzinfo=timezone.utc)
@@ -21,3 +23,14 @@ class CarringtonFileCadence(FileCadence):
         t_within_carrington = t + timedelta(days=1)
         cr = (t_within_carrington - FIRST_CARRINGTON_ROTATION) // CARRINGTON_ROTATION_IN_DAYS
         return self.get_file_time_range_with_cr(cr)
+
+    def get_file_time_ranges_with_cr(self, crs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        first_rotation = to_datetime64([FIRST_CARRINGTON_ROTATION])[0]
+        rotation = np.timedelta64(CARRINGTON_ROTATION_IN_DAYS)
+        crs = np.asarray(crs, dtype=np.int64)
+        return first_rotation + crs * rotation, first_rotation + (crs + 1) * rotation
+
+    def get_file_time_ranges(self, times: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        first_rotation = to_datetime64([FIRST_CARRINGTON_ROTATION])[0]
+        crs = (times + np.timedelta64(1, 'D') - first_rotation) // np.timedelta64(CARRINGTON_ROTATION_IN_DAYS)
+        return self.get_file_time_ranges_with_cr(crs)
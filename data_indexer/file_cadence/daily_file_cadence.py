@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 
-from data_indexer.file_cadence.file_cadence import FileCadence
+import numpy as np
+
+from data_indexer.file_cadence.file_cadence import FileCadence, DATETIME64
 
 
 class DailyFileCadence(FileCadence):
@@ -12,3 +14,7 @@ class DailyFileCadence(FileCadence):
         start_time = t.replace(hour=0, minute=0, second=0, microsecond=0)
         end_time = start_time + timedelta(days=1)
         return start_time, end_time
+
+    def get_file_time_ranges(self, times: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        start_times = times.astype('datetime64[D]').astype(DATETIME64)
+        return start_times, start_times + np.timedelta64(1, 'D')
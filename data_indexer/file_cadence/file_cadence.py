@@ -1,5 +1,19 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+import numpy as np
+
+DATETIME64 = 'datetime64[us]'
+
+
+def to_datetime64(times: Sequence[datetime]) -> np.ndarray:
+    return np.array([t.astimezone(timezone.utc).replace(tzinfo=None) if t.tzinfo is not None else t for t in times],
+                    dtype=DATETIME64)
+
+
+def from_datetime64(times: np.ndarray, tzinfo: Optional[timezone] = timezone.utc) -> list[datetime]:
+    return [t.replace(tzinfo=tzinfo) for t in times.astype(DATETIME64).tolist()]
 
 
 class FileCadence(ABC):
@@ -12,3 +26,9 @@ class FileCadence(ABC):
     @abstractmethod
     def get_file_time_range(self, t: datetime) -> tuple[datetime,datetime]:
         pass
+
+    def get_file_time_ranges(self, times: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Batch form of get_file_time_range for an array of UTC datetime64 values."""
+        time_ranges = [self.get_file_time_range(t) for t in from_datetime64(times, tzinfo=None)]
+        return (to_datetime64([start for start, _ in time_ranges]),
+                to_datetime64([end for _, end in time_ranges]))
@@ -1,5 +1,7 @@
 from datetime import timedelta, datetime
 
+import numpy as np
+
 from data_indexer.file_cadence.file_cadence import FileCadence
 
 
@@ -28,3 +30,6 @@ class MapFileCadence(FileCadence):
 
     def get_file_time_range(self, t: datetime) -> tuple[datetime, datetime]:
         return t, t + self._duration
+
+    def get_file_time_ranges(self, times: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return times, times + np.timedelta64(self._duration)
@@ -1,6 +1,8 @@
 from datetime import datetime
 
-from data_indexer.file_cadence.file_cadence import FileCadence
+import numpy as np
+
+from data_indexer.file_cadence.file_cadence import FileCadence, DATETIME64
 
 
 class SixMonthFileCadence(FileCadence):
@@ -16,3 +18,9 @@ class SixMonthFileCadence(FileCadence):
             start_time = t.replace(month=7, day=1, hour=0, minute=0, second=0, microsecond=0)
             end_time = start_time.replace(year=start_time.year + 1, month=1)
         return start_time, end_time
+
+    def get_file_time_ranges(self, times: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        months = times.astype('datetime64[M]')
+        years = times.astype('datetime64[Y]').astype('datetime64[M]')
+        start_months = years + np.where(months - years < np.timedelta64(6, 'M'), 0, 6).astype('timedelta64[M]')
+        return start_months.astype(DATETIME64), (start_months + np.timedelta64(6, 'M')).astype(DATETIME64)
@@ -1,15 +1,429 @@
+import asyncio
+import math
+import multiprocessing
+import multiprocessing.util
+import random
+import threading
 import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
 
 import httpx
 
+from data_indexer.download_cache import DownloadCache
+from data_indexer.metrics import metrics, DOWNLOAD
+from data_indexer import spooled_download
+from data_indexer.spooled_download import Download, SpoolSettings, spool
+
 http_client = httpx.Client()
+download_cache: Optional[DownloadCache] = None
+
+INITIAL_REQUESTS_PER_HOST = 4
+DEFAULT_MAX_REQUESTS_PER_HOST = 16
+MAX_ADAPTIVE_REQUESTS_PER_HOST = 64
+# a response slower than this multiple of the host's typical latency counts as congestion
+LATENCY_SPIKE_RATIO = 3.0
+LATENCY_SAMPLES_BEFORE_SPIKE_DETECTION = 5
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY_SECONDS = 120
+
+
+class RetryLater(Exception):
+    def __init__(self, url: str, retry_after: Optional[float] = None, reason: str = ""):
+        super().__init__(url, retry_after, reason)
+        self.url = url
+        self.retry_after = retry_after
+        self.reason = reason
+        self.response: Optional[httpx.Response] = None
+
+    def __str__(self):
+        retry_after = f", retry after {self.retry_after:g}s" if self.retry_after is not None else ""
+        return f"{self.url} is temporarily unavailable ({self.reason}){retry_after}"
+
+    def __reduce__(self):
+        return RetryLater, (self.url, self.retry_after, self.reason)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_DELAY_SECONDS)
+    return min(2 ** attempt * (0.5 + random.random() / 2), MAX_RETRY_DELAY_SECONDS)
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    AIMD concurrency window for one host: grows by about one request per window of fast responses while the window is in
+    use, and halves on 429/5xx, transport errors or latency spikes, at most once per round of requests.
+    """
+
+    def __init__(self, initial: int = INITIAL_REQUESTS_PER_HOST, maximum: int = MAX_ADAPTIVE_REQUESTS_PER_HOST):
+        self.maximum = maximum
+        self.window = float(min(initial, maximum))
+        self.typical_latency: Optional[float] = None
+        self.latency_samples = 0
+        self._last_decrease = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def allowed_requests(self) -> int:
+        return int(self.window)
+
+    def on_success(self, started_at: float, latency: float, window_full: bool):
+        with self._lock:
+            if self.latency_samples >= LATENCY_SAMPLES_BEFORE_SPIKE_DETECTION \
+                    and latency > LATENCY_SPIKE_RATIO * self.typical_latency:
+                self._decrease(started_at)
+                return
+            self.latency_samples += 1
+            if self.typical_latency is None:
+                self.typical_latency = latency
+            else:
+                self.typical_latency += (latency - self.typical_latency) / 10
+            if window_full:
+                self.window = min(self.maximum, self.window + 1 / self.window)
+
+    def on_overload(self, started_at: float):
+        with self._lock:
+            self._decrease(started_at)
+
+    def _decrease(self, started_at: float):
+        # requests sent before the last decrease were sent at the old rate, so they must not shrink the window again
+        if started_at < self._last_decrease:
+            return
+        self.window = max(1.0, self.window / 2)
+        self._last_decrease = time.monotonic()
+
+
+class InFlightRequests:
+    """Requests in flight to one host from the threads of this process, with the condition they wait on for a slot."""
+
+    def __init__(self, lock: threading.Lock):
+        self.condition = threading.Condition(lock)
+        self.count = 0
+
+
+class SharedInFlightRequests:
+    """InFlightRequests counted across the worker processes sharing a SharedAdaptiveConcurrencyLimit."""
+
+    def __init__(self):
+        self.condition = multiprocessing.Condition()
+        self._count = multiprocessing.RawValue('i', 0)
+
+    @property
+    def count(self) -> int:
+        return self._count.value
+
+    @count.setter
+    def count(self, value: int):
+        self._count.value = value
+
+
+class SharedAdaptiveConcurrencyLimit(AdaptiveConcurrencyLimit):
+    """
+    AdaptiveConcurrencyLimit whose window, and count of requests in flight, live in shared memory, so that the worker
+    processes started after it was created share one window for the host instead of each growing its own.
+    """
+
+    def __init__(self, initial: int = INITIAL_REQUESTS_PER_HOST, maximum: int = MAX_ADAPTIVE_REQUESTS_PER_HOST):
+        # window, typical latency (NaN until the first sample), latency samples, time of the last decrease
+        self._state = multiprocessing.RawArray('d', [0.0, math.nan, 0.0, float('-inf')])
+        self.in_flight = SharedInFlightRequests()
+        super().__init__(initial, maximum)
+        self._lock = multiprocessing.Lock()
+
+    window = property(lambda self: self._state[0], lambda self, value: self._state.__setitem__(0, value))
+    typical_latency = property(lambda self: None if math.isnan(self._state[1]) else self._state[1],
+                               lambda self, value: self._state.__setitem__(1, math.nan if value is None else value))
+    latency_samples = property(lambda self: int(self._state[2]),
+                               lambda self, value: self._state.__setitem__(2, value))
+    _last_decrease = property(lambda self: self._state[3], lambda self, value: self._state.__setitem__(3, value))
+
+
+class HostLimits(defaultdict):
+    def __init__(self, shared: Optional[dict] = None):
+        super().__init__(AdaptiveConcurrencyLimit)
+        if shared is not None:
+            self.update(shared)
+
+    def share(self, url: str) -> SharedAdaptiveConcurrencyLimit:
+        """Moves the url's host to a window shared with the worker processes started afterwards."""
+        host = urlsplit(url).netloc
+        if not isinstance(self.get(host), SharedAdaptiveConcurrencyLimit):
+            self[host] = SharedAdaptiveConcurrencyLimit()
+        return self[host]
+
+    @property
+    def shared(self) -> dict:
+        return {host: limit for host, limit in self.items() if isinstance(limit, SharedAdaptiveConcurrencyLimit)}
+
+
+class HostConcurrencyLimiter:
+    """Limits concurrent requests per host within one event loop to the host's adaptive window."""
+
+    def __init__(self, max_requests_per_host: int = DEFAULT_MAX_REQUESTS_PER_HOST,
+                 limits: Optional[HostLimits] = None):
+        if max_requests_per_host < 1:
+            raise ValueError(f"max_requests_per_host must be at least 1, got {max_requests_per_host}")
+        self.max_requests_per_host = max_requests_per_host
+        self.limits = limits if limits is not None else host_limits
+        self._in_flight = defaultdict(int)
+        self._conditions = defaultdict(asyncio.Condition)
+
+    def allowed_requests(self, host: str) -> int:
+        return min(self.limits[host].allowed_requests, self.max_requests_per_host)
+
+    @asynccontextmanager
+    async def limit(self, url: str):
+        host = urlsplit(url).netloc
+        condition = self._conditions[host]
+        async with condition:
+            await condition.wait_for(lambda: self._in_flight[host] < self.allowed_requests(host))
+            self._in_flight[host] += 1
+            window_full = self._in_flight[host] >= self.allowed_requests(host)
+        try:
+            with _record_outcome(self.limits[host], window_full) as timing:
+                yield timing
+        finally:
+            async with condition:
+                self._in_flight[host] -= 1
+                condition.notify_all()
+
+
+class BlockingHostConcurrencyLimiter(HostConcurrencyLimiter):
+    """
+    Thread-based counterpart of HostConcurrencyLimiter for the synchronous client. Requests to a host with a shared
+    window are counted and wait across all the worker processes sharing it.
+    """
+
+    def __init__(self, max_requests_per_host: int = DEFAULT_MAX_REQUESTS_PER_HOST,
+                 limits: Optional[HostLimits] = None):
+        super().__init__(max_requests_per_host, limits)
+        self._lock = threading.Lock()
+        self._in_flight = defaultdict(lambda: InFlightRequests(self._lock))
 
-def get_with_retry(url, times: int = 5) -> httpx.Response:
+    def _in_flight_requests(self, host: str):
+        adaptive_limit = self.limits[host]
+        if isinstance(adaptive_limit, SharedAdaptiveConcurrencyLimit):
+            return adaptive_limit.in_flight
+        return self._in_flight[host]
+
+    @contextmanager
+    def limit(self, url: str):
+        host = urlsplit(url).netloc
+        in_flight = self._in_flight_requests(host)
+        with in_flight.condition:
+            in_flight.condition.wait_for(lambda: in_flight.count < self.allowed_requests(host))
+            in_flight.count += 1
+            window_full = in_flight.count >= self.allowed_requests(host)
+        try:
+            with _record_outcome(self.limits[host], window_full) as timing:
+                yield timing
+        finally:
+            with in_flight.condition:
+                in_flight.count -= 1
+                in_flight.condition.notify_all()
+
+
+class RequestTiming:
+    """
+    Times a request for its host's window. A streamed response should mark when its headers arrived, so that the
+    time spent reading a large body is not taken for a latency spike.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._headers_received_at: Optional[float] = None
+
+    def headers_received(self):
+        if self._headers_received_at is None:
+            self._headers_received_at = time.monotonic()
+
+    @property
+    def latency(self) -> float:
+        finished_at = self._headers_received_at if self._headers_received_at is not None else time.monotonic()
+        return finished_at - self.started_at
+
+
+@contextmanager
+def _record_outcome(adaptive_limit: AdaptiveConcurrencyLimit, window_full: bool):
+    timing = RequestTiming()
+    try:
+        yield timing
+    except (RetryLater, httpx.TransportError):
+        adaptive_limit.on_overload(timing.started_at)
+        raise
+    adaptive_limit.on_success(timing.started_at, timing.latency, window_full)
+
+
+def enable_download_cache(directory: str, max_bytes: int) -> DownloadCache:
+    global download_cache
+    download_cache = DownloadCache(directory, max_bytes)
+    return download_cache
+
+
+def share_host_limit(url: str) -> SharedAdaptiveConcurrencyLimit:
+    """Call before starting worker processes, so that their requests to the url's host share one window."""
+    return host_limits.share(url)
+
+
+def worker_process_settings() -> Tuple[Optional[Tuple[str, int]], SpoolSettings, dict]:
+    download_cache_settings = None
+    if download_cache is not None:
+        download_cache_settings = str(download_cache.directory), download_cache.max_bytes
+    # the in-flight ceiling and the shared windows are shared memory, which worker processes can only receive as
+    # they start
+    return download_cache_settings, spooled_download.current_spool_settings(), host_limits.shared
+
+
+def initialize_worker_process(download_cache_settings: Optional[Tuple[str, int]],
+                              spool_settings: Optional[SpoolSettings] = None,
+                              shared_host_limits: Optional[dict] = None):
+    global http_client, download_cache, host_limits, request_limiter
+    # Connections pooled by the parent must not be shared with forked workers
+    http_client = httpx.Client()
+    host_limits = HostLimits(shared_host_limits)
+    request_limiter = BlockingHostConcurrencyLimiter()
+    download_cache = DownloadCache(*download_cache_settings) if download_cache_settings is not None else None
+    if download_cache is not None:
+        # worker processes exit through multiprocessing, which runs this before the process ends
+        multiprocessing.util.Finalize(download_cache, download_cache.flush, exitpriority=10)
+    if spool_settings is not None:
+        spooled_download.spool_settings = spool_settings
+
+
+def get_with_retry(url, times: int = 5, headers: dict = None) -> httpx.Response:
+    """
+    Sleeps between attempts, so it is only for one-off requests with nothing else to run meanwhile. Downloads made
+    while indexing use get_once or download_once and leave their retries to a RetryScheduler.
+    """
+    for i in range(times):
+        try:
+            return get_once(url, headers)
+        except RetryLater as e:
+            if i == times - 1:
+                if e.response is not None:
+                    return e.response
+                raise e.__cause__ or e
+            print(f"Retrying get for url {url}; retry number {i+1}; exception {e.__cause__ or e}")
+            time.sleep(retry_delay(i, e.retry_after))
+
+
+def get_once(url, headers: dict = None) -> httpx.Response:
+    with metrics.stage(DOWNLOAD) as observation:
+        if download_cache is not None:
+            response = download_cache.get(url, headers, lambda request_headers: _get_once(url, request_headers))
+        else:
+            response = _get_once(url, headers)
+        observation.bytes = len(response.content)
+    return response
+
+
+def _get_once(url, headers: Optional[dict]) -> httpx.Response:
+    with request_limiter.limit(url):
+        try:
+            response = http_client.get(url, headers=headers, follow_redirects=True)
+        except httpx.TransportError as e:
+            raise RetryLater(url, reason=str(e) or type(e).__name__) from e
+        _raise_if_retryable(url, response)
+    return response
+
+
+def download_once(url, headers: dict = None) -> Download:
+    """
+    get_once for a request that may return a whole file: a 200 body is streamed into a SpooledFile rather than read
+    into memory. Other bodies, such as 206 ranges and errors, are read as usual.
+    """
+    with metrics.stage(DOWNLOAD) as observation:
+        if download_cache is not None:
+            download = download_cache.get_download(url, headers,
+                                                   lambda request_headers: _download_once(url, request_headers))
+        else:
+            download = _download_once(url, headers)
+        observation.bytes = download.size
+    return download
+
+
+def _download_once(url, headers: Optional[dict]) -> Download:
+    with request_limiter.limit(url) as timing:
+        try:
+            with http_client.stream('GET', url, headers=headers, follow_redirects=True) as response:
+                timing.headers_received()
+                if response.status_code != 200:
+                    response.read()
+                    _raise_if_retryable(url, response)
+                    return Download(response)
+                return Download(response, spool(response.iter_bytes(), _decoded_content_length(response)))
+        except httpx.TransportError as e:
+            raise RetryLater(url, reason=str(e) or type(e).__name__) from e
+
+
+def _decoded_content_length(response: httpx.Response) -> Optional[int]:
+    # Content-Length counts the encoded bytes, so the size of a compressed body is only known once it is decoded
+    if 'Content-Encoding' in response.headers:
+        return None
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+T = TypeVar('T')
+
+
+async def async_stream_with_retry(client: httpx.AsyncClient, url, read_body: Callable[[httpx.Response], Awaitable[T]],
+                                  times: int = 5, headers: dict = None,
+                                  limiter: Optional[HostConcurrencyLimiter] = None) \
+        -> Tuple[httpx.Response, Optional[T]]:
+    """
+    async_get_with_retry for a body that is consumed while it downloads: read_body is given a 200 response whose body
+    is still streaming and its result is returned alongside the response. Other bodies, such as 304s and errors, are
+    read as usual and come back with None.
+    """
     for i in range(times):
         try:
-            return http_client.get(url, follow_redirects=True)
-        except Exception as e:
+            async with limiter.limit(url) if limiter is not None else nullcontext() as timing:
+                async with client.stream('GET', url, headers=headers, follow_redirects=True) as response:
+                    if timing is not None:
+                        timing.headers_received()
+                    if response.status_code != 200:
+                        await response.aread()
+                        _raise_if_retryable(url, response)
+                        return response, None
+                    return response, await read_body(response)
+        except (httpx.TransportError, RetryLater) as e:
             if i == times - 1:
+                if isinstance(e, RetryLater):
+                    return e.response, None
                 raise e
             print(f"Retrying get for url {url}; retry number {i+1}; exception {e}")
-            time.sleep(2**i)
+            await asyncio.sleep(retry_delay(i, e.retry_after if isinstance(e, RetryLater) else None))
+
+
+def _raise_if_retryable(url, response: httpx.Response):
+    if response.status_code in RETRYABLE_STATUS_CODES:
+        retry_later = RetryLater(url, parse_retry_after(response.headers.get('Retry-After')),
+                                 f"HTTP {response.status_code}")
+        retry_later.response = response
+        raise retry_later
+
+
+# learned per-host windows, shared by the directory crawler and the synchronous downloads of this process
+host_limits = HostLimits()
+request_limiter = BlockingHostConcurrencyLimiter()
@@ -1,20 +1,33 @@
+import itertools
 import re
-import urllib
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime, timedelta, timezone
-from functools import reduce
-from typing import TypeVar
+from datetime import datetime
+from functools import lru_cache, partial
+from operator import itemgetter
+from typing import Iterator, List, Optional, Tuple
 
 import imap_data_access
+import numpy as np
 
-from data_indexer.cdf_parser.cdf_parser import CdfParser
+from data_indexer.cdf_downloader.cdf_metadata_downloader import CdfMetadataDownloader
+from data_indexer.checkpoint import CheckpointStore, checkpoint_key, run_with_checkpoint
+from data_indexer.cdf_parser.cdf_parser import CdfParser, CdfFileInfo
 from data_indexer.cdf_parser.variable_selector.default_variable_selector import DefaultVariableSelector
 from data_indexer.file_cadence.carrington_file_cadence import CarringtonFileCadence
 from data_indexer.file_cadence.daily_file_cadence import DailyFileCadence
+from data_indexer.file_cadence.file_cadence import FileCadence, DATETIME64, from_datetime64
 from data_indexer.file_cadence.map_file_cadence import MapFileCadence, BadFileNameException
-from data_indexer.http_client import get_with_retry
+from data_indexer.http_client import initialize_worker_process, share_host_limit, worker_process_settings
+from data_indexer.incremental_index import PreviousIndex
+from data_indexer.lazy_import import LazyModule
+from data_indexer.metrics import metrics, MetricsSnapshot, IMAP_QUERY
+from data_indexer.retry_scheduler import RetryScheduler, ExecutorTask
+from data_indexer.sharding import Shard, UNSHARDED, run_at_unsharded_position
 from data_indexer.utils import get_index_entry, DataProductSource
+from data_indexer.version_selection import select_latest_versions
+
+pycdf = LazyModule('spacepy.pycdf')
 
 
 @dataclass(frozen=True)
@@ -24,13 +37,6 @@ class Dataproduct:
     descriptor: str
 
 
-T = TypeVar('T')
-
-
-def flatten(l: list[list[T]]) -> list[T]:
-    return reduce(list.__add__, l, [])
-
-
 imap_dev_server = "https://api.dev.imap-mission.com/"
 
 instrument_names = {
@@ -46,79 +52,190 @@ instrument_names = {
     "ultra": "IMAP-Ultra",
 }
 
+UUID = re.compile("[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}")
+DATA_PRODUCT_FIELDS = itemgetter("instrument", "data_level", "descriptor")
 
-def get_metadata_index() -> list[dict]:
-    uuid_matcher = re.compile("[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}")
-
-    l3_data_level_variants = ["l3", "l3a", "l3b", "l3c", "l3d", "l3e"]
-    l3_cdf_metadatas = flatten([imap_data_access.query(data_level=data_level) for data_level in l3_data_level_variants])
+l3_data_level_variants = ["l3", "l3a", "l3b", "l3c", "l3d", "l3e"]
+DEFAULT_MAX_CONCURRENT_QUERIES = 6
 
-    data_products = defaultdict(dict)
-    for cdf_metadata in l3_cdf_metadatas:
-        descriptor = cdf_metadata["descriptor"]
-        if "log" in descriptor or re.search(uuid_matcher, descriptor) is not None:
-            continue
 
-        data_product = Dataproduct(cdf_metadata["instrument"], cdf_metadata["data_level"], descriptor)
-        if data_product in data_products and cdf_metadata['start_date'] in data_products[data_product]:
-            if cdf_metadata['version'] > data_products[data_product][cdf_metadata["start_date"]]['version']:
-                data_products[data_product][cdf_metadata["start_date"]] = cdf_metadata
-        else:
-            data_products[data_product][cdf_metadata['start_date']] = cdf_metadata
+def get_metadata_index(previous_index: Optional[PreviousIndex] = None, max_workers: int = 1,
+                       shard: Shard = UNSHARDED, checkpoints: Optional[CheckpointStore] = None) -> list[dict]:
+    return list(iter_metadata_index(previous_index, max_workers, shard, checkpoints))
 
-    index = []
-    for data_product, dates_to_metadata in data_products.items():
-        sorted_file_metadata = sorted(dates_to_metadata.values(), key=lambda x: x['start_date'])
-        description_source_file = sorted_file_metadata[-1]['file_path']
 
-        source_file_url = imap_dev_server + "download/" + description_source_file
-        cdf = get_with_retry(source_file_url).content
-        try:
-            cdf_file_info = CdfParser.parse_cdf_bytes(cdf, DefaultVariableSelector)
+def iter_metadata_index(previous_index: Optional[PreviousIndex] = None, max_workers: int = 1,
+                        shard: Shard = UNSHARDED, checkpoints: Optional[CheckpointStore] = None,
+                        split_queries_by_instrument: bool = False) -> Iterator[dict]:
+    indexed_file_metadata = (cdf_metadata for cdf_metadata in query_l3_file_metadata(split_queries_by_instrument)
+                             if _is_indexed_data_product(*DATA_PRODUCT_FIELDS(cdf_metadata)))
+    data_products = select_latest_versions(indexed_file_metadata, group_of=DATA_PRODUCT_FIELDS,
+                                           start_date_of=itemgetter('start_date'), version_of=_version_number)
 
-        except Exception as e:
-            print("failed to parse CDF, skipping:", description_source_file, e)
+    product_work = []
+    checkpoint_keys = []
+    unsharded_positions = []
+    # every shard selects all data products, so that it knows where an unsharded run would write its own
+    for position, (data_product_fields, sorted_file_metadata) in enumerate(data_products.items()):
+        if not shard.owns("/".join(data_product_fields)):
             continue
+        unsharded_positions.append([position] if shard != UNSHARDED else None)
+        data_product = Dataproduct(*data_product_fields)
+        source_file_url = imap_dev_server + "download/" + sorted_file_metadata[-1]['file_path']
+        previous_cdf_file_info = previous_index.get_cdf_file_info(source_file_url) if previous_index is not None else None
+        product_work.append((data_product, sorted_file_metadata, previous_cdf_file_info))
+        checkpoint_keys.append(checkpoint_key(imap_dev_server + "download/" + file_metadata['file_path']
+                                              for file_metadata in sorted_file_metadata))
+
+    retry_scheduler = RetryScheduler()
+    if max_workers > 1 and len(product_work) > 1:
+        if any(previous_cdf_file_info is None for *_, previous_cdf_file_info in product_work):
+            # load the CDF library once before forking instead of once in every worker
+            pycdf.load()
+        # with a window per worker, a 429 or 503 would only slow down the worker that received it
+        share_host_limit(imap_dev_server)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=initialize_worker_process,
+                                 initargs=worker_process_settings()) as executor:
+            tasks = [(work[1][-1]['file_path'],
+                      ExecutorTask(executor, _get_index_entry_in_worker, checkpoints, key, unsharded_position, *work))
+                     for work, key, unsharded_position in zip(product_work, checkpoint_keys, unsharded_positions)]
+            for index_entry, worker_metrics in retry_scheduler.run(tasks):
+                metrics.merge(worker_metrics)
+                yield from _count_index_entry(index_entry)
+    else:
+        tasks = ((work[1][-1]['file_path'], partial(_get_index_entry, checkpoints, key, unsharded_position, *work))
+                 for work, key, unsharded_position in zip(product_work, checkpoint_keys, unsharded_positions))
+        for index_entry in retry_scheduler.run(tasks):
+            yield from _count_index_entry(index_entry)
+    metrics.increment("data_products_failed", len(retry_scheduler.failures))
+    retry_scheduler.print_summary()
+
+
+@lru_cache(maxsize=None)
+def _is_indexed_data_product(instrument: str, data_level: str, descriptor: str) -> bool:
+    return "log" not in descriptor and UUID.search(descriptor) is None
+
+
+def _version_number(cdf_metadata: dict) -> int:
+    return int(cdf_metadata['version'].lstrip('v'))
+
+
+def _get_index_entry(checkpoints: Optional[CheckpointStore], key: str, unsharded_position: Optional[List[int]],
+                     *work) -> Optional[dict]:
+    get_index_entry = partial(run_with_checkpoint, checkpoints, key, partial(get_index_entry_for_data_product, *work))
+    return run_at_unsharded_position(unsharded_position, get_index_entry)
+
+
+def _get_index_entry_in_worker(checkpoints: Optional[CheckpointStore], key: str, unsharded_position: Optional[List[int]],
+                               *work) -> Tuple[Optional[dict], MetricsSnapshot]:
+    return _get_index_entry(checkpoints, key, unsharded_position, *work), metrics.collect()
+
+
+def _count_index_entry(index_entry: Optional[dict]) -> Iterator[dict]:
+    if index_entry is None:
+        metrics.increment("data_products_skipped")
+        return
+    metrics.increment("data_products_indexed")
+    yield index_entry
+
+
+def query_l3_file_metadata(split_by_instrument: bool = False,
+                           max_concurrent_queries: int = DEFAULT_MAX_CONCURRENT_QUERIES) -> Iterator[dict]:
+    """
+    Runs the queries concurrently but yields their results in submission order, so that the data products, and so the
+    index, come out in the same order on every run. A query's results are yielded as soon as it and every query
+    submitted before it have finished.
+    """
+    instruments = sorted(imap_data_access.VALID_INSTRUMENTS) if split_by_instrument else [None]
+    queries = []
+    for data_level, instrument in itertools.product(l3_data_level_variants, instruments):
+        query_parameters = {"instrument": instrument, "data_level": data_level}
+        queries.append({key: value for key, value in query_parameters.items() if value is not None})
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_queries) as executor:
+        for query_results in executor.map(_query, queries):
+            yield from query_results
+
+
+def _query(query_parameters: dict) -> list[dict]:
+    with metrics.stage(IMAP_QUERY):
+        return imap_data_access.query(**query_parameters)
+
+
+def get_index_entry_for_data_product(data_product: Dataproduct, sorted_file_metadata: list[dict],
+                                     cdf_file_info: Optional[CdfFileInfo] = None) -> Optional[dict]:
+    description_source_file = sorted_file_metadata[-1]['file_path']
+    if cdf_file_info is None:
+        with CdfMetadataDownloader.get_cdf_metadata(imap_dev_server + "download/" + description_source_file) as cdf:
+            try:
+                cdf_file_info = CdfParser.parse_cdf(cdf, DefaultVariableSelector)
+
+            except Exception as e:
+                print("failed to parse CDF, skipping:", description_source_file, e)
+                return None
+
+    try:
+        data_product_sources = []
+        start_times, end_times, cadence = determine_start_and_end_for_files(sorted_file_metadata)
+        for file_metadata, start_time, end_time in zip(sorted_file_metadata, start_times, end_times):
+            url = imap_dev_server + "download/" + file_metadata['file_path']
+            data_product_sources.append(DataProductSource(url=url,
+                                                          start_time=start_time,
+                                                          end_time=end_time))
+
+        return get_index_entry(cdf_file_info=cdf_file_info,
+                               file_timeranges=data_product_sources,
+                               instrument=instrument_names.get(data_product.instrument, data_product.instrument),
+                               mission="IMAP",
+                               file_cadence=cadence)
+    except BadFileNameException as e:
+        print("failed to parse CDF, skipping:", description_source_file, e)
+        return None
 
-        try:
-            data_product_sources = []
-            for file_metadata in sorted_file_metadata:
-                url = imap_dev_server + "download/" + file_metadata['file_path']
-                start_time, end_time, cadence = determine_start_and_end_for_file(file_metadata)
-                data_product_sources.append(DataProductSource(url=url,
-                                                              start_time=start_time,
-                                                              end_time=end_time))
-
-            index.append(get_index_entry(cdf_file_info=cdf_file_info,
-                                         file_timeranges=data_product_sources,
-                                         instrument=instrument_names.get(data_product.instrument, data_product.instrument),
-                                         mission="IMAP",
-                                         file_cadence=cadence))
-        except BadFileNameException as e:
-            print("failed to parse CDF, skipping:", description_source_file, e)
-            continue
 
-    return index
+def determine_start_and_end_for_file(file_metadata):
+    start_times, end_times, cadence = determine_start_and_end_for_files([file_metadata])
+    return start_times[0], end_times[0], cadence
+
+
+def determine_start_and_end_for_files(files_metadata: list[dict]) -> tuple[list[datetime], list[datetime], FileCadence]:
+    cadence = None
+    files_by_cadence = {}
+    for file_number, file_metadata in enumerate(files_metadata):
+        cadence = determine_cadence(file_metadata)
+        uses_cr = file_metadata.get('cr') is not None
+        files_by_cadence.setdefault((cadence.name, uses_cr), (cadence, []))[1].append(file_number)
+
+    start_times = np.empty(len(files_metadata), dtype=DATETIME64)
+    end_times = np.empty(len(files_metadata), dtype=DATETIME64)
+    for (_, uses_cr), (group_cadence, file_numbers) in files_by_cadence.items():
+        if uses_cr:
+            group_start_times, group_end_times = group_cadence.get_file_time_ranges_with_cr(
+                [files_metadata[file_number]['cr'] for file_number in file_numbers])
+        else:
+            group_start_times, group_end_times = group_cadence.get_file_time_ranges(
+                np.array([_iso_date(files_metadata[file_number]['start_date']) for file_number in file_numbers],
+                         dtype='datetime64[D]').astype(DATETIME64))
+        start_times[file_numbers] = group_start_times
+        end_times[file_numbers] = group_end_times
 
+    return from_datetime64(start_times), from_datetime64(end_times), cadence
 
-def determine_start_and_end_for_file(file_metadata):
-    start_time = (datetime.strptime(file_metadata['start_date'], '%Y%m%d')).replace(tzinfo=timezone.utc)
 
+def _iso_date(yyyymmdd: str) -> str:
+    return f"{yyyymmdd[:4]}-{yyyymmdd[4:6]}-{yyyymmdd[6:]}"
+
+
+def determine_cadence(file_metadata) -> FileCadence:
     match file_metadata:
         case {'cr': cr} if cr is not None:
-            cadence = CarringtonFileCadence()
-            start_time, end_time = cadence.get_file_time_range_with_cr(cr)
+            return CarringtonFileCadence()
         case {'instrument': "glows", 'data_level': 'l3b' | 'l3c'}:
-            cadence = CarringtonFileCadence()
-            start_time, end_time = cadence.get_file_time_range(start_time)
+            return CarringtonFileCadence()
         case {'instrument': 'hi' | 'lo' | 'ultra'}:
-            cadence = MapFileCadence(file_metadata['descriptor'].split('-')[-1])
-            start_time, end_time = cadence.get_file_time_range(start_time)
+            return MapFileCadence(file_metadata['descriptor'].split('-')[-1])
         case _:
-            cadence = DailyFileCadence()
-            start_time, end_time = cadence.get_file_time_range(start_time)
-
-    return start_time, end_time, cadence
+            return DailyFileCadence()
 
 
 if __name__ == '__main__':
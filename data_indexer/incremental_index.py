@@ -0,0 +1,35 @@
+from datetime import date
+from typing import Dict, List, Optional
+
+from data_indexer.cdf_parser.cdf_global_parser import CdfGlobalInfo
+from data_indexer.cdf_parser.cdf_parser import CdfFileInfo
+from data_indexer.cdf_parser.cdf_variable_parser import CdfVariableInfo
+from data_indexer.index_file import read_index
+
+
+class PreviousIndex:
+    def __init__(self, entries: List[Dict]):
+        self._entries_by_source_url = {entry["file_timeranges"][-1]["url"]: entry
+                                       for entry in entries if entry["file_timeranges"]}
+        self.reused_count = 0
+
+    @classmethod
+    def load(cls, path: str) -> 'PreviousIndex':
+        try:
+            return cls(read_index(path))
+        except FileNotFoundError:
+            return cls([])
+
+    def get_cdf_file_info(self, source_url: str, requires_data_version: bool = False) -> Optional[CdfFileInfo]:
+        entry = self._entries_by_source_url.get(source_url)
+        if entry is None or (requires_data_version and entry["version"] == ""):
+            return None
+
+        generation_date = None if entry["generation_date"] == "None" else date.fromisoformat(entry["generation_date"])
+        global_info = CdfGlobalInfo(logical_source=entry["logical_source"],
+                                    logical_source_description=entry["logical_source_description"],
+                                    data_version=entry["version"],
+                                    generation_date=generation_date)
+        variable_infos = [CdfVariableInfo(**variable) for variable in entry["variables"]]
+        self.reused_count += 1
+        return CdfFileInfo(global_info, variable_infos)
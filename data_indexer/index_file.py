@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+import textwrap
+from pathlib import Path
+from typing import Dict, List
+
+from data_indexer.metrics import metrics, SERIALIZATION
+
+INDEX_FORMATS = ('json', 'ndjson')
+INDEX_FILE_MODE = 0o644
+
+
+class IndexWriter:
+    def __init__(self, path: str, index_format: str = 'json'):
+        if index_format not in INDEX_FORMATS:
+            raise ValueError(f"Unknown index format {index_format}, expected one of {', '.join(INDEX_FORMATS)}")
+        self.path = Path(path)
+        self.index_format = index_format
+        self.entry_count = 0
+        self._file = None
+        self._temp_path = None
+
+    def __enter__(self) -> 'IndexWriter':
+        file_descriptor, self._temp_path = tempfile.mkstemp(dir=self.path.parent,
+                                                            prefix=f'.{self.path.name}.', suffix='.tmp')
+        os.chmod(self._temp_path, INDEX_FILE_MODE)
+        self._file = os.fdopen(file_descriptor, 'w')
+        return self
+
+    def write(self, entry: Dict):
+        with metrics.stage(SERIALIZATION) as observation:
+            if self.index_format == 'ndjson':
+                serialized_entry = json.dumps(entry) + '\n'
+            else:
+                # Matches json.dump(entries, indent=2) so the committed index files diff cleanly
+                serialized_entry = ('[\n' if self.entry_count == 0 else ',\n') \
+                    + textwrap.indent(json.dumps(entry, indent=2), '  ')
+            self._file.write(serialized_entry)
+            self._file.flush()
+            observation.bytes = len(serialized_entry)
+        self.entry_count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None and self.index_format == 'json':
+                self._file.write('\n]' if self.entry_count else '[]')
+            self._file.close()
+        except BaseException:
+            os.unlink(self._temp_path)
+            raise
+
+        if exc_type is None:
+            os.replace(self._temp_path, self.path)
+        else:
+            os.unlink(self._temp_path)
+
+
+def read_index(path: str) -> List[Dict]:
+    with open(path) as index_file:
+        if path.endswith('.ndjson'):
+            return [json.loads(line) for line in index_file if line.strip()]
+        return json.load(index_file)
@@ -0,0 +1,97 @@
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from data_indexer.compact_index import decode_index_entry
+from data_indexer.index_file import read_index
+from data_indexer.utils import DataProductSource, get_data_product_sources, require_timezone
+
+LOADED_INDEX_CACHE_SIZE = 8
+
+
+class ProductTimeline:
+    """
+    A data product's files sorted by start time, over a tree holding the latest end time under each node. A query
+    bisects the start times and then descends only into the subtrees that end after the queried time, so it visits
+    O((k + 1) log n) nodes for k matching files, however long the longest file is.
+    """
+
+    def __init__(self, data_product_sources: List[DataProductSource]):
+        self.sources = sorted(data_product_sources, key=lambda source: source.start_time)
+        self._starts = [source.start_time for source in self.sources]
+        self._leaf_count = 1 << (len(self.sources) - 1).bit_length() if self.sources else 1
+        self._max_ends: List[Optional[datetime]] = [None] * (2 * self._leaf_count)
+        for position, source in enumerate(self.sources):
+            self._max_ends[self._leaf_count + position] = source.end_time
+        for node in range(self._leaf_count - 1, 0, -1):
+            left, right = self._max_ends[2 * node], self._max_ends[2 * node + 1]
+            self._max_ends[node] = left if right is None else max(left, right)
+
+    def overlapping(self, start_time: datetime, end_time: datetime) -> List[DataProductSource]:
+        upper = bisect_left(self._starts, require_timezone(end_time))
+        return self._ending_after(require_timezone(start_time), upper)
+
+    def at(self, t: datetime) -> List[DataProductSource]:
+        return self._ending_after(t, bisect_right(self._starts, require_timezone(t)))
+
+    def _ending_after(self, t: datetime, upper: int) -> List[DataProductSource]:
+        """The files among the first upper ones that end after t, in start time order."""
+        found = []
+        nodes = [(1, 0, self._leaf_count)]
+        while nodes:
+            node, lower, higher = nodes.pop()
+            if lower >= upper or self._max_ends[node] is None or self._max_ends[node] <= t:
+                continue
+            if higher - lower == 1:
+                found.append(self.sources[lower])
+                continue
+            middle = (lower + higher) // 2
+            nodes.append((2 * node + 1, middle, higher))
+            nodes.append((2 * node, lower, middle))
+        return found
+
+    def gaps(self, start_time: datetime, end_time: datetime) -> List[Tuple[datetime, datetime]]:
+        gaps = []
+        covered_until = start_time
+        for source in self.overlapping(start_time, end_time):
+            if source.start_time > covered_until:
+                gaps.append((covered_until, source.start_time))
+            covered_until = max(covered_until, source.end_time)
+        if covered_until < end_time:
+            gaps.append((covered_until, end_time))
+        return gaps
+
+
+class IndexQuery:
+    def __init__(self, entries: List[Dict]):
+        self.entries_by_logical_source = {}
+        self._timelines = {}
+        for entry in entries:
+            if isinstance(entry["file_timeranges"], dict):
+                entry = decode_index_entry(entry)
+            self.entries_by_logical_source[entry["logical_source"]] = entry
+            self._timelines[entry["logical_source"]] = ProductTimeline(get_data_product_sources(entry))
+
+    @property
+    def logical_sources(self) -> List[str]:
+        return list(self._timelines)
+
+    def overlapping(self, logical_source: str, start_time: datetime, end_time: datetime) -> List[DataProductSource]:
+        return self._timelines[logical_source].overlapping(start_time, end_time)
+
+    def at(self, logical_source: str, t: datetime) -> List[DataProductSource]:
+        return self._timelines[logical_source].at(t)
+
+    def gaps(self, logical_source: str, start_time: datetime, end_time: datetime) -> List[Tuple[datetime, datetime]]:
+        return self._timelines[logical_source].gaps(start_time, end_time)
+
+
+def open_index(path: str) -> IndexQuery:
+    return _load_index(os.path.abspath(path), os.stat(path).st_mtime_ns)
+
+
+@lru_cache(maxsize=LOADED_INDEX_CACHE_SIZE)
+def _load_index(path: str, _modification_time: int) -> IndexQuery:
+    return IndexQuery(read_index(path))
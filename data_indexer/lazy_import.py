@@ -0,0 +1,21 @@
+import importlib
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    Stands in for a module until one of its attributes is used, so that a heavy dependency such as spacepy.pycdf,
+    which loads the CDF shared library and matplotlib, is only imported by runs that need it.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def load(self) -> ModuleType:
+        return importlib.import_module(self._name)
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.load(), attribute)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r}>"
@@ -0,0 +1,175 @@
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+LISTING_CRAWL = "listing_crawl"
+IMAP_QUERY = "imap_query"
+DOWNLOAD = "download"
+TEMP_WRITE = "temp_write"
+PARSE = "parse"
+VARIABLE_SELECTION = "variable_selection"
+SERIALIZATION = "serialization"
+
+HISTOGRAM_BUCKETS_SECONDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+PROMETHEUS_PREFIX = "cava_indexer"
+REPORT_FILE_MODE = 0o644
+
+
+@dataclass
+class StageMetrics:
+    count: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    bytes: int = 0
+    bucket_counts: List[int] = field(default_factory=lambda: [0] * len(HISTOGRAM_BUCKETS_SECONDS))
+
+    def observe(self, seconds: float, byte_count: int = 0, error: bool = False):
+        self.count += 1
+        self.errors += error
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes += byte_count
+        self.bucket_counts[next(i for i, bound in enumerate(HISTOGRAM_BUCKETS_SECONDS) if seconds <= bound)] += 1
+
+    def merge(self, other: 'StageMetrics'):
+        self.count += other.count
+        self.errors += other.errors
+        self.seconds += other.seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.bytes += other.bytes
+        self.bucket_counts = [mine + theirs for mine, theirs in zip(self.bucket_counts, other.bucket_counts)]
+
+
+@dataclass
+class MetricsSnapshot:
+    stages: Dict[str, StageMetrics] = field(default_factory=dict)
+    counters: Dict[str, int] = field(default_factory=dict)
+
+
+class StageObservation:
+    def __init__(self):
+        self.bytes = 0
+
+
+class Metrics:
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.started_at = time.time()
+        self._snapshot = MetricsSnapshot()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageObservation]:
+        observation = StageObservation()
+        started_at = time.perf_counter()
+        try:
+            yield observation
+        except BaseException:
+            self.observe(name, time.perf_counter() - started_at, observation.bytes, error=True)
+            raise
+        self.observe(name, time.perf_counter() - started_at, observation.bytes)
+
+    def observe(self, name: str, seconds: float, byte_count: int = 0, error: bool = False):
+        with self._lock:
+            self._snapshot.stages.setdefault(name, StageMetrics()).observe(seconds, byte_count, error)
+
+    def increment(self, name: str, amount: int = 1):
+        with self._lock:
+            self._snapshot.counters[name] = self._snapshot.counters.get(name, 0) + amount
+
+    def collect(self) -> MetricsSnapshot:
+        """Returns the metrics recorded so far and starts over, so worker processes can hand them to the parent."""
+        with self._lock:
+            snapshot, self._snapshot = self._snapshot, MetricsSnapshot()
+        return snapshot
+
+    def merge(self, snapshot: MetricsSnapshot):
+        with self._lock:
+            for name, stage_metrics in snapshot.stages.items():
+                self._snapshot.stages.setdefault(name, StageMetrics()).merge(stage_metrics)
+            for name, amount in snapshot.counters.items():
+                self._snapshot.counters[name] = self._snapshot.counters.get(name, 0) + amount
+
+    def report(self) -> Dict:
+        with self._lock:
+            stages = {name: {**asdict(stage_metrics),
+                             "mean_seconds": stage_metrics.seconds / stage_metrics.count if stage_metrics.count else 0}
+                      for name, stage_metrics in sorted(self._snapshot.stages.items())}
+            counters = dict(sorted(self._snapshot.counters.items()))
+        return {"started_at": self.started_at, "duration_seconds": time.time() - self.started_at,
+                "histogram_buckets_seconds": [str(bound) if bound == math.inf else bound
+                                              for bound in HISTOGRAM_BUCKETS_SECONDS],
+                "stages": stages, "counters": counters}
+
+    def summary(self) -> str:
+        lines = []
+        for name, stage in self.report()["stages"].items():
+            lines.append(f"{name}: {stage['count']} calls ({stage['errors']} failed), {stage['seconds']:.2f}s total, "
+                         f"{stage['max_seconds']:.2f}s max, {stage['bytes'] / 1024 ** 2:.1f} MiB")
+        return "\n".join(lines)
+
+    def write_json_report(self, path: str):
+        _write_atomically(path, json.dumps(self.report(), indent=2) + "\n")
+
+    def write_prometheus_textfile(self, path: str, labels: Optional[Dict[str, str]] = None):
+        report = self.report()
+        base_labels = "".join(f'{key}="{value}",' for key, value in (labels or {}).items())
+        lines = [f"# HELP {PROMETHEUS_PREFIX}_stage_seconds Time spent in each indexing stage.",
+                 f"# TYPE {PROMETHEUS_PREFIX}_stage_seconds histogram"]
+        for name, stage in report["stages"].items():
+            stage_labels = f'{base_labels}stage="{name}"'
+            cumulative_count = 0
+            for bound, bucket_count in zip(HISTOGRAM_BUCKETS_SECONDS, stage["bucket_counts"]):
+                cumulative_count += bucket_count
+                upper_bound = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds_bucket{{{stage_labels},le="{upper_bound}"}} '
+                             f'{cumulative_count}')
+            lines.append(f"{PROMETHEUS_PREFIX}_stage_seconds_sum{{{stage_labels}}} {stage['seconds']:.6f}")
+            lines.append(f"{PROMETHEUS_PREFIX}_stage_seconds_count{{{stage_labels}}} {stage['count']}")
+        for metric, key, description in (("stage_errors_total", "errors", "Failed calls in each indexing stage."),
+                                         ("stage_bytes_total", "bytes", "Bytes handled by each indexing stage.")):
+            lines += [f"# HELP {PROMETHEUS_PREFIX}_{metric} {description}",
+                      f"# TYPE {PROMETHEUS_PREFIX}_{metric} counter"]
+            lines += [f'{PROMETHEUS_PREFIX}_{metric}{{{base_labels}stage="{name}"}} {stage[key]}'
+                      for name, stage in report["stages"].items()]
+        for name, amount in report["counters"].items():
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}_{name}_total counter",
+                      f"{PROMETHEUS_PREFIX}_{name}_total{{{base_labels.rstrip(',')}}} {amount}"]
+        lines += [f"# TYPE {PROMETHEUS_PREFIX}_run_duration_seconds gauge",
+                  f"{PROMETHEUS_PREFIX}_run_duration_seconds{{{base_labels.rstrip(',')}}} "
+                  f"{report['duration_seconds']:.3f}",
+                  f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge",
+                  f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds{{{base_labels.rstrip(',')}}} "
+                  f"{report['started_at']:.0f}"]
+        _write_atomically(path, "\n".join(lines) + "\n")
+
+
+def _write_atomically(path: str, text: str):
+    path = Path(path)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    os.chmod(temp_path, REPORT_FILE_MODE)
+    with os.fdopen(file_descriptor, 'w') as report_file:
+        report_file.write(text)
+    os.replace(temp_path, path)
+
+
+metrics = Metrics()
+
+
+def _discard_metrics_inherited_from_parent():
+    # worker processes send their metrics back to the parent, which already holds everything recorded before the fork
+    metrics._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_discard_metrics_inherited_from_parent)
@@ -1,37 +1,56 @@
 from collections import defaultdict
-from datetime import datetime, timezone
+from functools import partial
+from operator import attrgetter
+from typing import Callable, Iterator, List, Optional, Tuple
 
 from data_indexer import utils
-from data_indexer.cdf_downloader.psp_downloader import PspDownloader
-from data_indexer.cdf_downloader.psp_file_parser import PspFileInfo
+from data_indexer.cdf_downloader.cdf_metadata_downloader import CdfMetadataDownloader
+from data_indexer.cdf_downloader.psp_downloader import PspDownloader, PspDirectoryInfo
 from data_indexer.cdf_parser.cdf_parser import CdfParser
-from data_indexer.http_client import get_with_retry
+from data_indexer.checkpoint import CheckpointStore, checkpoint_key, run_with_checkpoint
+from data_indexer.file_cadence.file_cadence import to_datetime64, from_datetime64
+from data_indexer.incremental_index import PreviousIndex
+from data_indexer.metrics import metrics
+from data_indexer.retry_scheduler import RetryScheduler
+from data_indexer.sharding import Shard, UNSHARDED, run_at_unsharded_position
 from data_indexer.utils import DataProductSource
+from data_indexer.version_selection import select_latest_version_per_date
 
 
 class PspDataProcessor:
 
     @staticmethod
-    def get_metadata_index():
-        index = []
+    def get_metadata_index(previous_index: Optional[PreviousIndex] = None, shard: Shard = UNSHARDED,
+                           checkpoints: Optional[CheckpointStore] = None):
+        return list(PspDataProcessor.iter_metadata_index(previous_index, shard, checkpoints))
 
-        psp_directory_infos = PspDownloader.get_all_metadata()
-
-        for psp_directory_info in psp_directory_infos:
-            for category, file_infos in psp_directory_info.file_infos_by_mode.items():
+    @staticmethod
+    def iter_metadata_index(previous_index: Optional[PreviousIndex] = None, shard: Shard = UNSHARDED,
+                            checkpoints: Optional[CheckpointStore] = None) -> Iterator[dict]:
+        retry_scheduler = RetryScheduler()
+        tasks = PspDataProcessor._index_entry_tasks(previous_index, shard, checkpoints)
+        for index_entry in retry_scheduler.run(tasks):
+            metrics.increment("data_products_indexed")
+            yield index_entry
+        metrics.increment("data_products_failed", len(retry_scheduler.failures))
+        retry_scheduler.print_summary()
 
-                file_info_per_date: dict[datetime, PspFileInfo] = dict()
-                for file_info in file_infos:
-                    if file_info.start_date in file_info_per_date:
-                        if file_info.version > file_info_per_date[file_info.start_date].version:
-                            file_info_per_date[file_info.start_date] = file_info
-                    else:
-                        file_info_per_date[file_info.start_date] = file_info
+    @staticmethod
+    def _index_entry_tasks(previous_index: Optional[PreviousIndex], shard: Shard = UNSHARDED,
+                           checkpoints: Optional[CheckpointStore] = None) -> Iterator[Tuple[str, Callable[[], dict]]]:
+        psp_directory_infos = PspDownloader.get_all_metadata(shard)
 
+        for psp_directory_info in psp_directory_infos:
+            for product_number, (category, file_infos) in enumerate(psp_directory_info.file_infos_by_mode.items()):
+                file_infos_to_index = select_latest_version_per_date(file_infos, attrgetter('start_date'),
+                                                                     attrgetter('version'))
                 file_url = None
                 data_product_sources = []
-                consistent_version_based_on_filenames = len(set(finfo.version for finfo in file_info_per_date.values())) == 1
-                for file_info in file_info_per_date.values():
+                consistent_version_based_on_filenames = len(set(finfo.version for finfo in file_infos_to_index)) == 1
+                start_times, end_times = psp_directory_info.file_cadence.get_file_time_ranges(
+                    to_datetime64([file_info.start_date for file_info in file_infos_to_index]))
+                for file_info, file_start, file_end in zip(file_infos_to_index, from_datetime64(start_times),
+                                                           from_datetime64(end_times)):
                     file_url = PspDownloader.get_url(
                         psp_directory_info.base_url,
                         file_info.name,
@@ -40,25 +59,38 @@ class PspDataProcessor:
                         file_info.year
                     )
 
-                    file_start, file_end = psp_directory_info.file_cadence.get_file_time_range(file_info.start_date)
                     data_product_sources.append(DataProductSource(start_time=file_start, end_time=file_end, url=file_url))
 
-                cdf_data = get_with_retry(file_url).content
-                cdf_info = CdfParser.parse_cdf_bytes(cdf_data, psp_directory_info.variable_selector)
-                if consistent_version_based_on_filenames:
-                    version = cdf_info.global_info.data_version
-                else:
-                    version = ""
-                index.append(utils.get_index_entry(
-                    cdf_file_info=cdf_info,
-                    file_timeranges=data_product_sources,
-                    instrument=psp_directory_info.instrument_human_readable,
-                    mission=psp_directory_info.mission,
-                    file_cadence=psp_directory_info.file_cadence,
-                    version=version,
-                ))
+                get_index_entry = partial(PspDataProcessor._get_index_entry, psp_directory_info, data_product_sources,
+                                          file_url, consistent_version_based_on_filenames, previous_index)
+                key = checkpoint_key(source.url for source in data_product_sources)
+                unsharded_position = [psp_directory_info.position, product_number] if shard != UNSHARDED else None
+                yield file_url, partial(run_at_unsharded_position, unsharded_position,
+                                        partial(run_with_checkpoint, checkpoints, key, get_index_entry))
 
-        return index
+    @staticmethod
+    def _get_index_entry(psp_directory_info: PspDirectoryInfo, data_product_sources: List[DataProductSource],
+                         file_url: str, consistent_version_based_on_filenames: bool,
+                         previous_index: Optional[PreviousIndex]) -> dict:
+        cdf_info = None
+        if previous_index is not None:
+            cdf_info = previous_index.get_cdf_file_info(
+                file_url, requires_data_version=consistent_version_based_on_filenames)
+        if cdf_info is None:
+            with CdfMetadataDownloader.get_cdf_metadata(file_url) as cdf_data:
+                cdf_info = CdfParser.parse_cdf(cdf_data, psp_directory_info.variable_selector)
+        if consistent_version_based_on_filenames:
+            version = cdf_info.global_info.data_version
+        else:
+            version = ""
+        return utils.get_index_entry(
+            cdf_file_info=cdf_info,
+            file_timeranges=data_product_sources,
+            instrument=psp_directory_info.instrument_human_readable,
+            mission=psp_directory_info.mission,
+            file_cadence=psp_directory_info.file_cadence,
+            version=version,
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+import heapq
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, TypeVar
+
+from data_indexer.http_client import RetryLater, retry_delay
+
+T = TypeVar('T')
+
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+@dataclass
+class FailedTask:
+    key: str
+    attempts: int
+    error: RetryLater
+
+
+class ExecutorTask:
+    """A task submitted to an executor as soon as it is created, and resubmitted when the scheduler retries it."""
+
+    def __init__(self, executor: Executor, function: Callable[..., T], *args):
+        self._executor = executor
+        self._function = function
+        self._args = args
+        self._future = executor.submit(function, *args)
+
+    def __call__(self) -> T:
+        future = self._future if self._future is not None else self._executor.submit(self._function, *self._args)
+        self._future = None
+        return future.result()
+
+
+class RetryScheduler:
+    """
+    Runs tasks in order, parking any task that raises RetryLater with a jittered backoff (or the server's Retry-After)
+    while the following tasks run. Results are yielded in task order; tasks that never succeed are skipped and
+    recorded in failures.
+    """
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self.failures: List[FailedTask] = []
+        self.retry_count = 0
+
+    def run(self, tasks: Iterable[Tuple[str, Callable[[], T]]]) -> Iterator[T]:
+        pending_tasks = enumerate(tasks)
+        parked = []
+        finished: Dict[int, Tuple[bool, T]] = {}
+        next_position = 0
+        all_tasks_started = False
+
+        while parked or not all_tasks_started:
+            if parked and (all_tasks_started or parked[0][0] <= time.monotonic()):
+                ready_at, position, attempt, key, task = heapq.heappop(parked)
+                time.sleep(max(0.0, ready_at - time.monotonic()))
+                self.retry_count += 1
+            else:
+                try:
+                    position, (key, task) = next(pending_tasks)
+                except StopIteration:
+                    all_tasks_started = True
+                    continue
+                attempt = 1
+
+            try:
+                finished[position] = (True, task())
+            except RetryLater as e:
+                if attempt >= self.max_attempts:
+                    self.failures.append(FailedTask(key, attempt, e))
+                    finished[position] = (False, None)
+                else:
+                    print(f"Parking {key} after attempt {attempt}: {e}")
+                    ready_at = time.monotonic() + retry_delay(attempt - 1, e.retry_after)
+                    heapq.heappush(parked, (ready_at, position, attempt + 1, key, task))
+
+            while next_position in finished:
+                succeeded, result = finished.pop(next_position)
+                next_position += 1
+                if succeeded:
+                    yield result
+
+    def summary(self) -> str:
+        lines = [f"{len(self.failures)} item(s) failed after retrying ({self.retry_count} retries in total)"]
+        lines += [f"  {failure.key}: {failure.error} after {failure.attempts} attempts" for failure in self.failures]
+        return "\n".join(lines)
+
+    def print_summary(self):
+        if self.failures:
+            print(self.summary())
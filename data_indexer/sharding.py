@@ -0,0 +1,108 @@
+import re
+import zlib
+from operator import itemgetter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from data_indexer.index_file import read_index
+
+PARTIAL_INDEX_SUFFIX = re.compile(r'\.shard-(\d+)-of-(\d+)\.(json|ndjson)$')
+# written into the entries of partial indexes only, and removed again by merge_partial_indexes
+UNSHARDED_POSITION = "unsharded_position"
+
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, text: str) -> 'Shard':
+        """Parses "i/N", the i-th of N shards counting from 0."""
+        match = re.fullmatch(r'(\d+)/(\d+)', text.strip())
+        if match is None:
+            raise ValueError(f"Expected a shard as i/N, got `{text}`")
+        shard = cls(int(match[1]), int(match[2]))
+        if not 0 <= shard.index < shard.count:
+            raise ValueError(f"Shard index must be between 0 and {shard.count - 1}, got `{text}`")
+        return shard
+
+    def owns(self, key: str) -> bool:
+        # crc32 rather than hash() so that every process, on every machine, assigns a key to the same shard
+        return zlib.crc32(key.encode()) % self.count == self.index
+
+    def owns_position(self, position: int) -> bool:
+        return position % self.count == self.index
+
+    @property
+    def file_suffix(self) -> str:
+        return f"shard-{self.index}-of-{self.count}"
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+UNSHARDED = Shard(0, 1)
+
+
+def run_at_unsharded_position(position: Optional[List[int]],
+                              get_index_entry: Callable[[], Optional[dict]]) -> Optional[dict]:
+    """
+    Records where an unsharded run would have written the entry, as a list that sorts in that order, so that merging
+    the partial indexes reproduces the unsharded index. Unsharded runs pass no position and write entries unchanged.
+    """
+    index_entry = get_index_entry()
+    if index_entry is not None and position is not None:
+        index_entry[UNSHARDED_POSITION] = position
+    return index_entry
+
+
+def find_partial_indexes(directory: Path, index_name: str) -> List[Path]:
+    """
+    Finds the partial indexes written by `main.py INDEXER --shard i/N` for index_name, e.g. index_psp.v2, and checks
+    that there is exactly one for each of the N shards of a single run.
+    """
+    partial_indexes = {}
+    for path in directory.glob(f"{index_name}.shard-*"):
+        match = PARTIAL_INDEX_SUFFIX.search(path.name)
+        if match is None or path.name != f"{index_name}{match[0]}":
+            continue
+        shard = Shard(int(match[1]), int(match[2]))
+        if shard in partial_indexes:
+            raise ValueError(f"Found more than one partial index for shard {shard}: "
+                             f"{partial_indexes[shard].name}, {path.name}")
+        partial_indexes[shard] = path
+
+    if not partial_indexes:
+        raise FileNotFoundError(f"No partial indexes named {index_name}.shard-*-of-* in {directory}")
+    shard_counts = {shard.count for shard in partial_indexes}
+    if len(shard_counts) > 1:
+        raise ValueError(f"Partial indexes of {index_name} come from runs with different shard counts: "
+                         f"{', '.join(str(count) for count in sorted(shard_counts))}")
+    shard_count = shard_counts.pop()
+    missing_shards = [str(Shard(index, shard_count)) for index in range(shard_count)
+                      if Shard(index, shard_count) not in partial_indexes]
+    if missing_shards:
+        raise ValueError(f"Missing partial indexes of {index_name} for shards {', '.join(missing_shards)}")
+    return [partial_indexes[Shard(index, shard_count)] for index in range(shard_count)]
+
+
+def merge_partial_indexes(paths: Iterable[Path]) -> List[Dict]:
+    """
+    Combines partial indexes into one, in the order an unsharded run writes its entries, so that the merged index
+    does not depend on how the data products were spread over the shards or in which order they finished.
+    """
+    entries_by_source_url = {}
+    for path in paths:
+        for entry in read_index(str(path)):
+            source_url = entry["file_timeranges"][-1]["url"] if entry["file_timeranges"] else entry["logical_source"]
+            if source_url in entries_by_source_url:
+                raise ValueError(f"{entry['logical_source']} appears in more than one partial index, "
+                                 f"including {path.name}")
+            if UNSHARDED_POSITION not in entry:
+                raise ValueError(f"{entry['logical_source']} in {path.name} has no {UNSHARDED_POSITION}, "
+                                 f"rerun its shard to write the partial index again")
+            entries_by_source_url[source_url] = entry
+    entries = sorted(entries_by_source_url.values(), key=itemgetter(UNSHARDED_POSITION))
+    for entry in entries:
+        del entry[UNSHARDED_POSITION]
+    return entries
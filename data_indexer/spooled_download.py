@@ -0,0 +1,162 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from typing import BinaryIO, Iterable, NamedTuple, Optional
+
+import httpx
+
+from data_indexer.metrics import metrics
+
+DEFAULT_MAX_IN_FLIGHT_BYTES = 512 * 1024 ** 2
+TMPFS_DIRECTORY = '/dev/shm'
+HASH_CHUNK_BYTES = 1024 ** 2
+
+
+class InFlightBytes:
+    """
+    Ceiling on the downloaded bytes held in memory by all concurrent downloads. The count lives in shared memory, so it
+    is also the ceiling of the worker processes started after it was created.
+    """
+
+    def __init__(self, max_bytes: int):
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes must not be negative, got {max_bytes}")
+        self.max_bytes = max_bytes
+        self._reserved = multiprocessing.Value('q', 0)
+
+    @property
+    def reserved(self) -> int:
+        return self._reserved.value
+
+    def try_reserve(self, byte_count: int) -> bool:
+        with self._reserved.get_lock():
+            if self._reserved.value + byte_count > self.max_bytes:
+                return False
+            self._reserved.value += byte_count
+            return True
+
+    def release(self, byte_count: int):
+        with self._reserved.get_lock():
+            self._reserved.value -= byte_count
+
+
+class SpoolSettings(NamedTuple):
+    in_flight_bytes: InFlightBytes
+    directory: Optional[str] = None
+
+
+spool_settings: Optional[SpoolSettings] = None
+
+
+def configure_spooling(max_in_flight_bytes: Optional[int] = None, directory: Optional[str] = None) -> SpoolSettings:
+    """Call before starting worker processes, so that they share the ceiling."""
+    global spool_settings
+    if max_in_flight_bytes is None:
+        max_in_flight_bytes = DEFAULT_MAX_IN_FLIGHT_BYTES
+    spool_settings = SpoolSettings(InFlightBytes(max_in_flight_bytes), directory)
+    return spool_settings
+
+
+def current_spool_settings() -> SpoolSettings:
+    return spool_settings if spool_settings is not None else configure_spooling()
+
+
+class SpooledFile:
+    """
+    A downloaded body in an unnamed scratch file, with its size and SHA-256, for CdfParser to open by file descriptor.
+    The file is memory-backed while the body fits under the in-flight ceiling and on disk otherwise; its share of the
+    ceiling is released when it is closed.
+    """
+
+    def __init__(self, file: BinaryIO, size: int, sha256: Optional[str] = None,
+                 in_flight_bytes: Optional[InFlightBytes] = None, reserved_bytes: int = 0):
+        self.file = file
+        self.size = size
+        self._sha256 = sha256
+        self._in_flight_bytes = in_flight_bytes
+        self._reserved_bytes = reserved_bytes
+
+    @property
+    def sha256(self) -> str:
+        """The digest worked out while spooling, or, for a file opened from disk without one, on first use."""
+        if self._sha256 is None:
+            position = self.file.tell()
+            self.file.seek(0)
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: self.file.read(HASH_CHUNK_BYTES), b''):
+                digest.update(chunk)
+            self.file.seek(position)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    @property
+    def in_memory(self) -> bool:
+        return self._reserved_bytes > 0
+
+    @staticmethod
+    def open(path: str, sha256: Optional[str] = None) -> 'SpooledFile':
+        """Opens a file that is already on disk, such as a cached download, with its digest if it is known."""
+        file = open(path, 'rb')
+        return SpooledFile(file, os.fstat(file.fileno()).st_size, sha256)
+
+    def close(self):
+        self.file.close()
+        if self._reserved_bytes:
+            self._in_flight_bytes.release(self._reserved_bytes)
+            self._reserved_bytes = 0
+
+    def __enter__(self) -> 'SpooledFile':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def spool(chunks: Iterable[bytes], expected_size: Optional[int] = None,
+          settings: Optional[SpoolSettings] = None) -> SpooledFile:
+    """
+    Writes chunks to a scratch file as they arrive, hashing them on the way. Only a body whose size is known up front
+    can be held in memory, since the ceiling is reserved before the first chunk is written.
+    """
+    settings = settings if settings is not None else current_spool_settings()
+    in_memory = expected_size is not None and settings.in_flight_bytes.try_reserve(expected_size)
+    reserved_bytes = expected_size if in_memory else 0
+    if not in_memory:
+        metrics.increment("downloads_spooled_to_disk")
+    try:
+        file = _memory_file() if in_memory else tempfile.TemporaryFile(dir=settings.directory)
+    except BaseException:
+        settings.in_flight_bytes.release(reserved_bytes)
+        raise
+
+    spooled_file = SpooledFile(file, 0, None, settings.in_flight_bytes, reserved_bytes)
+    try:
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            file.write(chunk)
+            digest.update(chunk)
+            spooled_file.size += len(chunk)
+        file.flush()
+        file.seek(0)
+    except BaseException:
+        spooled_file.close()
+        raise
+    spooled_file._sha256 = digest.hexdigest()
+    return spooled_file
+
+
+def _memory_file() -> BinaryIO:
+    if hasattr(os, 'memfd_create'):
+        return os.fdopen(os.memfd_create('download', os.MFD_CLOEXEC), 'w+b')
+    return tempfile.TemporaryFile(dir=TMPFS_DIRECTORY if os.path.isdir(TMPFS_DIRECTORY) else None)
+
+
+class Download(NamedTuple):
+    """A response whose body is either read, in response.content, or spooled, in file, for a whole-file 200 body."""
+    response: httpx.Response
+    file: Optional[SpooledFile] = None
+
+    @property
+    def size(self) -> int:
+        return self.file.size if self.file is not None else len(self.response.content)
@@ -0,0 +1,39 @@
+import os
+import time
+from typing import List, Optional, Tuple
+
+PROC_SELF_STAT = '/proc/self/stat'
+
+
+class StartupTiming:
+    """Wall-clock time of each phase of a run, starting with the interpreter start-up before main() was called."""
+
+    def __init__(self):
+        self._marked_at = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        before_main = seconds_since_process_start()
+        if before_main is not None:
+            self.phases.append(("interpreter start-up and imports", before_main))
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._marked_at))
+        self._marked_at = now
+
+    def report(self) -> str:
+        lines = ["startup timing:"]
+        lines += [f"  {phase}: {seconds * 1000:.0f} ms" for phase, seconds in self.phases]
+        lines.append(f"  total: {sum(seconds for _, seconds in self.phases) * 1000:.0f} ms")
+        return "\n".join(lines)
+
+
+def seconds_since_process_start() -> Optional[float]:
+    """Reads the process start time from /proc, so it is only available on Linux, at clock tick resolution."""
+    try:
+        with open(PROC_SELF_STAT) as stat_file:
+            # the fields after "pid (command)", of which the process start time is the 20th
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        started_at = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started_at
+    except (OSError, IndexError, ValueError, AttributeError):
+        return None
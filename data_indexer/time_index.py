@@ -0,0 +1,131 @@
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from data_indexer.index_file import INDEX_FILE_MODE
+from data_indexer.utils import DataProductSource, require_timezone
+
+TIME_INDEX_MAGIC = b'CAVATIX1'
+# magic, product count, file count, offsets of the product table, the time arrays, the URL offsets and the string table
+HEADER = struct.Struct('<8sQQQQQQ')
+# key offset and length in the string table, index of the product's first file, number of files
+PRODUCT = struct.Struct('<QQQQ')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_epoch_microseconds(t: datetime) -> int:
+    return (require_timezone(t) - EPOCH) // timedelta(microseconds=1)
+
+
+class TimeIndexWriter:
+    """
+    Builds a little-endian sidecar holding, per data product, int64 start/end times in microseconds since the Unix
+    epoch sorted by start time, a running maximum of the end times for overlap searches, and the file URLs.
+    """
+
+    def __init__(self):
+        self._products: List[Tuple[str, List[DataProductSource]]] = []
+
+    def add(self, key: str, data_product_sources: List[DataProductSource]):
+        self._products.append((key, sorted(data_product_sources, key=lambda source: source.start_time)))
+
+    def write(self, path: str):
+        products = sorted(self._products, key=lambda product: product[0])
+        sources = [source for _, product_sources in products for source in product_sources]
+        starts = np.array([to_epoch_microseconds(source.start_time) for source in sources], dtype='<i8')
+        ends = np.array([to_epoch_microseconds(source.end_time) for source in sources], dtype='<i8')
+        running_max_ends = np.array([running_max_end for _, product_sources in products
+                                     for running_max_end in np.maximum.accumulate(
+                                         [to_epoch_microseconds(source.end_time) for source in product_sources])],
+                                    dtype='<i8')
+
+        strings = bytearray()
+        product_table = bytearray()
+        first_file = 0
+        for key, product_sources in products:
+            encoded_key = key.encode()
+            product_table += PRODUCT.pack(len(strings), len(encoded_key), first_file, len(product_sources))
+            strings += encoded_key
+            first_file += len(product_sources)
+        url_offsets = []
+        for source in sources:
+            url_offsets.append(len(strings))
+            strings += source.url.encode()
+        url_offsets.append(len(strings))
+
+        # the header and product rows are multiples of 8 bytes, so the int64 arrays stay aligned for np.frombuffer
+        product_table_offset = HEADER.size
+        times_offset = product_table_offset + len(product_table)
+        url_offsets_offset = times_offset + 3 * starts.nbytes
+        strings_offset = url_offsets_offset + 8 * len(url_offsets)
+        header = HEADER.pack(TIME_INDEX_MAGIC, len(products), len(sources), product_table_offset, times_offset,
+                             url_offsets_offset, strings_offset)
+
+        path = Path(path)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+        os.chmod(temp_path, INDEX_FILE_MODE)
+        with os.fdopen(file_descriptor, 'wb') as time_index_file:
+            time_index_file.write(header)
+            time_index_file.write(product_table)
+            for array in (starts, ends, running_max_ends):
+                time_index_file.write(array.tobytes())
+            time_index_file.write(np.array(url_offsets, dtype='<u8').tobytes())
+            time_index_file.write(strings)
+        os.replace(temp_path, path)
+
+
+class TimeIndex:
+    def __init__(self, path: str):
+        with open(path, 'rb') as time_index_file:
+            self._mmap = mmap.mmap(time_index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, product_count, file_count, product_table_offset, times_offset, url_offsets_offset, strings_offset = \
+            HEADER.unpack_from(self._mmap)
+        if magic != TIME_INDEX_MAGIC:
+            raise ValueError(f"{path} is not a CAVA time index")
+
+        self._starts = np.frombuffer(self._mmap, dtype='<i8', count=file_count, offset=times_offset)
+        self._ends = np.frombuffer(self._mmap, dtype='<i8', count=file_count, offset=times_offset + 8 * file_count)
+        self._running_max_ends = np.frombuffer(self._mmap, dtype='<i8', count=file_count,
+                                               offset=times_offset + 16 * file_count)
+        self._url_offsets = np.frombuffer(self._mmap, dtype='<u8', count=file_count + 1, offset=url_offsets_offset)
+        self._strings_offset = strings_offset
+
+        self._products = {}
+        for row in range(product_count):
+            key_offset, key_length, first_file, product_file_count = \
+                PRODUCT.unpack_from(self._mmap, product_table_offset + row * PRODUCT.size)
+            key = self._string(key_offset, key_offset + key_length)
+            self._products[key] = (first_file, first_file + product_file_count)
+
+    @property
+    def keys(self) -> List[str]:
+        return list(self._products)
+
+    def find_urls(self, key: str, start_time: datetime, end_time: datetime) -> List[str]:
+        return [url for url, _, _ in self.find_files(key, start_time, end_time)]
+
+    def find_files(self, key: str, start_time: datetime, end_time: datetime) -> List[Tuple[str, int, int]]:
+        first_file, last_file = self._products[key]
+        start, end = to_epoch_microseconds(start_time), to_epoch_microseconds(end_time)
+        # files starting before the interval ends, skipping those whose end (and every earlier end) precedes it
+        upper = first_file + int(np.searchsorted(self._starts[first_file:last_file], end, side='left'))
+        lower = first_file + int(np.searchsorted(self._running_max_ends[first_file:upper], start, side='right'))
+        # A file spanning most of the product holds lower back at its own position, so at worst every file between it
+        # and upper is a candidate; they are filtered in one vectorized comparison rather than one by one.
+        matches = lower + np.flatnonzero(self._ends[lower:upper] > start)
+        return [(self._string(int(self._url_offsets[i]), int(self._url_offsets[i + 1])),
+                 int(self._starts[i]), int(self._ends[i]))
+                for i in matches.tolist()]
+
+    def close(self):
+        self._starts = self._ends = self._running_max_ends = self._url_offsets = None
+        self._mmap.close()
+
+    def _string(self, start: int, end: int) -> str:
+        return self._mmap[self._strings_offset + start:self._strings_offset + end].decode()
@@ -14,6 +14,13 @@ class DataProductSource:
     end_time: datetime
 
 
+def require_timezone(t: datetime) -> datetime:
+    """Index times are timezone-aware, and can only be compared with query times that are too."""
+    if t.tzinfo is None or t.utcoffset() is None:
+        raise ValueError(f"{t.isoformat()} has no time zone, pass a timezone-aware datetime such as one in UTC")
+    return t
+
+
 def get_index_entry(cdf_file_info: CdfFileInfo, file_timeranges: list[DataProductSource], instrument: str, mission: str,
                     file_cadence: FileCadence, version: str = "") -> Dict:
 
@@ -32,3 +39,10 @@ def get_index_entry(cdf_file_info: CdfFileInfo, file_timeranges: list[DataProduc
                     "url": file_timerange.url,
                 } for file_timerange in file_timeranges]
             }
+
+
+def get_data_product_sources(index_entry: Dict) -> List[DataProductSource]:
+    return [DataProductSource(url=file_timerange["url"],
+                              start_time=datetime.fromisoformat(file_timerange["start_time"]),
+                              end_time=datetime.fromisoformat(file_timerange["end_time"]))
+            for file_timerange in index_entry["file_timeranges"]]
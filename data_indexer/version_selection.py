@@ -0,0 +1,35 @@
+from typing import Callable, Dict, Hashable, Iterable, List, TypeVar
+
+T = TypeVar('T')
+G = TypeVar('G', bound=Hashable)
+
+
+def select_latest_versions(records: Iterable[T], group_of: Callable[[T], G], start_date_of: Callable[[T], Hashable],
+                           version_of: Callable[[T], int]) -> Dict[G, List[T]]:
+    """
+    Keeps the highest version of each group's file for each start date, the first one seen on a tie, and returns
+    each group's files sorted by start date, groups in the order they were first seen.
+
+    Records are consumed as a stream and only the files selected so far are held, so memory grows with the number of
+    distinct (group, start date) pairs rather than with the number of records. Versions are only compared, and so
+    only computed, for the rare start dates that have more than one file.
+    """
+    latest: Dict[G, Dict[Hashable, T]] = {}
+    for record in records:
+        group = group_of(record)
+        files_by_start_date = latest.get(group)
+        if files_by_start_date is None:
+            files_by_start_date = latest[group] = {}
+        start_date = start_date_of(record)
+        selected = files_by_start_date.get(start_date)
+        if selected is None or version_of(record) > version_of(selected):
+            files_by_start_date[start_date] = record
+
+    return {group: [files_by_start_date[start_date] for start_date in sorted(files_by_start_date)]
+            for group, files_by_start_date in latest.items()}
+
+
+def select_latest_version_per_date(records: Iterable[T], start_date_of: Callable[[T], Hashable],
+                                   version_of: Callable[[T], int]) -> List[T]:
+    """select_latest_versions for the files of a single data product."""
+    return select_latest_versions(records, lambda record: None, start_date_of, version_of).get(None, [])
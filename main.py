@@ -1,22 +1,224 @@
-import json
+import argparse
+import os
 import sys
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
-from data_indexer import imap_data_processor
-from data_indexer.psp_data_processor import PspDataProcessor
+from data_indexer.checkpoint import CheckpointStore
+from data_indexer.compact_index import COMPACT_INDEX_VERSION, encode_index_entry
+from data_indexer.index_file import IndexWriter, INDEX_FORMATS
+from data_indexer.metrics import metrics
+from data_indexer.sharding import Shard, UNSHARDED, find_partial_indexes, merge_partial_indexes
+from data_indexer.startup_timing import StartupTiming
 
 CURRENT_VERSION = "v2"
 
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE = "CAVA_INDEXER_CACHE_DIR"
+CACHE_MAX_BYTES_ENVIRONMENT_VARIABLE = "CAVA_INDEXER_CACHE_MAX_BYTES"
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+LISTING_CACHE_FILENAME = "listings.json"
+DEFAULT_CHECKPOINT_DIRECTORY = ".indexer-checkpoints"
+
+# Each mission's modules, and the heavy dependencies they pull in (imap_data_access, httpx, numpy), are only
+# imported when that mission is indexed. spacepy.pycdf is further deferred until the first CDF is parsed.
+IndexerFunction = Callable[..., Iterator[dict]]
+
+
+def load_imap_indexer(args) -> IndexerFunction:
+    from data_indexer import imap_data_processor
+    return partial(imap_data_processor.iter_metadata_index, max_workers=args.workers, shard=args.shard,
+                   split_queries_by_instrument=args.split_imap_queries_by_instrument)
+
+
+def load_psp_indexer(args) -> IndexerFunction:
+    from data_indexer.psp_data_processor import PspDataProcessor
+    return partial(PspDataProcessor.iter_metadata_index, shard=args.shard)
+
+
+INDEXERS = {
+    'imap': load_imap_indexer,
+    'psp': load_psp_indexer,
+}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Build the CAVA metadata index for a mission")
+    parser.add_argument('indexer', help="mission to index: imap or psp")
+    parser.add_argument('--incremental', action='store_true',
+                        help="reuse CDF metadata from the existing index for unchanged data products")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes used to download and parse IMAP CDFs")
+    parser.add_argument('--split-imap-queries-by-instrument', action='store_true',
+                        help="query the IMAP archive once per instrument and data level instead of once per data "
+                             "level, for smaller responses that can be fetched concurrently")
+    parser.add_argument('--format', choices=INDEX_FORMATS, default='json',
+                        help="write the index as a JSON array or as newline-delimited JSON")
+    parser.add_argument('--time-index', action='store_true',
+                        help="also write a memory-mappable binary sidecar for file time range lookups")
+    parser.add_argument('--metrics-report', metavar='PATH',
+                        help="write per-stage timings, counts and byte totals as JSON")
+    parser.add_argument('--prometheus-textfile', metavar='PATH',
+                        help="write the same metrics in the Prometheus textfile collector format")
+    parser.add_argument('--timing', action='store_true',
+                        help="print how long interpreter start-up, loading the indexer and each phase took")
+    parser.add_argument('--shard', type=shard_argument, default=UNSHARDED, metavar='i/N',
+                        help="index only the i-th of N shards of the data products (counting from 0) and write a "
+                             "partial index for `main.py merge`")
+    parser.add_argument('--resume', action='store_true',
+                        help="reuse the data products checkpointed by an interrupted run instead of starting over")
+    parser.add_argument('--checkpoint-dir', default=DEFAULT_CHECKPOINT_DIRECTORY, metavar='PATH',
+                        help="where each finished data product is checkpointed until the index is written")
+    parser.add_argument('--max-in-flight-download-bytes', type=int, metavar='BYTES',
+                        help="ceiling on the downloaded CDF bytes held in memory across all concurrent downloads; "
+                             "whole files beyond it are spooled to disk (default 512 MiB)")
+    parser.add_argument('--spool-dir', metavar='PATH',
+                        help="where whole-file downloads beyond the in-memory ceiling are spooled "
+                             "(default: the system temporary directory)")
+    parser.epilog = "Run `main.py merge INDEXER` to combine the partial indexes written with --shard."
+    args = parser.parse_args(argv)
+    if args.shard != UNSHARDED and args.time_index:
+        parser.error("--time-index cannot be used with --shard, pass it to `main.py merge` instead")
+    return args
+
+
+def parse_merge_arguments(argv):
+    parser = argparse.ArgumentParser(prog="main.py merge",
+                                     description="Combine the partial indexes written by --shard runs into one index")
+    parser.add_argument('indexer', help="mission whose partial indexes to merge: imap or psp")
+    parser.add_argument('--format', choices=INDEX_FORMATS, default='json',
+                        help="write the index as a JSON array or as newline-delimited JSON")
+    parser.add_argument('--time-index', action='store_true',
+                        help="also write a memory-mappable binary sidecar for file time range lookups")
+    return parser.parse_args(argv)
+
+
+def shard_argument(text: str) -> Shard:
+    try:
+        return Shard.parse(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+class DataProductsFailed(Exception):
+    """Raised once all entries are written if any data product failed, so that the previous index is kept."""
+
+
+def abort_if_data_products_failed(index_entries: Iterable[dict]) -> Iterator[dict]:
+    yield from index_entries
+    if metrics.report()["counters"].get("data_products_failed"):
+        raise DataProductsFailed()
+
 
 def main():
-    args = sys.argv
-    if args[1] == 'imap':
-        with open(f'index_imap.{CURRENT_VERSION}.json', 'w') as file_handler:
-            json.dump(imap_data_processor.get_metadata_index(), file_handler, indent=2)
-    elif args[1] == 'psp':
-        with open(f'index_psp.{CURRENT_VERSION}.json', 'w') as file_handler:
-            json.dump(PspDataProcessor.get_metadata_index(), file_handler, indent=2)
-    else:
+    if sys.argv[1:2] == ['merge']:
+        merge(parse_merge_arguments(sys.argv[2:]))
+        return
+
+    timing = StartupTiming()
+    args = parse_arguments(sys.argv[1:])
+    cache_directory = os.environ.get(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE)
+    download_cache = None
+    listing_cache = None
+    if cache_directory:
+        from data_indexer import http_client
+        from data_indexer.cdf_downloader import psp_file_parser
+        cache_max_bytes = int(os.environ.get(CACHE_MAX_BYTES_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_MAX_BYTES))
+        download_cache = http_client.enable_download_cache(cache_directory, cache_max_bytes)
+        listing_cache = psp_file_parser.enable_listing_cache(os.path.join(cache_directory, LISTING_CACHE_FILENAME))
+
+    if args.indexer not in INDEXERS:
         raise NotImplementedError("Unknown indexer requested")
+    iter_metadata_index = INDEXERS[args.indexer](args)
+    # before any worker process starts, so that the workers share the ceiling
+    from data_indexer import spooled_download
+    spooled_download.configure_spooling(args.max_in_flight_download_bytes, args.spool_dir)
+    timing.mark(f"load {args.indexer} indexer")
+
+    previous_index = None
+    if args.incremental:
+        from data_indexer.incremental_index import PreviousIndex
+        previous_index = PreviousIndex.load(f'index_{args.indexer}.{CURRENT_VERSION}.{args.format}')
+        timing.mark("load previous index")
+    index_name = f'index_{args.indexer}.{CURRENT_VERSION}'
+    if args.shard != UNSHARDED:
+        index_name += f'.{args.shard.file_suffix}'
+    checkpoints = CheckpointStore(os.path.join(args.checkpoint_dir, index_name), resume=args.resume)
+    # An index missing the failed data products must not replace the previous one, so writing it is abandoned
+    index_entries = abort_if_data_products_failed(iter_metadata_index(previous_index, checkpoints=checkpoints))
+    entry_count = None
+    try:
+        if args.shard == UNSHARDED:
+            entry_count = write_index(index_entries, args.indexer, args.format, args.time_index)
+        else:
+            with IndexWriter(f'{index_name}.{args.format}', args.format) as partial_index_writer:
+                for index_entry in index_entries:
+                    partial_index_writer.write(index_entry)
+            entry_count = partial_index_writer.entry_count
+    except DataProductsFailed:
+        pass
+    timing.mark("index")
+
+    counters = metrics.report()["counters"]
+    if counters.get("data_products_resumed"):
+        print(f"resumed {counters['data_products_resumed']} data products from checkpoints")
+    if counters.get("data_products_failed"):
+        # keep the checkpoints so that a rerun with --resume only retries the failed data products
+        print(f"{counters['data_products_failed']} data products failed, so the previous index was kept; "
+              f"rerun with --resume to retry only those")
+    else:
+        checkpoints.remove_all()
+
+    if previous_index is not None and entry_count is not None:
+        print(f"reused CDF metadata from the previous index for {previous_index.reused_count} "
+              f"of {entry_count} data products")
+
+    if download_cache is not None:
+        download_cache.flush()
+        print(download_cache.stats)
+        print(listing_cache)
+
+    print(metrics.summary())
+    if args.metrics_report:
+        metrics.write_json_report(args.metrics_report)
+    if args.prometheus_textfile:
+        labels = {"indexer": args.indexer}
+        if args.shard != UNSHARDED:
+            labels["shard"] = str(args.shard)
+        metrics.write_prometheus_textfile(args.prometheus_textfile, labels)
+    if args.timing:
+        timing.mark("write reports")
+        print(timing.report())
+    if entry_count is None:
+        # a failing exit status stops the scheduled job before it commits and pushes the index
+        sys.exit(1)
+
+
+def merge(args):
+    index_name = f'index_{args.indexer}.{CURRENT_VERSION}'
+    partial_index_paths = find_partial_indexes(Path('.'), index_name)
+    entry_count = write_index(merge_partial_indexes(partial_index_paths), args.indexer, args.format, args.time_index)
+    print(f"merged {entry_count} data products from {len(partial_index_paths)} partial indexes of {index_name}")
+
+
+def write_index(index_entries: Iterable[dict], indexer: str, index_format: str, time_index: bool) -> int:
+    index_path = f'index_{indexer}.{CURRENT_VERSION}.{index_format}'
+    compact_index_path = f'index_{indexer}.{COMPACT_INDEX_VERSION}.{index_format}'
+    time_index_writer = None
+    if time_index:
+        from data_indexer.time_index import TimeIndexWriter
+        from data_indexer.utils import get_data_product_sources
+        time_index_writer = TimeIndexWriter()
+    with IndexWriter(index_path, index_format) as index_writer, \
+            IndexWriter(compact_index_path, index_format) as compact_index_writer:
+        for index_entry in index_entries:
+            index_writer.write(index_entry)
+            compact_index_writer.write(encode_index_entry(index_entry))
+            if time_index_writer is not None:
+                time_index_writer.add(index_entry["logical_source"], get_data_product_sources(index_entry))
+    if time_index_writer is not None:
+        time_index_writer.write(f'index_{indexer}.{CURRENT_VERSION}.timeindex')
+    return index_writer.entry_count
 
 
 if __name__ == "__main__":
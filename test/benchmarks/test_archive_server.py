@@ -0,0 +1,62 @@
+import tempfile
+import time
+import unittest
+
+import httpx
+
+from benchmarks.archive_server import ArchiveServer
+from benchmarks.synthetic_archive import build_imap_archive, build_psp_archive
+from data_indexer.cdf_downloader.cdf_metadata_downloader import CdfMetadataDownloader
+from data_indexer.cdf_downloader.psp_file_parser import PspFileParser
+from data_indexer.cdf_parser.cdf_parser import CdfParser
+from data_indexer.cdf_parser.variable_selector.default_variable_selector import DefaultVariableSelector
+
+
+class TestArchiveServer(unittest.TestCase):
+    def test_serves_cdaweb_style_listings(self):
+        with tempfile.TemporaryDirectory() as scratch_directory:
+            archive = build_psp_archive(scratch_directory, products=1, files_per_product=2, variable_count=2,
+                                        record_count=10)
+
+        with ArchiveServer(archive) as server:
+            file_dictionary = PspFileParser.get_dictionary_of_files(server.url + "/pub/data/psp/isois/epihi/l2/")
+
+        self.assertEqual({"mode0/": ["psp_isois-epihi_l2-mode0_20240101_v13.cdf",
+                                     "psp_isois-epihi_l2-mode0_20240102_v13.cdf"]},
+                         {mode: [file_info.name for file_info in file_infos]
+                          for mode, file_infos in file_dictionary.items()})
+
+    def test_serves_imap_queries_and_cdf_ranges(self):
+        with tempfile.TemporaryDirectory() as scratch_directory:
+            archive = build_imap_archive(scratch_directory, products=2, files_per_product=3, variable_count=4,
+                                         record_count=10)
+
+        with ArchiveServer(archive) as server:
+            records = httpx.get(server.url + "/query", params={"instrument": "codice"}).json()
+            with CdfMetadataDownloader.get_cdf_metadata(server.url + "/download/" + records[-1]["file_path"]) as cdf:
+                cdf_file_info = CdfParser.parse_cdf(cdf, DefaultVariableSelector)
+
+        self.assertEqual(["20240101", "20240102", "20240103"], [record["start_date"] for record in records])
+        self.assertEqual("imap_codice_l3_synthetic-1", cdf_file_info.global_info.logical_source)
+        self.assertEqual(["flux_3", "value_0", "value_1", "value_2"],
+                         [variable_info.variable_name for variable_info in cdf_file_info.variable_infos])
+
+    def test_keep_alive_requests_are_not_delayed_by_nagle(self):
+        with tempfile.TemporaryDirectory() as scratch_directory:
+            archive = build_imap_archive(scratch_directory, products=1, files_per_product=1, variable_count=2,
+                                         record_count=10)
+
+        with ArchiveServer(archive) as server, httpx.Client() as client:
+            file_url = server.url + next(iter(archive.files))
+            client.get(file_url)
+            started_at = time.perf_counter()
+            for _ in range(10):
+                client.get(file_url, headers={"Range": "bytes=0-99"})
+            seconds = time.perf_counter() - started_at
+
+        # a delayed ACK would hold each response back by about 40 ms
+        self.assertLess(seconds, 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import re
+import threading
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+import httpx
+
+import test
+from data_indexer.cdf_downloader.cdf_metadata_downloader import CdfMetadataDownloader, _RangeReader
+from data_indexer.cdf_parser.cdf_parser import CdfParser
+from data_indexer.cdf_parser.variable_selector.default_variable_selector import DefaultVariableSelector
+from data_indexer.cdf_parser.variable_selector.omni_variable_selector import OmniVariableSelector
+from data_indexer.http_client import RetryLater
+from data_indexer.spooled_download import Download, spool
+
+
+def fake_range_server(cdf_bytes: bytes, requested_ranges: list):
+    def download(url, headers=None):
+        range_match = re.fullmatch(r"bytes=(\d+)-(\d+)", (headers or {}).get("Range", ""))
+        if range_match is None:
+            requested_ranges.append((0, len(cdf_bytes)))
+            return whole_file_download(cdf_bytes)
+        start, end = int(range_match.group(1)), min(int(range_match.group(2)) + 1, len(cdf_bytes))
+        requested_ranges.append((start, end))
+        return Download(httpx.Response(206, content=cdf_bytes[start:end],
+                                       headers={"Content-Range": f"bytes {start}-{end - 1}/{len(cdf_bytes)}"}))
+
+    return download
+
+
+def whole_file_download(content: bytes) -> Download:
+    return Download(httpx.Response(200), spool([content], len(content)))
+
+
+class TestCdfMetadataDownloader(TestCase):
+    def test_header_only_fetch_parses_like_full_file(self):
+        cases = [("test.cdf", DefaultVariableSelector),
+                 ("omni2_h0_mrg1hr_20240101_v01.cdf", OmniVariableSelector)]
+        for filename, selector in cases:
+            with self.subTest(filename):
+                cdf_bytes = (Path(test.__file__).parent / 'test_data' / filename).read_bytes()
+                requested_ranges = []
+                with patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once',
+                           side_effect=fake_range_server(cdf_bytes, requested_ranges)), \
+                        patch('data_indexer.cdf_downloader.cdf_metadata_downloader.SMALL_CDF_BYTES', 0), \
+                        CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf") as sparse_cdf:
+                    self.assertEqual(len(cdf_bytes), sparse_cdf.size)
+                    self.assertLess(sum(end - start for start, end in requested_ranges), len(cdf_bytes))
+                    self.assertEqual(CdfParser.parse_cdf_bytes(cdf_bytes, selector),
+                                     CdfParser.parse_sparse_cdf(sparse_cdf, selector))
+
+    def test_skips_variable_index_and_data_records(self):
+        cdf_bytes = (Path(test.__file__).parent / 'test_data/omni2_h0_mrg1hr_20240101_v01.cdf').read_bytes()
+        requested_ranges = []
+        with patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once',
+                   side_effect=fake_range_server(cdf_bytes, requested_ranges)), \
+                CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf"):
+            pass
+
+        self.assertEqual(4, len(requested_ranges))
+        self.assertLess(sum(end - start for start, end in requested_ranges), len(cdf_bytes) / 5)
+
+    def test_fetches_the_rest_of_a_small_file_in_one_request(self):
+        cdf_bytes = (Path(test.__file__).parent / 'test_data/test.cdf').read_bytes()
+        requested_ranges = []
+        with patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once',
+                   side_effect=fake_range_server(cdf_bytes, requested_ranges)), \
+                CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf") as sparse_cdf:
+            self.assertEqual(CdfParser.parse_cdf_bytes(cdf_bytes, DefaultVariableSelector),
+                             CdfParser.parse_sparse_cdf(sparse_cdf, DefaultVariableSelector))
+
+        self.assertEqual([(0, 65536), (65536, len(cdf_bytes))], requested_ranges)
+
+    def test_downloads_whole_file_when_header_records_need_too_many_rounds(self):
+        cdf_bytes = (Path(test.__file__).parent / 'test_data/omni2_h0_mrg1hr_20240101_v01.cdf').read_bytes()
+        requested_ranges = []
+        with patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once',
+                   side_effect=fake_range_server(cdf_bytes, requested_ranges)), \
+                patch('data_indexer.cdf_downloader.cdf_metadata_downloader.MAX_RANGE_ROUNDS', 1), \
+                CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf") as cdf_file:
+            self.assertEqual(3, len(requested_ranges))
+            self.assertEqual((0, len(cdf_bytes)), requested_ranges[-1])
+            self.assertEqual(CdfParser.parse_cdf_bytes(cdf_bytes, OmniVariableSelector),
+                             CdfParser.parse_cdf(cdf_file, OmniVariableSelector))
+
+    def test_downloads_whole_file_when_a_round_needs_too_many_ranges(self):
+        cdf_bytes = (Path(test.__file__).parent / 'test_data/omni2_h0_mrg1hr_20240101_v01.cdf').read_bytes()
+        requested_ranges = []
+        with patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once',
+                   side_effect=fake_range_server(cdf_bytes, requested_ranges)), \
+                patch('data_indexer.cdf_downloader.cdf_metadata_downloader.MAX_RANGES_PER_ROUND', 0), \
+                CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf"):
+            pass
+
+        self.assertEqual([(0, 65536), (0, len(cdf_bytes))], requested_ranges)
+
+    def test_fetches_the_ranges_of_a_round_concurrently(self):
+        cdf_bytes = bytes(range(256)) * 1024
+        both_ranges_requested = threading.Barrier(2, timeout=5)
+
+        def download(url, headers=None):
+            both_ranges_requested.wait()
+            return fake_range_server(cdf_bytes, [])(url, headers)
+
+        reader = _RangeReader("http://example.com/file.cdf", len(cdf_bytes), cdf_bytes[:10])
+        with patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once', side_effect=download):
+            reader.fetch([(100_000, 100_010), (200_000, 200_010)])
+
+        self.assertEqual(cdf_bytes[200_000:200_010], reader.read(200_000, 10))
+
+    @patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once')
+    def test_uses_spooled_whole_file_when_server_ignores_range(self, mock_download_once):
+        mock_download_once.return_value = whole_file_download(b'whole file')
+
+        with CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf") as cdf_file:
+            self.assertEqual(b'whole file', cdf_file.read())
+
+        self.assertTrue(cdf_file.closed)
+        self.assertEqual(1, mock_download_once.call_count)
+
+    @patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once')
+    def test_uses_spooled_whole_file_when_server_ignores_a_later_range(self, mock_download_once):
+        cdf_bytes = (Path(test.__file__).parent / 'test_data/test.cdf').read_bytes()
+        mock_download_once.side_effect = [
+            Download(httpx.Response(206, content=cdf_bytes[:16],
+                                    headers={"Content-Range": f"bytes 0-15/{len(cdf_bytes)}"})),
+            whole_file_download(cdf_bytes),
+        ]
+
+        with CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf") as cdf_file:
+            self.assertEqual(cdf_bytes, cdf_file.read())
+
+        self.assertEqual(2, mock_download_once.call_count)
+
+    @patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once')
+    def test_downloads_whole_file_when_cdf_is_compressed(self, mock_download_once):
+        compressed_cdf = bytes.fromhex("cdf30001cccc0001") + b'compressed records'
+        mock_download_once.side_effect = [
+            Download(httpx.Response(206, content=compressed_cdf[:16], headers={"Content-Range": "bytes 0-15/26"})),
+            whole_file_download(compressed_cdf),
+        ]
+
+        with CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf") as cdf_file:
+            self.assertEqual(compressed_cdf, cdf_file.read())
+        self.assertEqual({"Range": "bytes=0-65535"}, mock_download_once.call_args_list[0].kwargs["headers"])
+        self.assertEqual((("http://example.com/file.cdf",), {}), mock_download_once.call_args_list[1])
+
+    @patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once')
+    def test_raises_http_error_when_the_file_cannot_be_fetched(self, mock_download_once):
+        request = httpx.Request('GET', "http://example.com/file.cdf")
+        mock_download_once.return_value = Download(httpx.Response(404, content=b'not found', request=request))
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            with CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf"):
+                pass
+
+    @patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once')
+    def test_downloads_whole_file_when_a_later_range_is_refused(self, mock_download_once):
+        cdf_bytes = (Path(test.__file__).parent / 'test_data/test.cdf').read_bytes()
+        mock_download_once.side_effect = [
+            Download(httpx.Response(206, content=cdf_bytes[:16],
+                                    headers={"Content-Range": f"bytes 0-15/{len(cdf_bytes)}"})),
+            Download(httpx.Response(416)),
+            whole_file_download(cdf_bytes),
+        ]
+
+        with CdfMetadataDownloader.get_cdf_metadata("http://example.com/file.cdf") as cdf_file:
+            self.assertEqual(cdf_bytes, cdf_file.read())
+
+        self.assertEqual((("http://example.com/file.cdf",), {}), mock_download_once.call_args_list[2])
+
+    def test_closes_whole_files_already_received_when_another_range_must_be_retried(self):
+        whole_file = whole_file_download(b'whole file')
+        received_whole_file = threading.Event()
+
+        def download(url, headers=None):
+            if headers["Range"].startswith("bytes=100000-"):
+                received_whole_file.set()
+                return whole_file
+            received_whole_file.wait()
+            raise RetryLater(url, reason="HTTP 503")
+
+        reader = _RangeReader("http://example.com/file.cdf", 300_000, b'cdf header')
+        with patch('data_indexer.cdf_downloader.cdf_metadata_downloader.download_once', side_effect=download):
+            with self.assertRaises(RetryLater):
+                reader.fetch([(100_000, 100_010), (200_000, 200_010)])
+
+        self.assertTrue(whole_file.file.file.closed)
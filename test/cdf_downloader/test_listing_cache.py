@@ -0,0 +1,55 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import httpx
+
+from data_indexer.cdf_downloader.listing_cache import ListingCache
+from data_indexer.cdf_downloader.listing_parser import ListingEntry
+
+
+class TestListingCache(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.cache_path = str(Path(self.temp_dir.name) / 'listings.json')
+
+    def test_returns_cached_entries_when_listing_is_not_modified(self):
+        cache = ListingCache(self.cache_path)
+        url = "https://url.site/l2/2019/"
+        entries = [ListingEntry("file_1.cdf", "file_1.cdf", "2019-01-02 03:04", "1.2M"),
+                   ListingEntry("file_2.cdf", "file_2.cdf", "2019-01-03 03:04", "1.3M")]
+
+        self.assertIsNone(cache.conditional_headers(url))
+        self.assertIsNone(cache.get_entries(url, httpx.Response(200, text="<html/>")))
+        cache.put(url, httpx.Response(200, headers={'ETag': '"abc"', 'Last-Modified': 'yesterday'}), entries)
+
+        self.assertEqual({'If-None-Match': '"abc"', 'If-Modified-Since': 'yesterday'}, cache.conditional_headers(url))
+        self.assertEqual(entries, cache.get_entries(url, httpx.Response(304)))
+        self.assertIsNone(cache.get_entries(url, httpx.Response(200, text="<html/>")))
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+
+    def test_does_not_keep_listings_without_validators(self):
+        cache = ListingCache(self.cache_path)
+        url = "https://url.site/l2/"
+        cache.put(url, httpx.Response(200, headers={'ETag': '"abc"'}), [ListingEntry("2019/", "2019/")])
+        cache.put(url, httpx.Response(200), [ListingEntry("2019/", "2019/"), ListingEntry("2020/", "2020/")])
+
+        self.assertIsNone(cache.conditional_headers(url))
+
+    def test_persists_listings(self):
+        cache = ListingCache(self.cache_path)
+        entries = [ListingEntry("2019/", "2019/", "2023-01-02 10:00", "-")]
+        cache.put("https://url.site/l2/", httpx.Response(200, headers={'ETag': '"abc"'}), entries)
+        cache.save()
+
+        reloaded_cache = ListingCache(self.cache_path)
+
+        self.assertEqual({'If-None-Match': '"abc"'}, reloaded_cache.conditional_headers("https://url.site/l2/"))
+        self.assertEqual(entries, reloaded_cache.get_entries("https://url.site/l2/", httpx.Response(304)))
+
+    def test_fetches_listings_saved_without_entry_columns_again(self):
+        Path(self.cache_path).write_text('{"https://url.site/l2/": {"etag": "\\"abc\\"", "last_modified": null, '
+                                         '"links": [["2019/", "2019/"]]}}')
+
+        self.assertIsNone(ListingCache(self.cache_path).conditional_headers("https://url.site/l2/"))
@@ -0,0 +1,68 @@
+import asyncio
+from pathlib import Path
+from unittest import TestCase
+
+from data_indexer.cdf_downloader.listing_parser import extract_listing_entries, ListingEntry, ListingLinkExtractor, \
+    read_listing_entries
+
+APACHE_LISTING = '''<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">
+<html><body><h1>Index of /pub/data/psp/isois/epihi/l2/het_rate_1/2022</h1>
+<table>
+<tr><th valign="top"><img src="/icons/blank.gif" alt="[ICO]"></th><th><a href="?C=N;O=D">Name</a></th>
+<th><a href="?C=M;O=A">Last modified</a></th><th><a href="?C=S;O=A">Size</a></th></tr>
+<tr><th colspan="4"><hr></th></tr>
+<tr><td valign="top"><img src="/icons/back.gif" alt="[PARENTDIR]"></td><td><a href="/pub/data/">Parent Directory</a></td>
+<td>&nbsp;</td><td align="right">  - </td></tr>
+<tr><td valign="top"><img src="/icons/unknown.gif" alt="[   ]"></td>
+<td><a href="psp_isois-epihi_l2-het-rate1_20220928_v13.cdf">psp_isois-epihi_l2-het-rate1_20220928_v13.cdf</a></td>
+<td align="right">2022-04-26 02:15  </td><td align="right">1.2M</td></tr>
+<tr><td valign="top"><img src="/icons/folder.gif" alt="[DIR]"></td><td><a href="a&amp;b/">a&amp;b/</a></td>
+<td align="right">2023-01-02 10:00  </td><td align="right">  - </td></tr>
+<tr><th colspan="4"><hr></th></tr>
+</table></body></html>'''
+
+
+class TestListingParser(TestCase):
+    def test_extracts_links_with_last_modified_and_size_skipping_parent_directory(self):
+        self.assertEqual([ListingEntry("psp_isois-epihi_l2-het-rate1_20220928_v13.cdf",
+                                       "psp_isois-epihi_l2-het-rate1_20220928_v13.cdf", "2022-04-26 02:15", "1.2M"),
+                          ListingEntry("a&b/", "a&b/", "2023-01-02 10:00", "-")],
+                         list(extract_listing_entries([APACHE_LISTING])))
+
+    def test_gives_same_entries_for_any_chunking(self):
+        expected_entries = list(extract_listing_entries([APACHE_LISTING]))
+
+        for chunk_size in (1, 7, 64, 1000):
+            chunks = [APACHE_LISTING[start:start + chunk_size] for start in range(0, len(APACHE_LISTING), chunk_size)]
+            self.assertEqual(expected_entries, list(extract_listing_entries(chunks)), chunk_size)
+
+    def test_reads_entries_from_a_streaming_listing(self):
+        async def chunks():
+            for start in range(0, len(APACHE_LISTING), 64):
+                yield APACHE_LISTING[start:start + 64]
+
+        self.assertEqual(list(extract_listing_entries([APACHE_LISTING])), asyncio.run(read_listing_entries(chunks())))
+
+    def test_yields_entries_as_soon_as_their_row_is_complete(self):
+        extractor = ListingLinkExtractor()
+
+        first_row_entries = list(extractor.feed('<table><tr><td><a href="x.cdf">x.cdf</a></td><td>2024-01-01</td></tr>'
+                                                '<tr><td><a href="y'))
+
+        self.assertEqual([ListingEntry("x.cdf", "x.cdf", "2024-01-01")], first_row_entries)
+        self.assertEqual([ListingEntry("y.cdf", "y.cdf")], list(extractor.feed('.cdf">y.cdf</a>')) +
+                         list(extractor.close()))
+
+    def test_only_links_directly_inside_table_cells_count(self):
+        html = '<a href="top">top</a><table><tr><td><a href="parent">Parent</a></td></tr>' \
+               '<tr><td><b><a href="nested">nested</a></b></td></tr>' \
+               '<tr><td><a href="direct"><b>bold</b> text</a></td></tr></table>'
+
+        self.assertEqual([ListingEntry("direct", "bold text")], list(extract_listing_entries([html])))
+
+    def test_matches_mock_cdaweb_listings(self):
+        html = (Path(__file__).parent / 'mock_html' / '2022_rate2.html').read_text()
+
+        self.assertEqual(["psp_isois-epihi_l2-het-rate2_20220928_v13.cdf",
+                          "psp_isois-epihi_l2-het-rate2_20220929_v13.cdf"],
+                         [entry.href for entry in extract_listing_entries([html])])
@@ -1,5 +1,5 @@
 from unittest import TestCase
-from unittest.mock import patch, Mock, call
+from unittest.mock import patch
 
 from data_indexer.cdf_downloader.psp_downloader import PspDownloader, PspDirectoryInfo, psp_isois_cda_base_url, \
     psp_fields_cda_base_url, omni_cda_base_url, FileCadence
@@ -9,46 +9,48 @@ from data_indexer.cdf_parser.variable_selector.multi_dimension_variable_selector
 from data_indexer.cdf_parser.variable_selector.omni_variable_selector import OmniVariableSelector
 from data_indexer.file_cadence.daily_file_cadence import DailyFileCadence
 from data_indexer.file_cadence.six_month_file_cadence import SixMonthFileCadence
+from data_indexer.sharding import Shard
 
 
 class TestPspDownloader(TestCase):
     @patch('data_indexer.cdf_downloader.psp_downloader.PspFileParser')
     def test_download_psp_data_from_cda_web(self, mock_psp_file_parser: PspFileParser):
-        epihi_filenames = {"het_rate_1/": [PspFileInfo("psp_isois-epihi_l2-het-rate1_20220928_v13.cdf", "name", "1998"),
-                                           PspFileInfo("psp_isois-epihi_l2-het-rate1_20220929_v13.cdf", "name",
+        epihi_filenames = {"het_rate_1/": [PspFileInfo("psp_isois-epihi_l2-het-rate1_20220928_v13.cdf", "name_19980101_v01.cdf", "1998"),
+                                           PspFileInfo("psp_isois-epihi_l2-het-rate1_20220929_v13.cdf", "name_19990101_v01.cdf",
                                                        "1999")],
-                           "het_rate_2/": [PspFileInfo("psp_isois-epihi_l2-het-rate2_20220928_v13.cdf", "name", "2000"),
-                                           PspFileInfo("psp_isois-epihi_l2-het-rate2_20220929_v13.cdf", "name",
+                           "het_rate_2/": [PspFileInfo("psp_isois-epihi_l2-het-rate2_20220928_v13.cdf", "name_20000101_v01.cdf", "2000"),
+                                           PspFileInfo("psp_isois-epihi_l2-het-rate2_20220929_v13.cdf", "name_20010101_v01.cdf",
                                                        "2001")]}
 
-        epilo_filenames = {"ic": [PspFileInfo("epilo_1.cdf", "name5", "2002"),
-                                  PspFileInfo("epilo_2.cdf", "name6", "2003")], }
+        epilo_filenames = {"ic": [PspFileInfo("epilo_1.cdf", "name5_20020101_v01.cdf", "2002"),
+                                  PspFileInfo("epilo_2.cdf", "name6_20030101_v01.cdf", "2003")], }
 
-        merged_filenames = {"summary": [PspFileInfo("summary_1.cdf", "name7", "2004")]}
+        merged_filenames = {"summary": [PspFileInfo("summary_1.cdf", "name7_20040101_v01.cdf", "2004")]}
 
         fields_4_per_cycle_filenames = {"": [
             PspFileInfo("psp_fld_l2_mag_rtn_4_sa_per_cyc_20230101_v02.cdf",
-                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20230101_v02", "2023"),
+                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20230101_v02.cdf", "2023"),
             PspFileInfo("psp_fld_l2_mag_rtn_4_sa_per_cyc_20230102_v02.cdf",
-                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20230102_v02", "2023"),
+                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20230102_v02.cdf", "2023"),
             PspFileInfo("psp_fld_l2_mag_rtn_4_sa_per_cyc_20220101_v02.cdf",
-                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20220101_v02", "2022"),
+                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20220101_v02.cdf", "2022"),
             PspFileInfo("psp_fld_l2_mag_rtn_4_sa_per_cyc_20220102_v02.cdf",
-                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20220102_v02", "2022"),
+                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20220102_v02.cdf", "2022"),
             PspFileInfo("psp_fld_l2_mag_rtn_4_sa_per_cyc_20210101_v02.cdf",
-                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20210101_v02", "2021")
+                        "psp_fld_l2_mag_rtn_4_sa_per_cyc_20210101_v02.cdf", "2021")
         ]}
 
         fields_1min_filenames = {"": [
-            PspFileInfo("psp_fld_l2_mag_rtn_1min_20230101_v02.cdf", "psp_fld_l2_mag_rtn_1min_20230101_v02", "2023"),
+            PspFileInfo("psp_fld_l2_mag_rtn_1min_20230101_v02.cdf", "psp_fld_l2_mag_rtn_1min_20230101_v02.cdf", "2023"),
         ]}
 
         omni_filenames = {"": [
-            PspFileInfo("omni2_h0_mrg1hr_20240101_v01.cdf", "omni2_h0_mrg1hr_20240101_v01", "2024"),
+            PspFileInfo("omni2_h0_mrg1hr_20240101_v01.cdf", "omni2_h0_mrg1hr_20240101_v01.cdf", "2024"),
         ]}
 
-        mock_psp_file_parser.get_dictionary_of_files.side_effect = [
-            epihi_filenames, epilo_filenames, merged_filenames, fields_4_per_cycle_filenames, fields_1min_filenames, omni_filenames]
+        mock_psp_file_parser.get_dictionaries_of_files.return_value = [
+            epihi_filenames, epilo_filenames, merged_filenames, fields_4_per_cycle_filenames, fields_1min_filenames,
+            omni_filenames]
 
         metadata = PspDownloader.get_all_metadata()
 
@@ -66,32 +68,21 @@ class TestPspDownloader(TestCase):
         ]
 
         self.assertEqual(expected_metadata, metadata)
-        mock_psp_file_parser.get_dictionary_of_files.assert_any_call('https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois'
-                                                                     '/epihi/l2/')
-        mock_psp_file_parser.get_dictionary_of_files.assert_any_call(
-            'https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois/epilo/l2/')
-        mock_psp_file_parser.get_dictionary_of_files.assert_any_call(
-            'https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois/merged/l2/')
-        mock_psp_file_parser.get_dictionary_of_files.assert_any_call(
-            'https://cdaweb.gsfc.nasa.gov/pub/data/psp/fields/l2/mag_rtn_4_per_cycle/', top_level_link="")
-        mock_psp_file_parser.get_dictionary_of_files.assert_any_call(
-            'https://cdaweb.gsfc.nasa.gov/pub/data/psp/fields/l2/mag_rtn_1min/', top_level_link="")
-        mock_psp_file_parser.get_dictionary_of_files.assert_any_call(
-            'https://cdaweb.gsfc.nasa.gov/pub/data/omni/omni_cdaweb/hourly/', top_level_link="")
+        mock_psp_file_parser.get_dictionaries_of_files.assert_called_once_with([
+            ('https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois/epihi/l2/', None),
+            ('https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois/epilo/l2/', None),
+            ('https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois/merged/l2/', None),
+            ('https://cdaweb.gsfc.nasa.gov/pub/data/psp/fields/l2/mag_rtn_4_per_cycle/', ''),
+            ('https://cdaweb.gsfc.nasa.gov/pub/data/psp/fields/l2/mag_rtn_1min/', ''),
+            ('https://cdaweb.gsfc.nasa.gov/pub/data/omni/omni_cdaweb/hourly/', ''),
+        ])
 
-    @patch('data_indexer.cdf_downloader.psp_downloader.get_with_retry')
-    def test_download_individual_file(self, mock_get_with_retry):
-        mock_file_download_response = Mock()
-        mock_file_download_response.content = b'This is a PSP file'
-        mock_get_with_retry.return_value = mock_file_download_response
+    @patch('data_indexer.cdf_downloader.psp_downloader.PspFileParser')
+    def test_crawls_only_the_data_sets_of_the_shard(self, mock_psp_file_parser):
+        mock_psp_file_parser.get_dictionaries_of_files.return_value = [{}, {}, {}]
 
-        response = PspDownloader.get_cdf_file(psp_isois_cda_base_url, "psp_isois-epihi_l2-het-rate1_20220928_v13.cdf",
-                                              "epihi", "het-rate1/",
-                                              "2022")
+        metadata = PspDownloader.get_all_metadata(Shard(1, 2))
 
-        self.assertEqual([call(
-            "https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois/epihi/l2/het-rate1/2022/psp_isois-epihi_l2-het-rate1_20220928_v13.cdf")],
-            mock_get_with_retry.call_args_list)
-        self.assertEqual({
-            "link": "https://cdaweb.gsfc.nasa.gov/pub/data/psp/isois/epihi/l2/het-rate1/2022/psp_isois-epihi_l2-het-rate1_20220928_v13.cdf",
-            "data": b'This is a PSP file'}, response)
+        self.assertEqual(['epilo', 'mag_rtn_4_per_cycle', 'hourly'], [info.instrument_url for info in metadata])
+        self.assertEqual([1, 3, 5], [info.position for info in metadata])
+        self.assertEqual(3, len(mock_psp_file_parser.get_dictionaries_of_files.call_args.args[0]))
@@ -1,13 +1,26 @@
+import asyncio
+import tempfile
+from datetime import datetime, timezone
 from pathlib import Path
 from unittest import TestCase
-from unittest.mock import patch, call, MagicMock
+from unittest.mock import patch, call, ANY
 
-from data_indexer.cdf_downloader.psp_file_parser import PspFileParser, PspFileInfo
+import httpx
+
+from data_indexer.cdf_downloader.psp_file_parser import PspFileParser, PspFileInfo, enable_listing_cache
+from data_indexer.http_client import HostLimits
+
+
+def serve(responses):
+    async def stream_with_retry(_client, url, read_body, headers, limiter):
+        response = responses(url)
+        return response, await read_body(response) if response.status_code == 200 else None
+    return stream_with_retry
 
 
 class TestPspFileParser(TestCase):
-    @patch('data_indexer.cdf_downloader.psp_file_parser.get_with_retry')
-    def test_retrieves_list_of_files_for_types(self, mock_get_with_retry):
+    @patch('data_indexer.cdf_downloader.psp_file_parser.async_stream_with_retry')
+    def test_retrieves_list_of_files_for_types(self, mock_stream_with_retry):
         mock_html_folder_path = Path(__file__).parent / 'mock_html/'
         file_path = mock_html_folder_path / 'l2.html'
         with open(file_path, 'r') as file:
@@ -32,33 +45,20 @@ class TestPspFileParser(TestCase):
         with open(file_path, 'r') as file:
             twentythree_html = file.read()
 
-        mock_l2_response = MagicMock()
-        mock_l2_response.__enter__.return_value = l2_html
-        mock_l2_response.text = l2_html
-        mock_het_rate_1_response = MagicMock()
-        mock_het_rate_1_response.text = het_rate_1_html
-        mock_het_rate_2_response = MagicMock()
-        mock_het_rate_2_response.text = het_rate_2_html
-        mock_2022_response = MagicMock()
-        mock_2022_response.text = twentytwo_html
-        mock_2022_r2_response = MagicMock()
-        mock_2022_r2_response.text = twentytwo_r2_html
-        mock_2023_response = MagicMock()
-        mock_2023_response.text = twentythree_html
-
-        mock_get_with_retry.side_effect = [mock_l2_response, mock_het_rate_1_response, mock_2022_response,
-                                               mock_het_rate_2_response, mock_2022_r2_response, mock_2023_response]
+        responses = {
+            "https://url.site/l2/": httpx.Response(200, text=l2_html),
+            "https://url.site/l2/het_rate_1/": httpx.Response(200, text=het_rate_1_html),
+            "https://url.site/l2/het_rate_1/2022/": httpx.Response(200, text=twentytwo_html),
+            "https://url.site/l2/het_rate_2/": httpx.Response(200, text=het_rate_2_html),
+            "https://url.site/l2/het_rate_2/2022_rate2/": httpx.Response(200, text=twentytwo_r2_html),
+            "https://url.site/l2/het_rate_2/2023/": httpx.Response(200, text=twentythree_html),
+        }
+        mock_stream_with_retry.side_effect = serve(responses.get)
 
         file_dictionary = PspFileParser.get_dictionary_of_files("https://url.site/l2/")
 
-        mock_get_with_retry.assert_has_calls([
-            call("https://url.site/l2/"),
-            call("https://url.site/l2/het_rate_1/"),
-            call("https://url.site/l2/het_rate_1/2022/"),
-            call("https://url.site/l2/het_rate_2/"),
-            call("https://url.site/l2/het_rate_2/2022_rate2/"),
-            call("https://url.site/l2/het_rate_2/2023/"),
-        ])
+        self.assertCountEqual([call(ANY, url, ANY, headers=None, limiter=ANY) for url in responses],
+                              mock_stream_with_retry.call_args_list)
 
         expected_file_dictionary = {
             "het_rate_1/": [
@@ -79,3 +79,116 @@ class TestPspFileParser(TestCase):
         }
 
         self.assertEqual(expected_file_dictionary, file_dictionary)
+
+    @patch('data_indexer.cdf_downloader.psp_file_parser.async_stream_with_retry')
+    def test_limits_concurrent_requests_per_host(self, mock_stream_with_retry):
+        directory_rows = "".join(f'<tr><td><a href="{year}/">{year}/</a></td></tr>' for year in range(2018, 2026))
+        top_level_html = f'<table><tr><td><a href="/">Parent Directory</a></td></tr>{directory_rows}</table>'
+        year_html = '<table><tr><td><a href="/">Parent Directory</a></td></tr>' \
+                    '<tr><td><a href="file_20200101_v01.cdf">file_20200101_v01.cdf</a></td></tr></table>'
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_stream(_client, url, read_body, headers, limiter):
+            nonlocal in_flight, max_in_flight
+            async with limiter.limit(url):
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+            response = httpx.Response(200, text=top_level_html if url == "https://url.site/l2/" else year_html)
+            return response, await read_body(response)
+
+        mock_stream_with_retry.side_effect = fake_stream
+
+        with patch('data_indexer.http_client.host_limits', HostLimits()):
+            file_dictionary = PspFileParser.get_dictionary_of_files("https://url.site/l2/", max_requests_per_host=3)
+
+        self.assertEqual(3, max_in_flight)
+        self.assertEqual([f"{year}/" for year in range(2018, 2026)], list(file_dictionary.keys()))
+        self.assertEqual([[PspFileInfo("file_20200101_v01.cdf", "file_20200101_v01.cdf", str(year))]
+                          for year in range(2018, 2026)], list(file_dictionary.values()))
+
+    @patch('data_indexer.cdf_downloader.psp_file_parser.async_stream_with_retry')
+    def test_reuses_parsed_listing_when_directory_is_not_modified(self, mock_stream_with_retry):
+        year_html = '<table><tr><td><a href="/">Parent Directory</a></td></tr>' \
+                    '<tr><td><a href="file_20200101_v01.cdf">file_20200101_v01.cdf</a></td>' \
+                    '<td>2020-01-02 03:04</td><td>1.2M</td></tr></table>'
+        responses = [httpx.Response(200, text=year_html, headers={'ETag': '"2020"'}), httpx.Response(304)]
+        mock_stream_with_retry.side_effect = serve(lambda url: responses.pop(0))
+        expected_file_dictionary = {None: [PspFileInfo("file_20200101_v01.cdf", "file_20200101_v01.cdf", "2020")]}
+
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch('data_indexer.cdf_downloader.psp_file_parser.listing_cache', None):
+            enable_listing_cache(str(Path(temp_dir) / 'listings.json'))
+            first_crawl = PspFileParser.get_dictionary_of_files("https://url.site/l2/2020/")
+            enable_listing_cache(str(Path(temp_dir) / 'listings.json'))
+            second_crawl = PspFileParser.get_dictionary_of_files("https://url.site/l2/2020/")
+
+        self.assertEqual(expected_file_dictionary, first_crawl)
+        self.assertEqual(expected_file_dictionary, second_crawl)
+        self.assertEqual([("2020-01-02 03:04", "1.2M")] * 2,
+                         [(crawl[None][0].last_modified, crawl[None][0].size) for crawl in (first_crawl, second_crawl)])
+        self.assertEqual([call(ANY, "https://url.site/l2/2020/", ANY, headers=None, limiter=ANY),
+                          call(ANY, "https://url.site/l2/2020/", ANY, headers={'If-None-Match': '"2020"'},
+                               limiter=ANY)],
+                         mock_stream_with_retry.call_args_list)
+
+    @patch('data_indexer.cdf_downloader.psp_file_parser.async_stream_with_retry')
+    def test_skips_cdf_files_with_unexpected_names(self, mock_stream_with_retry):
+        year_html = '<table><tr><td><a href="/">Parent Directory</a></td></tr>' \
+                    '<tr><td><a href="file_20200101_v01.cdf">file_20200101_v01.cdf</a></td></tr>' \
+                    '<tr><td><a href="file_latest.cdf">file_latest.cdf</a></td></tr></table>'
+        mock_stream_with_retry.side_effect = serve(lambda url: httpx.Response(200, text=year_html))
+
+        file_dictionary = PspFileParser.get_dictionary_of_files("https://url.site/l2/2020/")
+
+        self.assertEqual({None: [PspFileInfo("file_20200101_v01.cdf", "file_20200101_v01.cdf", "2020")]},
+                         file_dictionary)
+
+
+    @patch('data_indexer.cdf_downloader.psp_file_parser.async_stream_with_retry')
+    def test_crawls_several_directories_in_one_event_loop_sharing_the_request_limit(self, mock_stream_with_retry):
+        year_html = '<table><tr><td><a href="/">Parent Directory</a></td></tr>' \
+                    '<tr><td><a href="file_20200101_v01.cdf">file_20200101_v01.cdf</a></td></tr></table>'
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_stream(_client, url, read_body, headers, limiter):
+            nonlocal in_flight, max_in_flight
+            async with limiter.limit(url):
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+            response = httpx.Response(200, text=year_html)
+            return response, await read_body(response)
+
+        mock_stream_with_retry.side_effect = fake_stream
+        directories = [(f"https://url.site/{data_set}/2020/", None) for data_set in ("epihi", "epilo", "merged")] + \
+                      [("https://url.site/mag/2020/", '')]
+
+        with patch('data_indexer.http_client.host_limits', HostLimits()), \
+                patch('data_indexer.cdf_downloader.psp_file_parser.asyncio.run', wraps=asyncio.run) as mock_run:
+            dictionaries = PspFileParser.get_dictionaries_of_files(directories, max_requests_per_host=2)
+
+        file_info = PspFileInfo("file_20200101_v01.cdf", "file_20200101_v01.cdf", "2020")
+        self.assertEqual([{None: [file_info]}] * 3 + [{'': [file_info]}], dictionaries)
+        self.assertEqual(1, mock_run.call_count)
+        self.assertEqual(2, max_in_flight)
+        self.assertEqual(1, len({stream_call.args[0] for stream_call in mock_stream_with_retry.call_args_list}))
+
+class TestPspFileInfo(TestCase):
+    def test_parses_version_and_start_date_from_name(self):
+        file_info = PspFileInfo("link", "psp_isois-epihi_l2-het-rates3600_20190102_v10.cdf", "2019")
+
+        self.assertEqual(10, file_info.version)
+        self.assertEqual(datetime(2019, 1, 2, tzinfo=timezone.utc), file_info.start_date)
+        self.assertEqual(PspFileInfo("link", "psp_isois-epihi_l2-het-rates3600_20190102_v10.cdf", "2019"), file_info)
+
+    def test_rejects_names_without_date_and_version(self):
+        for name in ["psp_isois_l2-summary_v10.cdf", "psp_isois_l2-summary_20191302_v10.cdf",
+                     "psp_isois_l2-summary_20190102_v10.txt"]:
+            with self.subTest(name):
+                with self.assertRaises(ValueError):
+                    PspFileInfo("link", name, "2019")
@@ -1,28 +1,34 @@
-import os
+import ctypes
+import io
 import unittest
+from pathlib import Path
 from unittest.mock import patch, Mock
 
-from data_indexer.cdf_parser.cdf_parser import CdfParser, CdfFileInfo
+import spacepy.pycdf
+
+import test
+from data_indexer.cdf_parser.cdf_parser import CdfParser, CdfFileInfo, SparseCdf
+from data_indexer.cdf_parser.variable_selector.default_variable_selector import DefaultVariableSelector
 
 
 class TestCdfParser(unittest.TestCase):
 
-    @patch('data_indexer.cdf_parser.cdf_parser.tempfile.TemporaryDirectory')
+    @patch('data_indexer.cdf_parser.cdf_parser.tempfile')
     @patch('data_indexer.cdf_parser.cdf_parser.CdfGlobalParser')
     @patch('data_indexer.cdf_parser.cdf_parser.CdfVariableParser')
     @patch('data_indexer.cdf_parser.cdf_parser.pycdf')
     def test_parses_global_info_and_variable_info(self, mock_pycdf, mock_variable_parser, mock_global_parser,
-                                                  mock_temp_directory):
-        mock_temp_directory_name = './test_data_for_cdf_parser/'
-        os.makedirs(mock_temp_directory_name, exist_ok=True)
-        mock_temp_directory.return_value.__enter__.return_value = mock_temp_directory_name
+                                                  mock_tempfile):
+        opened_file_contents = []
 
-        mock_cdf = mock_pycdf.CDF.return_value.__enter__.return_value
+        def read_cdf_path(path):
+            with open(path, 'rb') as f:
+                opened_file_contents.append(f.read())
+            return mock_pycdf.CDF.return_value
 
-        expected_temp_file_name = './test_data_for_cdf_parser/temp.cdf'
+        mock_pycdf.CDF.side_effect = read_cdf_path
+        mock_cdf = mock_pycdf.CDF.return_value.__enter__.return_value
 
-        self.assertTrue(os.path.isdir(mock_temp_directory_name))
-        self.assertFalse(os.path.exists(expected_temp_file_name))
         mock_cdf_bytes = b'cdf bytes'
         mock_variable_selector = Mock()
 
@@ -32,16 +38,50 @@ class TestCdfParser(unittest.TestCase):
         self.assertIs(mock_global_parser.parse_global_variables_from_cdf.return_value, output.global_info)
         self.assertIs(mock_variable_parser.parse_info_from_cdf.return_value, output.variable_infos)
 
-        with open(expected_temp_file_name, 'rb') as f:
-            temp_file_contents = f.read()
-        self.assertEqual(mock_cdf_bytes, temp_file_contents)
-        mock_pycdf.CDF.assert_called_with(expected_temp_file_name)
+        self.assertEqual([mock_cdf_bytes], opened_file_contents)
+        self.assertTrue(mock_pycdf.CDF.call_args.args[0].startswith('/proc/self/fd/'))
+        self.assertEqual([], mock_tempfile.mock_calls)
 
         mock_global_parser.parse_global_variables_from_cdf.assert_called_with(mock_cdf)
         mock_variable_parser.parse_info_from_cdf.assert_called_with(mock_cdf, mock_variable_selector)
 
-        os.remove(expected_temp_file_name)
-        os.removedirs(mock_temp_directory_name)
+    def test_parses_cdf_from_any_supported_source(self):
+        cdf_path = Path(test.__file__).parent / 'test_data/test.cdf'
+        cdf_bytes = cdf_path.read_bytes()
+        expected = CdfParser.parse_cdf(cdf_bytes, DefaultVariableSelector)
+
+        with open(cdf_path, 'rb') as open_file:
+            sources = [
+                ('memoryview', memoryview(cdf_bytes)),
+                ('bytearray', bytearray(cdf_bytes)),
+                ('in-memory file', io.BytesIO(cdf_bytes)),
+                ('open file on disk', open_file),
+                ('sparse cdf', SparseCdf(len(cdf_bytes), [(0, cdf_bytes[:1000]), (1000, cdf_bytes[1000:])])),
+            ]
+            for name, source in sources:
+                with self.subTest(name):
+                    self.assertEqual(expected, CdfParser.parse_cdf(source, DefaultVariableSelector))
+
+    def test_opens_sparse_cdfs_without_file_validation_and_restores_it(self):
+        cdf_bytes = (Path(test.__file__).parent / 'test_data/test.cdf').read_bytes()
+        # only the header records, as CdfMetadataDownloader would fetch them: without the variable index and data
+        # records the CDF library's validation rejects the file
+        header_records = SparseCdf(len(cdf_bytes), [(0, cdf_bytes[:65536])])
+        library = spacepy.pycdf.lib._library
+        library.CDFgetValidate.restype = ctypes.c_long
+
+        output = CdfParser.parse_sparse_cdf(header_records, DefaultVariableSelector)
+
+        self.assertEqual(CdfParser.parse_cdf(cdf_bytes, DefaultVariableSelector), output)
+        self.assertNotEqual(0, library.CDFgetValidate())
+
+    @patch('data_indexer.cdf_parser.cdf_parser.PROC_FD_DIRECTORY', '/nonexistent')
+    def test_falls_back_to_named_scratch_file_without_proc_file_descriptors(self):
+        cdf_bytes = (Path(test.__file__).parent / 'test_data/test.cdf').read_bytes()
+
+        output = CdfParser.parse_cdf(cdf_bytes, DefaultVariableSelector)
+
+        self.assertEqual("psp_isois_l2-ephem", output.global_info.logical_source)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,56 @@
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, Mock
+
+from spacepy import pycdf
+
+import test
+from data_indexer.cdf_parser.cdf_snapshot import AttributeSnapshot, CdfSnapshot
+
+
+class TestCdfSnapshot(unittest.TestCase):
+    def test_attribute_snapshot_reads_each_attribute_once(self):
+        attributes = MagicMock()
+        attributes.__getitem__.side_effect = {"VAR_TYPE": "data"}.__getitem__
+
+        snapshot = AttributeSnapshot(attributes)
+
+        self.assertEqual("data", snapshot["VAR_TYPE"])
+        self.assertEqual("data", snapshot.get("VAR_TYPE"))
+        self.assertIn("VAR_TYPE", snapshot)
+        self.assertNotIn("SCALETYP", snapshot)
+        self.assertEqual("linear", snapshot.get("SCALETYP", "linear"))
+        with self.assertRaises(KeyError):
+            snapshot["SCALETYP"]
+        self.assertEqual(2, attributes.__getitem__.call_count)
+
+    def test_variables_are_wrapped_once_per_file(self):
+        epoch = Mock(attrs={"UNITS": "ns"})
+        data = Mock(attrs={"DEPEND_0": "Epoch"}, shape=(10,))
+        data.type.return_value = pycdf.const.CDF_DOUBLE.value
+        cdf = MagicMock()
+        cdf.items.return_value = [("Epoch", epoch), ("data", data)]
+        cdf.__getitem__.side_effect = {"Epoch": epoch, "data": data}.__getitem__
+
+        snapshot = CdfSnapshot(cdf)
+        variables = dict(snapshot.items())
+
+        self.assertIs(variables["Epoch"], snapshot["Epoch"])
+        self.assertEqual("ns", snapshot["Epoch"].attrs["UNITS"])
+        self.assertEqual((10,), variables["data"].shape)
+        self.assertEqual(pycdf.const.CDF_DOUBLE.value, variables["data"].type())
+        self.assertEqual(pycdf.const.CDF_DOUBLE.value, variables["data"].type())
+        cdf.__getitem__.assert_not_called()
+        data.type.assert_called_once()
+
+    def test_snapshot_matches_the_cdf_it_wraps(self):
+        cdf_path = str(Path(test.__file__).parent / 'test_data/test.cdf')
+        with pycdf.CDF(cdf_path) as cdf:
+            snapshot = CdfSnapshot(cdf)
+            for name, var in snapshot.items():
+                self.assertEqual(cdf[name].shape, var.shape)
+                self.assertEqual(cdf[name].type(), var.type())
+                for attribute in ["VAR_TYPE", "DISPLAY_TYPE", "DEPEND_0", "SCALETYP", "UNITS"]:
+                    self.assertEqual(attribute in cdf[name].attrs, attribute in var.attrs)
+                    self.assertEqual(cdf[name].attrs.get(attribute), var.attrs.get(attribute))
+            self.assertEqual(str(cdf.attrs["Logical_source"]), str(snapshot.attrs["Logical_source"]))
@@ -1,7 +1,10 @@
 import unittest
 from datetime import datetime, timezone, timedelta
 
+import numpy as np
+
 from data_indexer.file_cadence.carrington_file_cadence import CarringtonFileCadence
+from data_indexer.file_cadence.file_cadence import to_datetime64, from_datetime64
 
 
 class TestCarringtonFileCadence(unittest.TestCase):
@@ -36,3 +39,21 @@ class TestCarringtonFileCadence(unittest.TestCase):
 
                 difference_between_ends = actual_end - expected_end
                 self.assertLess(abs(difference_between_ends), timedelta(hours=2))
+
+    def test_get_file_time_ranges_matches_single_file_ranges(self):
+        cadence = CarringtonFileCadence()
+        times = [datetime(1853, 10, 13, tzinfo=timezone.utc), datetime(2025, 6, 19, tzinfo=timezone.utc),
+                 datetime(2025, 7, 16, 16, tzinfo=timezone.utc), datetime(2025, 7, 16, 18, tzinfo=timezone.utc)]
+
+        start_times, end_times = cadence.get_file_time_ranges(to_datetime64(times))
+
+        self.assertEqual([cadence.get_file_time_range(t) for t in times],
+                         list(zip(from_datetime64(start_times), from_datetime64(end_times))))
+
+    def test_get_file_time_ranges_with_cr(self):
+        cadence = CarringtonFileCadence()
+
+        start_times, end_times = cadence.get_file_time_ranges_with_cr(np.array([0, 2292, 2299]))
+
+        self.assertEqual([cadence.get_file_time_range_with_cr(cr) for cr in [0, 2292, 2299]],
+                         list(zip(from_datetime64(start_times), from_datetime64(end_times))))
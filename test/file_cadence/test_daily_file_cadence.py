@@ -1,7 +1,10 @@
 from datetime import datetime
 from unittest import TestCase
 
+import numpy as np
+
 from data_indexer.file_cadence.daily_file_cadence import DailyFileCadence
+from data_indexer.file_cadence.file_cadence import to_datetime64
 
 
 class TestDailyFileCadence(TestCase):
@@ -14,3 +17,11 @@ class TestDailyFileCadence(TestCase):
         for time, expected_range in cases:
             with self.subTest(time):
                 self.assertEqual(expected_range, DailyFileCadence().get_file_time_range(time))
+
+    def test_get_file_time_ranges(self):
+        times = to_datetime64([datetime(2023, 12, 1, 0, 0, 0), datetime(2023, 12, 31, 12, 0, 0)])
+
+        start_times, end_times = DailyFileCadence().get_file_time_ranges(times)
+
+        np.testing.assert_array_equal(to_datetime64([datetime(2023, 12, 1), datetime(2023, 12, 31)]), start_times)
+        np.testing.assert_array_equal(to_datetime64([datetime(2023, 12, 2), datetime(2024, 1, 1)]), end_times)
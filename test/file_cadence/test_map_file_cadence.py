@@ -1,6 +1,9 @@
 import unittest
 from datetime import datetime, timezone
 
+import numpy as np
+
+from data_indexer.file_cadence.file_cadence import to_datetime64, from_datetime64
 from data_indexer.file_cadence.map_file_cadence import MapFileCadence, BadFileNameException
 
 
@@ -36,3 +39,12 @@ class TestMapFileCadence(unittest.TestCase):
         with self.assertRaises(BadFileNameException) as context:
             MapFileCadence("bad")
         self.assertIn("Cannot parse map with cadence: bad", str(context.exception))
+
+    def test_get_file_time_ranges(self):
+        times = to_datetime64([datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 7, 1, tzinfo=timezone.utc)])
+
+        start_times, end_times = MapFileCadence("6mo").get_file_time_ranges(times)
+
+        np.testing.assert_array_equal(times, start_times)
+        self.assertEqual([datetime(2025, 7, 2, 15, tzinfo=timezone.utc), datetime(2025, 12, 30, 15, tzinfo=timezone.utc)],
+                         from_datetime64(end_times))
@@ -1,7 +1,10 @@
 from datetime import datetime
 from unittest import TestCase
 
+import numpy as np
 
+
+from data_indexer.file_cadence.file_cadence import to_datetime64
 from data_indexer.file_cadence.six_month_file_cadence import SixMonthFileCadence
 
 
@@ -17,3 +20,13 @@ class TestSixMonthFileCadence(TestCase):
         for time, expected_range in cases:
             with self.subTest(time):
                 self.assertEqual(expected_range, SixMonthFileCadence().get_file_time_range(time))
+
+    def test_get_file_time_ranges_matches_single_file_ranges(self):
+        times = [datetime(2023, 1, 1, 0, 0, 0), datetime(2023, 6, 30, 23, 59, 59, 999999),
+                 datetime(2020, 7, 1, 0, 0, 0), datetime(2020, 12, 31, 23, 59, 59, 999999)]
+        expected_ranges = [SixMonthFileCadence().get_file_time_range(time) for time in times]
+
+        start_times, end_times = SixMonthFileCadence().get_file_time_ranges(to_datetime64(times))
+
+        np.testing.assert_array_equal(to_datetime64([start for start, _ in expected_ranges]), start_times)
+        np.testing.assert_array_equal(to_datetime64([end for _, end in expected_ranges]), end_times)
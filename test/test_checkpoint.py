@@ -0,0 +1,62 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import Mock
+
+from data_indexer.checkpoint import CheckpointStore, checkpoint_key, run_with_checkpoint
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temporary_directory.name) / 'index_psp.v2'
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_resumed_store_returns_saved_entries_without_running_the_task(self):
+        key = checkpoint_key(["https://cdaweb/a_20240101_v01.cdf", "https://cdaweb/a_20240102_v01.cdf"])
+        skipped_key = checkpoint_key(["https://cdaweb/b_20240101_v01.cdf"])
+        CheckpointStore(str(self.directory)).run(key, lambda: {"logical_source": "a"})
+        CheckpointStore(str(self.directory), resume=True).run(skipped_key, lambda: None)
+
+        task = Mock()
+        resumed = CheckpointStore(str(self.directory), resume=True)
+
+        self.assertEqual({"logical_source": "a"}, resumed.run(key, task))
+        self.assertIsNone(resumed.run(skipped_key, task))
+        task.assert_not_called()
+
+    def test_new_run_discards_checkpoints_of_the_previous_run(self):
+        key = checkpoint_key(["https://cdaweb/a_20240101_v01.cdf"])
+        CheckpointStore(str(self.directory)).run(key, lambda: {"logical_source": "old"})
+
+        store = CheckpointStore(str(self.directory))
+
+        self.assertEqual({"logical_source": "new"}, store.run(key, lambda: {"logical_source": "new"}))
+
+    def test_product_with_changed_files_is_indexed_again(self):
+        old_key = checkpoint_key(["https://cdaweb/a_20240101_v01.cdf"])
+        new_key = checkpoint_key(["https://cdaweb/a_20240101_v02.cdf"])
+        CheckpointStore(str(self.directory)).run(old_key, lambda: {"version": "01"})
+
+        store = CheckpointStore(str(self.directory), resume=True)
+
+        self.assertEqual({"version": "02"}, store.run(new_key, lambda: {"version": "02"}))
+
+    def test_failed_task_is_not_checkpointed(self):
+        key = checkpoint_key(["https://cdaweb/a_20240101_v01.cdf"])
+        store = CheckpointStore(str(self.directory))
+        with self.assertRaises(ConnectionError):
+            store.run(key, Mock(side_effect=ConnectionError))
+
+        self.assertEqual([], list(self.directory.iterdir()))
+        store.remove_all()
+        self.assertFalse(self.directory.exists())
+
+    def test_runs_task_directly_without_store(self):
+        self.assertEqual({"logical_source": "a"}, run_with_checkpoint(None, "key", lambda: {"logical_source": "a"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
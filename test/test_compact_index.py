@@ -0,0 +1,65 @@
+import json
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from data_indexer.compact_index import encode_file_timeranges, decode_file_timeranges, encode_index_entry, \
+    decode_index
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def daily_file(day: datetime, version: str = "001", descriptor: str = "proton-sw") -> dict:
+    return {"start_time": day.isoformat(), "end_time": (day + timedelta(days=1)).isoformat(),
+            "url": f"https://example.com/imap/swapi/l3a/{day:%Y}/{day:%m}/imap_swapi_l3a_{descriptor}_{day:%Y%m%d}_v{version}.cdf"}
+
+
+class TestCompactIndex(unittest.TestCase):
+    def test_collapses_contiguous_daily_runs(self):
+        first_day = datetime(2025, 1, 30, tzinfo=timezone.utc)
+        file_timeranges = [daily_file(first_day + timedelta(days=i)) for i in range(5)]
+        file_timeranges += [daily_file(first_day + timedelta(days=10), "002"),
+                            daily_file(first_day + timedelta(days=11), "003")]
+
+        encoded = encode_file_timeranges(file_timeranges)
+
+        self.assertEqual({"url_templates": ["https://example.com/imap/swapi/l3a/{year}/{month}/"
+                                            "imap_swapi_l3a_proton-sw_{date}_v{version}.cdf"],
+                          "files": [[0, "20250130", 5, "001"], [0, "20250209", 2, ["002", "003"]]]},
+                         encoded)
+        self.assertEqual(file_timeranges, decode_file_timeranges(encoded))
+
+    def test_keeps_explicit_times_for_non_daily_files_and_literal_urls(self):
+        file_timeranges = [
+            {"start_time": "2024-12-10T12:59:28.319992+00:00", "end_time": "2025-01-06T19:35:54.239992+00:00",
+             "url": "https://example.com/imap/glows/l3d/1947/01/imap_glows_l3d_solar-params_19470101-cr2292_v000.cdf"},
+            {"start_time": "2025-01-01T00:00:00+00:00", "end_time": "2025-01-02T00:00:00+00:00",
+             "url": "https://example.com/files/not-templated.cdf"},
+        ]
+
+        encoded = encode_file_timeranges(file_timeranges)
+
+        self.assertEqual(["https://example.com/imap/glows/l3d/{year}/{month}/"
+                          "imap_glows_l3d_solar-params_{date}-cr2292_v{version}.cdf",
+                          "https://example.com/files/not-templated.cdf"], encoded["url_templates"])
+        self.assertEqual(file_timeranges, decode_file_timeranges(encoded))
+
+    def test_preserves_order_of_unsorted_files(self):
+        day = datetime(2025, 3, 1, tzinfo=timezone.utc)
+        file_timeranges = [daily_file(day + timedelta(days=1)), daily_file(day),
+                           daily_file(day, descriptor="alpha-sw"), daily_file(day + timedelta(days=2))]
+
+        self.assertEqual(file_timeranges, decode_file_timeranges(encode_file_timeranges(file_timeranges)))
+
+    def test_round_trips_published_imap_index(self):
+        with open(os.path.join(REPOSITORY_ROOT, 'index_imap.v2.json')) as index_file:
+            index = json.load(index_file)
+
+        compact_index = [encode_index_entry(entry) for entry in index]
+
+        self.assertEqual(index, decode_index(compact_index))
+        self.assertLess(len(json.dumps(compact_index)), len(json.dumps(index)))
+
+
+if __name__ == '__main__':
+    unittest.main()
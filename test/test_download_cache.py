@@ -0,0 +1,178 @@
+import tempfile
+import unittest
+from unittest.mock import Mock, call, patch
+
+import httpx
+
+from data_indexer import download_cache
+from data_indexer.download_cache import DownloadCache, FLUSH_EVERY_CHANGES
+from data_indexer.spooled_download import Download, spool
+
+
+def response(status_code: int, content: bytes = b'', headers: dict = None) -> httpx.Response:
+    return httpx.Response(status_code, content=content, headers=headers,
+                          request=httpx.Request('GET', 'http://example.com'))
+
+
+class TestDownloadCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_revalidates_cached_download_and_reuses_bytes_on_not_modified(self):
+        cache = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        send = Mock(side_effect=[response(200, b'cdf bytes', {'ETag': '"abc"', 'Last-Modified': 'yesterday'}),
+                                 response(304)])
+
+        first = cache.get("http://example.com/file.cdf", None, send)
+        second = cache.get("http://example.com/file.cdf", None, send)
+
+        self.assertEqual(b'cdf bytes', first.content)
+        self.assertEqual(200, second.status_code)
+        self.assertEqual(b'cdf bytes', second.content)
+        self.assertEqual('"abc"', second.headers['ETag'])
+        self.assertEqual([call(None), call({'If-None-Match': '"abc"', 'If-Modified-Since': 'yesterday'})],
+                         send.call_args_list)
+        self.assertEqual((1, 1, 9, 9), (cache.stats.hits, cache.stats.misses, cache.stats.bytes_from_cache,
+                                        cache.stats.bytes_downloaded))
+
+    def test_caches_range_requests_separately(self):
+        cache = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        send = Mock(side_effect=[response(206, b'head', {'ETag': '"abc"', 'Content-Range': 'bytes 0-3/100'}),
+                                 response(200, b'whole file', {'ETag': '"abc"'}),
+                                 response(304)])
+
+        cache.get("http://example.com/file.cdf", {'Range': 'bytes=0-3'}, send)
+        cache.get("http://example.com/file.cdf", None, send)
+        cached_range = cache.get("http://example.com/file.cdf", {'Range': 'bytes=0-3'}, send)
+
+        self.assertEqual(206, cached_range.status_code)
+        self.assertEqual(b'head', cached_range.content)
+        self.assertEqual('bytes 0-3/100', cached_range.headers['Content-Range'])
+        self.assertEqual({'Range': 'bytes=0-3', 'If-None-Match': '"abc"'}, send.call_args_list[2].args[0])
+
+    def test_replaces_entry_when_server_returns_new_content(self):
+        cache = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        send = Mock(side_effect=[response(200, b'old', {'ETag': '"v1"'}),
+                                 response(200, b'new', {'ETag': '"v2"'}),
+                                 response(304)])
+
+        cache.get("http://example.com/file.cdf", None, send)
+        cache.get("http://example.com/file.cdf", None, send)
+        latest = cache.get("http://example.com/file.cdf", None, send)
+
+        self.assertEqual(b'new', latest.content)
+        self.assertEqual({'If-None-Match': '"v2"'}, send.call_args_list[2].args[0])
+
+    def test_does_not_cache_responses_without_validators(self):
+        cache = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        send = Mock(side_effect=[response(200, b'data'), response(200, b'data')])
+
+        cache.get("http://example.com/file.cdf", None, send)
+        cache.get("http://example.com/file.cdf", None, send)
+
+        self.assertEqual([call(None), call(None)], send.call_args_list)
+        self.assertEqual(0, cache.total_bytes)
+
+    def test_evicts_least_recently_used_entries_over_budget(self):
+        cache = DownloadCache(self.temp_dir.name, max_bytes=10)
+        send = Mock(side_effect=[response(200, b'aaaa', {'ETag': 'a'}),
+                                 response(200, b'bbbb', {'ETag': 'b'}),
+                                 response(304),
+                                 response(200, b'cccc', {'ETag': 'c'}),
+                                 response(200, b'bbbb', {'ETag': 'b'})])
+
+        cache.get("http://example.com/a", None, send)
+        cache.get("http://example.com/b", None, send)
+        cache.get("http://example.com/a", None, send)
+        cache.get("http://example.com/c", None, send)
+        cache.get("http://example.com/b", None, send)
+
+        self.assertEqual(None, send.call_args_list[4].args[0])
+        self.assertEqual(2, cache.stats.evictions)
+        self.assertLessEqual(cache.total_bytes, 10)
+
+    def test_persists_entries_between_runs(self):
+        first_run = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        first_run.get("http://example.com/file.cdf", None, Mock(return_value=response(200, b'cdf', {'ETag': 'x'})))
+        first_run.flush()
+
+        second_run = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        cached = second_run.get("http://example.com/file.cdf", None, Mock(return_value=response(304)))
+
+        self.assertEqual(b'cdf', cached.content)
+        self.assertEqual(1, second_run.stats.hits)
+
+    def test_keeps_entries_written_by_other_processes_sharing_the_directory(self):
+        first_worker = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        second_worker = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        first_worker.get("http://example.com/a", None, Mock(return_value=response(200, b'aaa', {'ETag': 'a'})))
+        second_worker.get("http://example.com/b", None, Mock(return_value=response(200, b'bbb', {'ETag': 'b'})))
+        first_worker.flush()
+        second_worker.flush()
+
+        next_run = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        send = Mock(return_value=response(304))
+        next_run.get("http://example.com/a", None, send)
+        next_run.get("http://example.com/b", None, send)
+
+        self.assertEqual(2, next_run.stats.hits)
+
+    def test_stores_spooled_downloads_and_hands_out_cached_whole_files_on_disk(self):
+        cache = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        send = Mock(side_effect=[Download(response(200, headers={'ETag': '"abc"'}), spool([b'cdf ', b'bytes'], 9)),
+                                 Download(response(304))])
+
+        with cache.get_download("http://example.com/file.cdf", None, send).file as downloaded_file:
+            self.assertEqual(b'cdf bytes', downloaded_file.file.read())
+        with patch('data_indexer.spooled_download.hashlib') as mock_hashlib:
+            cached = cache.get_download("http://example.com/file.cdf", None, send)
+
+            with cached.file as cached_file:
+                self.assertFalse(cached_file.in_memory)
+                self.assertEqual(b'cdf bytes', cached_file.file.read())
+                self.assertEqual(downloaded_file.sha256, cached_file.sha256)
+        mock_hashlib.sha256.assert_not_called()
+        self.assertEqual(200, cached.response.status_code)
+        self.assertEqual((1, 1, 9, 9), (cache.stats.hits, cache.stats.misses, cache.stats.bytes_from_cache,
+                                        cache.stats.bytes_downloaded))
+        self.assertEqual(b'cdf bytes', cache.get("http://example.com/file.cdf", None,
+                                                 Mock(return_value=response(304))).content)
+
+    def test_downloads_again_when_the_cached_file_changed_size(self):
+        cache = DownloadCache(self.temp_dir.name, max_bytes=1000)
+        send = Mock(side_effect=[Download(response(200, headers={'ETag': '"abc"'}), spool([b'cdf bytes'], 9)),
+                                 Download(response(304)),
+                                 Download(response(200, headers={'ETag': '"abc"'}), spool([b'cdf bytes'], 9))])
+        cache.get_download("http://example.com/file.cdf", None, send).file.close()
+        blob = next(path for path in cache.directory.iterdir() if len(path.name) == 64)
+        blob.write_bytes(b'cdf')
+
+        with cache.get_download("http://example.com/file.cdf", None, send).file as downloaded_file:
+            self.assertEqual(b'cdf bytes', downloaded_file.file.read())
+        self.assertEqual([call(None), call({'If-None-Match': '"abc"'}), call(None)], send.call_args_list)
+        self.assertEqual((0, 2), (cache.stats.hits, cache.stats.misses))
+
+    def test_writes_the_index_in_batches_for_many_entries(self):
+        cache = DownloadCache(self.temp_dir.name, max_bytes=10 ** 6)
+        entry_count = 4 * FLUSH_EVERY_CHANGES + 10
+        urls = [f"http://example.com/{i}.cdf" for i in range(entry_count)]
+
+        with patch.object(download_cache, 'atomic_write', wraps=download_cache.atomic_write) as atomic_write:
+            for i, url in enumerate(urls):
+                cache.get(url, None, Mock(return_value=response(200, b'cdf', {'ETag': str(i)})))
+            for url in urls:
+                cache.get(url, None, Mock(return_value=response(304)))
+            cache.flush()
+
+        index_writes = [write for write in atomic_write.call_args_list
+                        if write.args[0].name == download_cache.INDEX_FILENAME]
+        # one write per batch of changes instead of one per store and per hit
+        self.assertEqual(2 * entry_count // FLUSH_EVERY_CHANGES + 1, len(index_writes))
+        next_run = DownloadCache(self.temp_dir.name, max_bytes=10 ** 6)
+        self.assertEqual(3 * entry_count, next_run.total_bytes)
+        self.assertEqual(2 * entry_count, cache.stats.hits + cache.stats.misses)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,22 @@
+import asyncio
+import multiprocessing
+import pickle
+import time
 import unittest
-from unittest.mock import patch, call
+from unittest.mock import patch, call, AsyncMock, Mock
 
 import httpx
 
-from data_indexer.http_client import get_with_retry
+from data_indexer.http_client import get_with_retry, async_stream_with_retry, get_once, RetryLater, parse_retry_after, \
+    AdaptiveConcurrencyLimit, HostConcurrencyLimiter, HostLimits, download_once, BlockingHostConcurrencyLimiter, \
+    SharedAdaptiveConcurrencyLimit
 
 
 class TestHttpClient(unittest.TestCase):
+    @patch('data_indexer.http_client.random.random', return_value=0.0)
     @patch('data_indexer.http_client.time.sleep')
     @patch('data_indexer.http_client.http_client.get')
-    def test_retries(self, mock_get, mock_sleep):
+    def test_retries(self, mock_get, mock_sleep, _mock_random):
         url = "http://example.com"
         okay_response = httpx.Response(200)
         mock_get.side_effect = [
@@ -21,8 +28,8 @@ class TestHttpClient(unittest.TestCase):
 
         result = get_with_retry(url)
         self.assertIs(result, okay_response)
-        self.assertEqual(mock_get.call_args_list, [call(url, follow_redirects=True)]*4)
-        self.assertEqual(mock_sleep.call_args_list, [call(1), call(2), call(4)])
+        self.assertEqual(mock_get.call_args_list, [call(url, headers=None, follow_redirects=True)]*4)
+        self.assertEqual(mock_sleep.call_args_list, [call(0.5), call(1), call(2)])
 
 
     @patch('data_indexer.http_client.time.sleep')
@@ -41,7 +48,235 @@ class TestHttpClient(unittest.TestCase):
             get_with_retry(url, times=2)
 
         self.assertIs(expected_error, actual_error.exception)
-        self.assertEqual(mock_get.call_args_list, [call(url, follow_redirects=True)]*2)
+        self.assertEqual(mock_get.call_args_list, [call(url, headers=None, follow_redirects=True)]*2)
+
+    @patch('data_indexer.http_client.random.random', return_value=1.0)
+    @patch('data_indexer.http_client.asyncio.sleep')
+    def test_async_retries(self, mock_sleep, _mock_random):
+        url = "http://example.com/"
+        outcomes = [httpx.ConnectError("ack"), httpx.ConnectTimeout("timed out"), httpx.Response(200, text="listing")]
+        requests = []
+
+        def serve(request: httpx.Request) -> httpx.Response:
+            requests.append(str(request.url))
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        async def read_body(response: httpx.Response) -> str:
+            return "".join([chunk async for chunk in response.aiter_text()])
+
+        async def fetch():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(serve)) as client:
+                return await async_stream_with_retry(client, url, read_body)
+
+        response, body = asyncio.run(fetch())
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("listing", body)
+        self.assertEqual([url]*3, requests)
+        self.assertEqual(mock_sleep.call_args_list, [call(1), call(2)])
+
+    def test_async_stream_reads_other_bodies_without_read_body(self):
+        read_body = AsyncMock()
+
+        async def fetch():
+            transport = httpx.MockTransport(lambda request: httpx.Response(304, content=b'not modified'))
+            async with httpx.AsyncClient(transport=transport) as client:
+                return await async_stream_with_retry(client, "http://example.com/", read_body)
+
+        response, body = asyncio.run(fetch())
+
+        self.assertEqual((304, b'not modified', None), (response.status_code, response.content, body))
+        read_body.assert_not_called()
+
+    @patch('data_indexer.http_client.time.sleep')
+    @patch('data_indexer.http_client.http_client.get')
+    def test_honors_retry_after_and_returns_last_response_when_still_unavailable(self, mock_get, mock_sleep):
+        unavailable = httpx.Response(503, headers={'Retry-After': '7'})
+        mock_get.side_effect = [httpx.Response(429, headers={'Retry-After': '3'}), unavailable]
+
+        result = get_with_retry("http://example.com", times=2)
+
+        self.assertIs(unavailable, result)
+        mock_sleep.assert_called_once_with(3.0)
+
+    @patch('data_indexer.http_client.http_client.get')
+    def test_get_once_raises_retry_later_without_sleeping(self, mock_get):
+        mock_get.side_effect = [httpx.ConnectError("ack"), httpx.Response(503, headers={'Retry-After': '30'}),
+                                httpx.Response(404)]
+
+        with self.assertRaises(RetryLater) as transport_error:
+            get_once("http://example.com/a")
+        with self.assertRaises(RetryLater) as unavailable:
+            get_once("http://example.com/b")
+        not_found = get_once("http://example.com/c")
+
+        self.assertEqual(("http://example.com/a", None), (transport_error.exception.url,
+                                                          transport_error.exception.retry_after))
+        self.assertEqual(30.0, unavailable.exception.retry_after)
+        self.assertEqual(404, not_found.status_code)
+
+    def test_retry_later_survives_pickling_between_processes(self):
+        retry_later = pickle.loads(pickle.dumps(RetryLater("http://example.com", 3.0, "HTTP 429")))
+
+        self.assertEqual(("http://example.com", 3.0, "HTTP 429"),
+                         (retry_later.url, retry_later.retry_after, retry_later.reason))
+
+    def test_parse_retry_after(self):
+        self.assertEqual(120.0, parse_retry_after("120"))
+        self.assertEqual(0.0, parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+    @patch('data_indexer.http_client.download_cache')
+    @patch('data_indexer.http_client.http_client.get')
+    def test_routes_requests_through_download_cache_when_enabled(self, mock_get, mock_download_cache):
+        url = "http://example.com"
+        okay_response = httpx.Response(200)
+        mock_get.return_value = okay_response
+        mock_download_cache.get.side_effect = lambda _url, headers, send: send({**headers, 'If-None-Match': 'x'})
+
+        result = get_with_retry(url, headers={'Range': 'bytes=0-1'})
+
+        self.assertIs(okay_response, result)
+        mock_get.assert_called_once_with(url, headers={'Range': 'bytes=0-1', 'If-None-Match': 'x'},
+                                         follow_redirects=True)
+
+    def test_download_once_spools_whole_files_and_reads_other_bodies(self):
+        def serve(request: httpx.Request) -> httpx.Response:
+            if 'Range' in request.headers:
+                return httpx.Response(206, content=b'cdf', headers={'Content-Range': 'bytes 0-2/9'})
+            if request.url.path == '/busy':
+                return httpx.Response(503, content=b'try later')
+            return httpx.Response(200, content=b'cdf bytes')
+
+        with patch('data_indexer.http_client.http_client', httpx.Client(transport=httpx.MockTransport(serve))):
+            whole_file = download_once("http://example.com/file.cdf")
+            byte_range = download_once("http://example.com/file.cdf", headers={'Range': 'bytes=0-2'})
+            with self.assertRaises(RetryLater) as retry_later:
+                download_once("http://example.com/busy")
+
+        with whole_file.file as spooled_file:
+            self.assertEqual(b'cdf bytes', spooled_file.file.read())
+            self.assertEqual(9, whole_file.size)
+        self.assertIsNone(byte_range.file)
+        self.assertEqual(b'cdf', byte_range.response.content)
+        self.assertEqual(b'try later', retry_later.exception.response.content)
+
+    def test_download_once_reports_time_to_headers_rather_than_body_download_time(self):
+        def slow_body():
+            yield b'cdf '
+            time.sleep(0.2)
+            yield b'bytes'
+
+        limits = HostLimits()
+        limits['example.com'] = Mock(allowed_requests=4)
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=slow_body()))
+        with patch('data_indexer.http_client.http_client', httpx.Client(transport=transport)), \
+                patch('data_indexer.http_client.request_limiter', BlockingHostConcurrencyLimiter(limits=limits)):
+            with download_once("http://example.com/file.cdf").file as spooled_file:
+                self.assertEqual(b'cdf bytes', spooled_file.file.read())
+
+        latency = limits['example.com'].on_success.call_args.args[1]
+        self.assertLess(latency, 0.2)
+
+
+class TestAdaptiveConcurrencyLimit(unittest.TestCase):
+    def test_grows_about_one_request_per_full_window_of_fast_responses(self):
+        adaptive_limit = AdaptiveConcurrencyLimit(initial=2, maximum=3)
+
+        for _ in range(3):
+            adaptive_limit.on_success(started_at=0, latency=0.1, window_full=True)
+        self.assertEqual(3, adaptive_limit.allowed_requests)
+
+        for _ in range(10):
+            adaptive_limit.on_success(started_at=0, latency=0.1, window_full=True)
+        self.assertEqual(3, adaptive_limit.allowed_requests)
+
+    def test_does_not_grow_while_window_is_not_in_use(self):
+        adaptive_limit = AdaptiveConcurrencyLimit(initial=2)
+
+        for _ in range(10):
+            adaptive_limit.on_success(started_at=0, latency=0.1, window_full=False)
+
+        self.assertEqual(2, adaptive_limit.allowed_requests)
+
+    @patch('data_indexer.http_client.time.monotonic', return_value=10.0)
+    def test_halves_once_per_round_of_requests_on_overload(self, _mock_monotonic):
+        adaptive_limit = AdaptiveConcurrencyLimit(initial=8)
+
+        adaptive_limit.on_overload(started_at=5.0)
+        adaptive_limit.on_overload(started_at=6.0)
+        self.assertEqual(4, adaptive_limit.allowed_requests)
+
+        adaptive_limit.on_overload(started_at=10.0)
+        adaptive_limit.on_overload(started_at=10.0)
+        adaptive_limit.on_overload(started_at=10.0)
+        self.assertEqual(1, adaptive_limit.allowed_requests)
+
+    def test_latency_spike_shrinks_window(self):
+        adaptive_limit = AdaptiveConcurrencyLimit(initial=8)
+        for _ in range(5):
+            adaptive_limit.on_success(started_at=0, latency=0.1, window_full=False)
+
+        adaptive_limit.on_success(started_at=0, latency=0.2, window_full=False)
+        self.assertEqual(8, adaptive_limit.allowed_requests)
+
+        adaptive_limit.on_success(started_at=0, latency=1.0, window_full=False)
+        self.assertEqual(4, adaptive_limit.allowed_requests)
+
+    @patch('data_indexer.http_client.asyncio.sleep')
+    def test_async_requests_report_throttling_to_host_limit(self, _mock_sleep):
+        limits = HostLimits()
+        limiter = HostConcurrencyLimiter(limits=limits)
+        responses = [httpx.Response(429), httpx.Response(200)]
+
+        async def fetch():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0))) as client:
+                return await async_stream_with_retry(client, "http://example.com/data", AsyncMock(), limiter=limiter)
+
+        response, _ = asyncio.run(fetch())
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, limits["example.com"].allowed_requests)
+
+
+class TestSharedAdaptiveConcurrencyLimit(unittest.TestCase):
+    def test_overload_seen_by_one_process_shrinks_the_window_of_all(self):
+        shared_limit = SharedAdaptiveConcurrencyLimit(initial=8)
+        process = multiprocessing.get_context('fork').Process(target=shared_limit.on_overload, args=(time.monotonic(),))
+        process.start()
+        process.join()
+
+        self.assertEqual(4, shared_limit.allowed_requests)
+        shared_limit.on_success(started_at=0, latency=0.1, window_full=True)
+        self.assertEqual(0.1, shared_limit.typical_latency)
+
+    def test_requests_from_all_processes_count_against_the_shared_window(self):
+        limits = HostLimits()
+        shared_limit = limits.share("http://example.com/data")
+        shared_limit.window = 1.0
+        limiter = BlockingHostConcurrencyLimiter(limits=limits)
+        context = multiprocessing.get_context('fork')
+        request_sent, response_allowed = context.Event(), context.Event()
+
+        def send_request():
+            with limiter.limit("http://example.com/data"):
+                request_sent.set()
+                response_allowed.wait(5)
+
+        process = context.Process(target=send_request)
+        process.start()
+        request_sent.wait(5)
+        self.assertEqual(1, shared_limit.in_flight.count)
+        self.assertEqual({"example.com": shared_limit}, HostLimits(limits.shared))
+        response_allowed.set()
+        process.join()
+
+        with limiter.limit("http://example.com/data"):
+            self.assertEqual(1, shared_limit.in_flight.count)
+        self.assertEqual(0, shared_limit.in_flight.count)
 
 
 if __name__ == '__main__':
@@ -1,23 +1,32 @@
+import time
 import uuid
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import date, datetime, timezone
 from unittest import TestCase
 from unittest.mock import patch, call, Mock
+from urllib.parse import urlsplit
 
 import spacepy.pycdf.const
 from spacepy.pycdf import CDFError
 
+from data_indexer import http_client, spooled_download
 from data_indexer.cdf_parser.cdf_global_parser import CdfGlobalInfo
 from data_indexer.cdf_parser.cdf_parser import CdfFileInfo
 from data_indexer.cdf_parser.cdf_variable_parser import CdfVariableInfo
 from data_indexer.cdf_parser.variable_selector.default_variable_selector import DefaultVariableSelector
-from data_indexer.imap_data_processor import get_metadata_index, imap_dev_server
+from data_indexer.http_client import initialize_worker_process
+from data_indexer.imap_data_processor import get_metadata_index, imap_dev_server, query_l3_file_metadata, \
+    determine_start_and_end_for_files
+from data_indexer.incremental_index import PreviousIndex
+from data_indexer.sharding import Shard
 
 
 class TestImapDataProcessor(TestCase):
     @patch('data_indexer.imap_data_processor.CdfParser')
     @patch('data_indexer.imap_data_processor.imap_data_access.query')
-    @patch('data_indexer.imap_data_processor.get_with_retry')
-    def test_get_metadata_index(self, mock_get_with_retry, mock_data_access_query, mock_cdf_parser):
+    @patch('data_indexer.imap_data_processor.CdfMetadataDownloader.get_cdf_metadata')
+    def test_get_metadata_index(self, mock_get_cdf_metadata, mock_data_access_query, mock_cdf_parser):
         l3a_protons_data_product_v3 = 'fake-mission/fake-instrument/l3a/2025/06/fake-mission_fake-instrument_l3a_protons_20250606_v003.cdf'
         l3a_protons_data_product_v2_outdated = 'fake-mission/fake-instrument/l3a/2025/06/fake-mission_fake-instrument_l3a_protons_20250606_v002.cdf'
 
@@ -67,10 +76,10 @@ class TestImapDataProcessor(TestCase):
         third_cdf_response = Mock()
         fourth_cdf_response = Mock()
 
-        mock_get_with_retry.side_effect = [first_cdf_response, second_cdf_response, third_cdf_response,
-                                           fourth_cdf_response]
+        mock_get_cdf_metadata.side_effect = [nullcontext(first_cdf_response), nullcontext(second_cdf_response),
+                                             nullcontext(third_cdf_response), nullcontext(fourth_cdf_response)]
 
-        mock_cdf_parser.parse_cdf_bytes.side_effect = [
+        mock_cdf_parser.parse_cdf.side_effect = [
             CdfFileInfo(CdfGlobalInfo("fake-mission_fake-instrument_l3a_protons", "Parker Solar Probe Level 2 Summary",
                                       "1.27.0",
                                       date(2022, 11, 12)),
@@ -101,7 +110,7 @@ class TestImapDataProcessor(TestCase):
         l3a_pui_diff_instrument_product_url = imap_dev_server + f"download/{l3a_pui_diff_instrument_product}"
         l3b_pui_data_product_url = imap_dev_server + f"download/{l3b_pui_data_product}"
 
-        mock_get_with_retry.assert_has_calls([
+        mock_get_cdf_metadata.assert_has_calls([
             call(l3a_protons_data_product_v3_url),
             call(l3a_pui_data_product_20250607_v2_url),
             call(l3a_pui_diff_instrument_product_url),
@@ -209,20 +218,20 @@ class TestImapDataProcessor(TestCase):
             call(data_level="l3c"),
             call(data_level="l3d"),
             call(data_level="l3e"),
-        ])
+        ], any_order=True)
         self.assertEqual(expected_index, actual_index)
 
         self.assertEqual([
-            call(first_cdf_response.content, DefaultVariableSelector),
-            call(second_cdf_response.content, DefaultVariableSelector),
-            call(third_cdf_response.content, DefaultVariableSelector),
-            call(fourth_cdf_response.content, DefaultVariableSelector)],
-            mock_cdf_parser.parse_cdf_bytes.call_args_list)
+            call(first_cdf_response, DefaultVariableSelector),
+            call(second_cdf_response, DefaultVariableSelector),
+            call(third_cdf_response, DefaultVariableSelector),
+            call(fourth_cdf_response, DefaultVariableSelector)],
+            mock_cdf_parser.parse_cdf.call_args_list)
 
     @patch('data_indexer.imap_data_processor.CdfParser')
     @patch('data_indexer.imap_data_processor.imap_data_access.query')
-    @patch('data_indexer.imap_data_processor.get_with_retry')
-    def test_get_metadata_index_returns_instrument_names_correctly(self, _mock_get_with_retry, mock_data_access_query,
+    @patch('data_indexer.imap_data_processor.CdfMetadataDownloader.get_cdf_metadata')
+    def test_get_metadata_index_returns_instrument_names_correctly(self, _mock_get_cdf_metadata, mock_data_access_query,
                                                                    _):
         lowercase_instruments = ["codice", "glows", "hi", "hit", "idex", "lo", "mag", "swapi", "swe", "ultra", ]
         uppercase_instruments = [
@@ -272,9 +281,26 @@ class TestImapDataProcessor(TestCase):
         mock_data_access_query.assert_called()
         self.assertEqual([], actual_index)
 
+    @patch('data_indexer.imap_data_processor.get_index_entry_for_data_product')
+    @patch('data_indexer.imap_data_processor.imap_data_access.query')
+    def test_each_data_product_is_indexed_by_exactly_one_shard(self, mock_data_access_query,
+                                                               mock_get_index_entry_for_data_product):
+        mock_data_access_query.return_value = [
+            {'file_path': f'imap/swapi/l3a/2025/06/imap_swapi_l3a_product-{number}_20250606_v001.cdf',
+             'instrument': 'swapi', 'data_level': 'l3a', 'descriptor': f'product-{number}', 'start_date': '20250606',
+             'version': 'v001'} for number in range(20)]
+        mock_get_index_entry_for_data_product.side_effect = \
+            lambda data_product, *_: {"logical_source": data_product.descriptor}
+
+        indexed_per_shard = [get_metadata_index(shard=Shard(index, 3)) for index in range(3)]
+
+        all_indexed = [entry["logical_source"] for indexed in indexed_per_shard for entry in indexed]
+        self.assertCountEqual(set(all_indexed), all_indexed)
+        self.assertEqual({f'product-{number}' for number in range(20)}, set(all_indexed))
+
     @patch('data_indexer.imap_data_processor.CdfParser')
     @patch('data_indexer.imap_data_processor.imap_data_access.query')
-    @patch('data_indexer.imap_data_processor.get_with_retry')
+    @patch('data_indexer.imap_data_processor.CdfMetadataDownloader.get_cdf_metadata')
     def test_ignores_poorly_formatted_cdfs(self, _, mock_imap_query,
                                            mock_cdf_parser):
         expected_file_path_1 = 'fake-mission/fake-instrument/l3a/2025/06/fake-mission_fake-instrument_l3a_protons_20250606_v003.cdf'
@@ -291,7 +317,7 @@ class TestImapDataProcessor(TestCase):
                                          'version': 'v003', 'extension': 'cdf',
                                          'ingestion_date': '2024-11-21 21:09:59'}, ]
 
-        mock_cdf_parser.parse_cdf_bytes.side_effect = [CDFError(spacepy.pycdf.const.NOT_A_CDF_OR_NOT_SUPPORTED),
+        mock_cdf_parser.parse_cdf.side_effect = [CDFError(spacepy.pycdf.const.NOT_A_CDF_OR_NOT_SUPPORTED),
                                                        CdfFileInfo(
                                                            CdfGlobalInfo("fake-mission_fake-instrument_l3a_protons",
                                                                          "Parker Solar Probe Level 2 Summary",
@@ -306,7 +332,7 @@ class TestImapDataProcessor(TestCase):
 
     @patch('data_indexer.imap_data_processor.CdfParser')
     @patch('data_indexer.imap_data_processor.imap_data_access.query')
-    @patch('data_indexer.imap_data_processor.get_with_retry')
+    @patch('data_indexer.imap_data_processor.CdfMetadataDownloader.get_cdf_metadata')
     def test_handles_files_with_carrington_cadence(self, _, mock_imap_query,
                                                    mock_cdf_parser):
         glows_l3b_file_path = "some/path/on/server/imap_glows_l3b_glows-descriptor_20250101_v000.cdf"
@@ -332,7 +358,7 @@ class TestImapDataProcessor(TestCase):
                                          'version': 'v003', 'extension': 'cdf',
                                          'ingestion_date': '2024-11-21 21:09:59'}, ]
 
-        mock_cdf_parser.parse_cdf_bytes.side_effect = [CdfFileInfo(
+        mock_cdf_parser.parse_cdf.side_effect = [CdfFileInfo(
             CdfGlobalInfo("imap_glows_l3b_glows-descriptor",
                           "imap glows l3b glows-descriptor",
                           "v000",
@@ -401,7 +427,7 @@ class TestImapDataProcessor(TestCase):
 
     @patch('data_indexer.imap_data_processor.CdfParser')
     @patch('data_indexer.imap_data_processor.imap_data_access.query')
-    @patch('data_indexer.imap_data_processor.get_with_retry')
+    @patch('data_indexer.imap_data_processor.CdfMetadataDownloader.get_cdf_metadata')
     def test_handles_map_cadences(self, _, mock_imap_query,
                                                    mock_cdf_parser):
         hi_3month_file_path = "some/path/on/server/imap_hi_l3_intensity-3mo_20250101_v000.cdf"
@@ -428,7 +454,7 @@ class TestImapDataProcessor(TestCase):
                                          'ingestion_date': '2024-11-21 21:09:59'},
                                         ]
 
-        mock_cdf_parser.parse_cdf_bytes.side_effect = [CdfFileInfo(
+        mock_cdf_parser.parse_cdf.side_effect = [CdfFileInfo(
             CdfGlobalInfo("imap_hi_l3_intensity-3mo",
                           "imap hi l3 intensity-3mo",
                           "v000",
@@ -483,3 +509,107 @@ class TestImapDataProcessor(TestCase):
         ]
 
         self.assertEqual(expected_index, get_metadata_index())
+
+    @patch('data_indexer.imap_data_processor.CdfParser')
+    @patch('data_indexer.imap_data_processor.imap_data_access.query')
+    @patch('data_indexer.imap_data_processor.CdfMetadataDownloader.get_cdf_metadata')
+    def test_reuses_previous_index_entry_when_latest_file_is_unchanged(self, mock_get_cdf_metadata, mock_imap_query,
+                                                                       mock_cdf_parser):
+        unchanged_file_path = "some/path/imap_swapi_l3a_proton-sw_20250102_v001.cdf"
+        changed_file_path = "some/path/imap_swapi_l3a_alpha-sw_20250102_v002.cdf"
+        mock_imap_query.return_value = [
+            {'file_path': "some/path/imap_swapi_l3a_proton-sw_20250101_v001.cdf", 'instrument': 'swapi',
+             'data_level': 'l3a', 'descriptor': 'proton-sw', 'start_date': '20250101', 'version': 'v001'},
+            {'file_path': unchanged_file_path, 'instrument': 'swapi',
+             'data_level': 'l3a', 'descriptor': 'proton-sw', 'start_date': '20250102', 'version': 'v001'},
+            {'file_path': changed_file_path, 'instrument': 'swapi',
+             'data_level': 'l3a', 'descriptor': 'alpha-sw', 'start_date': '20250102', 'version': 'v002'},
+        ]
+        previous_entries = [
+            {"variables": [{'catalog_description': 'proton density', 'display_type': 'time_series',
+                            'variable_name': 'proton_density', 'units': 'cm^-3', 'axis_label': 'density'}],
+             "logical_source": "imap_swapi_l3a_proton-sw", "logical_source_description": "SWAPI protons",
+             "generation_date": "2025-01-03", "instrument": "SWAPI", "mission": "IMAP", "file_cadence": "daily",
+             "version": "",
+             "file_timeranges": [{"start_time": "2025-01-02T00:00:00+00:00", "end_time": "2025-01-03T00:00:00+00:00",
+                                  "url": imap_dev_server + "download/" + unchanged_file_path}]},
+            {"variables": [], "logical_source": "imap_swapi_l3a_alpha-sw", "logical_source_description": "old",
+             "generation_date": "2025-01-03", "instrument": "SWAPI", "mission": "IMAP", "file_cadence": "daily",
+             "version": "",
+             "file_timeranges": [{"start_time": "2025-01-02T00:00:00+00:00", "end_time": "2025-01-03T00:00:00+00:00",
+                                  "url": imap_dev_server + "download/some/path/imap_swapi_l3a_alpha-sw_20250102_v001.cdf"}]},
+        ]
+        mock_cdf_parser.parse_cdf.return_value = CdfFileInfo(
+            CdfGlobalInfo("imap_swapi_l3a_alpha-sw", "SWAPI alphas", "v002", date(2025, 1, 4)), [])
+
+        actual_index = get_metadata_index(PreviousIndex(previous_entries))
+
+        mock_get_cdf_metadata.assert_called_once_with(imap_dev_server + "download/" + changed_file_path)
+        self.assertEqual(previous_entries[0]["variables"], actual_index[0]["variables"])
+        self.assertEqual("2025-01-03", actual_index[0]["generation_date"])
+        self.assertEqual(2, len(actual_index[0]["file_timeranges"]))
+        self.assertEqual("SWAPI alphas", actual_index[1]["logical_source_description"])
+
+    @patch('data_indexer.imap_data_processor.ProcessPoolExecutor')
+    @patch('data_indexer.imap_data_processor.CdfParser')
+    @patch('data_indexer.imap_data_processor.imap_data_access.query')
+    @patch('data_indexer.imap_data_processor.CdfMetadataDownloader.get_cdf_metadata')
+    def test_parses_data_products_in_worker_pool_and_keeps_query_order(self, mock_get_cdf_metadata, mock_imap_query,
+                                                                       mock_cdf_parser, mock_process_pool):
+        mock_process_pool.side_effect = ThreadPoolExecutor
+        descriptors = ["alpha", "bravo", "charlie", "delta", "echo"]
+        mock_imap_query.return_value = [
+            {'file_path': f"some/path/imap_swapi_l3a_{descriptor}_20250101_v001.cdf", 'instrument': 'swapi',
+             'data_level': 'l3a', 'descriptor': descriptor, 'start_date': '20250101', 'version': 'v001'}
+            for descriptor in descriptors]
+        mock_get_cdf_metadata.side_effect = lambda url: nullcontext(url.split('_')[-3])
+
+        def parse_slowly_in_reverse_order(descriptor, _selector):
+            time.sleep(0.01 * (len(descriptors) - descriptors.index(descriptor)))
+            return CdfFileInfo(CdfGlobalInfo(descriptor, descriptor, "v001", date(2025, 1, 2)), [])
+
+        mock_cdf_parser.parse_cdf.side_effect = parse_slowly_in_reverse_order
+
+        actual_index = get_metadata_index(max_workers=3)
+
+        mock_process_pool.assert_called_once_with(max_workers=3, initializer=initialize_worker_process,
+                                                  initargs=(None, spooled_download.current_spool_settings(),
+                                                            http_client.host_limits.shared))
+        self.assertIn(urlsplit(imap_dev_server).netloc, http_client.host_limits.shared)
+        self.assertEqual(descriptors, [entry["logical_source"] for entry in actual_index])
+
+    @patch('data_indexer.imap_data_processor.imap_data_access.VALID_INSTRUMENTS', {'swapi', 'glows'})
+    @patch('data_indexer.imap_data_processor.imap_data_access.query')
+    def test_queries_can_be_split_by_instrument_and_keep_submission_order(self, mock_imap_query):
+        def query_later_data_levels_faster(**query_parameters):
+            time.sleep(0.01 / len(query_parameters["data_level"]))
+            return [query_parameters, query_parameters]
+
+        mock_imap_query.side_effect = query_later_data_levels_faster
+
+        results = list(query_l3_file_metadata(split_by_instrument=True))
+
+        expected_queries = [{"instrument": instrument, "data_level": data_level}
+                            for data_level in ["l3", "l3a", "l3b", "l3c", "l3d", "l3e"]
+                            for instrument in ["glows", "swapi"]]
+        self.assertEqual(12, mock_imap_query.call_count)
+        mock_imap_query.assert_has_calls([call(**query) for query in expected_queries], any_order=True)
+        self.assertEqual([query for query in expected_queries for _ in range(2)], results)
+
+    def test_determines_time_ranges_for_files_with_mixed_cadences(self):
+        files_metadata = [
+            {'instrument': 'glows', 'data_level': 'l3d', 'descriptor': 'solar-params', 'start_date': '19470101',
+             'cr': 2292},
+            {'instrument': 'glows', 'data_level': 'l3d', 'descriptor': 'solar-params', 'start_date': '20250101',
+             'cr': None},
+            {'instrument': 'glows', 'data_level': 'l3d', 'descriptor': 'solar-params', 'start_date': '20250102'},
+        ]
+
+        start_times, end_times, cadence = determine_start_and_end_for_files(files_metadata)
+
+        self.assertEqual([(datetime(2024, 12, 10, 12, 59, 28, 319992, tzinfo=timezone.utc),
+                           datetime(2025, 1, 6, 19, 35, 54, 239992, tzinfo=timezone.utc)),
+                          (datetime(2025, 1, 1, tzinfo=timezone.utc), datetime(2025, 1, 2, tzinfo=timezone.utc)),
+                          (datetime(2025, 1, 2, tzinfo=timezone.utc), datetime(2025, 1, 3, tzinfo=timezone.utc))],
+                         list(zip(start_times, end_times)))
+        self.assertEqual('daily', cadence.name)
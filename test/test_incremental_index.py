@@ -0,0 +1,58 @@
+import json
+import tempfile
+import unittest
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from data_indexer.cdf_parser.cdf_global_parser import CdfGlobalInfo
+from data_indexer.cdf_parser.cdf_parser import CdfFileInfo
+from data_indexer.cdf_parser.cdf_variable_parser import CdfVariableInfo
+from data_indexer.file_cadence.daily_file_cadence import DailyFileCadence
+from data_indexer.incremental_index import PreviousIndex
+from data_indexer.utils import get_index_entry, DataProductSource
+
+
+def index_entry(cdf_file_info: CdfFileInfo, urls: list[str], version: str = "") -> dict:
+    return get_index_entry(cdf_file_info=cdf_file_info,
+                           file_timeranges=[DataProductSource(url, datetime(2025, 1, day + 1, tzinfo=timezone.utc),
+                                                              datetime(2025, 1, day + 2, tzinfo=timezone.utc))
+                                            for day, url in enumerate(urls)],
+                           instrument="isois", mission="PSP", file_cadence=DailyFileCadence(), version=version)
+
+
+class TestPreviousIndex(unittest.TestCase):
+    def test_returns_cdf_file_info_for_unchanged_description_source(self):
+        cdf_file_info = CdfFileInfo(CdfGlobalInfo("source", "source in human", "v123", date(2022, 7, 28)),
+                                    [CdfVariableInfo("cdf_var_1", "Variable 1", "spectrogram", "units", "axis_1"),
+                                     CdfVariableInfo("cdf_var_2", "Variable 2", "time_series", None, "")])
+        previous_index = PreviousIndex([index_entry(cdf_file_info, ["url_1", "url_2"], version="v123")])
+
+        self.assertEqual(cdf_file_info, previous_index.get_cdf_file_info("url_2"))
+        self.assertIsNone(previous_index.get_cdf_file_info("url_1"))
+        self.assertIsNone(previous_index.get_cdf_file_info("url_3"))
+        self.assertEqual(1, previous_index.reused_count)
+
+    def test_keeps_missing_generation_date(self):
+        cdf_file_info = CdfFileInfo(CdfGlobalInfo("source", "source in human", "", None), [])
+        previous_index = PreviousIndex([index_entry(cdf_file_info, ["url_1"])])
+
+        self.assertEqual(cdf_file_info, previous_index.get_cdf_file_info("url_1"))
+
+    def test_does_not_reuse_entry_without_version_when_data_version_is_required(self):
+        cdf_file_info = CdfFileInfo(CdfGlobalInfo("source", "source in human", "", date(2022, 7, 28)), [])
+        previous_index = PreviousIndex([index_entry(cdf_file_info, ["url_1"])])
+
+        self.assertIsNone(previous_index.get_cdf_file_info("url_1", requires_data_version=True))
+
+    def test_load_reads_index_file_and_tolerates_missing_file(self):
+        cdf_file_info = CdfFileInfo(CdfGlobalInfo("source", "source in human", "", date(2022, 7, 28)), [])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index_path = Path(temp_dir) / 'index.json'
+            index_path.write_text(json.dumps([index_entry(cdf_file_info, ["url_1"])]))
+
+            self.assertEqual(cdf_file_info, PreviousIndex.load(str(index_path)).get_cdf_file_info("url_1"))
+            self.assertIsNone(PreviousIndex.load(str(Path(temp_dir) / 'missing.json')).get_cdf_file_info("url_1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+
+from data_indexer.index_file import IndexWriter, read_index
+
+
+class TestIndexWriter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.entries = [{"logical_source": "a", "variables": [], "file_timeranges": [{"url": "http://a"}]},
+                        {"logical_source": "b", "variables": [{"units": None}], "file_timeranges": []}]
+
+    def test_json_output_matches_json_dump_of_whole_index(self):
+        path = os.path.join(self.temp_dir.name, 'index.json')
+        with IndexWriter(path) as writer:
+            for entry in self.entries:
+                writer.write(entry)
+
+        with open(path) as index_file:
+            self.assertEqual(json.dumps(self.entries, indent=2), index_file.read())
+        self.assertEqual(2, writer.entry_count)
+
+    def test_empty_json_index(self):
+        path = os.path.join(self.temp_dir.name, 'index.json')
+        with IndexWriter(path):
+            pass
+
+        with open(path) as index_file:
+            self.assertEqual('[]', index_file.read())
+
+    def test_ndjson_output_round_trips(self):
+        path = os.path.join(self.temp_dir.name, 'index.ndjson')
+        with IndexWriter(path, 'ndjson') as writer:
+            for entry in self.entries:
+                writer.write(entry)
+
+        with open(path) as index_file:
+            self.assertEqual(2, len(index_file.readlines()))
+        self.assertEqual(self.entries, read_index(path))
+
+    def test_keeps_previous_index_when_writing_fails(self):
+        path = os.path.join(self.temp_dir.name, 'index.json')
+        with open(path, 'w') as index_file:
+            index_file.write('previous index')
+
+        with self.assertRaises(RuntimeError):
+            with IndexWriter(path) as writer:
+                writer.write(self.entries[0])
+                raise RuntimeError("indexer crashed")
+
+        with open(path) as index_file:
+            self.assertEqual('previous index', index_file.read())
+        self.assertEqual(['index.json'], os.listdir(self.temp_dir.name))
+
+    def test_rejects_unknown_format(self):
+        with self.assertRaises(ValueError):
+            IndexWriter('index.csv', 'csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
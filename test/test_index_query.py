@@ -0,0 +1,108 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from data_indexer import index_query
+from data_indexer.compact_index import encode_index_entry
+from data_indexer.index_query import IndexQuery, ProductTimeline, open_index
+from data_indexer.utils import DataProductSource
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def index_entry(logical_source: str, file_timeranges: list) -> dict:
+    return {"logical_source": logical_source, "variables": [], "file_timeranges": [
+        {"start_time": start.isoformat(), "end_time": end.isoformat(), "url": url}
+        for url, start, end in file_timeranges]}
+
+
+DAILY_ENTRY = index_entry("daily", [(f"day_{day}", utc(2025, 1, 1) + timedelta(days=day),
+                                     utc(2025, 1, 2) + timedelta(days=day)) for day in [4, 0, 1, 2, 7]])
+MAP_ENTRY = index_entry("map", [("long", utc(2025, 1, 1), utc(2025, 12, 31)),
+                                ("short", utc(2025, 2, 1), utc(2025, 2, 2))])
+
+
+class TestIndexQuery(unittest.TestCase):
+    def test_overlapping_files(self):
+        query = IndexQuery([DAILY_ENTRY, MAP_ENTRY])
+
+        self.assertEqual(["day_1", "day_2"],
+                         [source.url for source in query.overlapping("daily", utc(2025, 1, 2, 12), utc(2025, 1, 3, 1))])
+        self.assertEqual([], query.overlapping("daily", utc(2025, 1, 6), utc(2025, 1, 8)))
+        self.assertEqual(["long"], [source.url for source in query.overlapping("map", utc(2025, 6, 1), utc(2025, 6, 2))])
+
+    def test_files_at_point_in_time(self):
+        query = IndexQuery([DAILY_ENTRY, MAP_ENTRY])
+
+        self.assertEqual(["day_1"], [source.url for source in query.at("daily", utc(2025, 1, 2))])
+        self.assertEqual([], query.at("daily", utc(2025, 1, 4)))
+        self.assertEqual(["long", "short"], [source.url for source in query.at("map", utc(2025, 2, 1, 6))])
+
+    def test_gaps_in_coverage(self):
+        query = IndexQuery([DAILY_ENTRY])
+
+        self.assertEqual([(utc(2024, 12, 31), utc(2025, 1, 1)),
+                          (utc(2025, 1, 4), utc(2025, 1, 5)),
+                          (utc(2025, 1, 6), utc(2025, 1, 8)),
+                          (utc(2025, 1, 9), utc(2025, 1, 10))],
+                         query.gaps("daily", utc(2024, 12, 31), utc(2025, 1, 10)))
+        self.assertEqual([], query.gaps("daily", utc(2025, 1, 1, 6), utc(2025, 1, 3)))
+
+    def test_reads_compact_index_entries(self):
+        query = IndexQuery([encode_index_entry(DAILY_ENTRY)])
+
+        self.assertEqual(["day_7"], [source.url for source in query.at("daily", utc(2025, 1, 8, 12))])
+
+    def test_matches_a_linear_scan_after_an_early_long_file(self):
+        random.seed(12)
+        sources = [DataProductSource("mission", utc(2020, 1, 1), utc(2030, 1, 1))]
+        for file_number in range(500):
+            start = utc(2020, 1, 2) + timedelta(hours=random.randrange(80000))
+            sources.append(DataProductSource(f"file_{file_number}", start,
+                                             start + timedelta(hours=random.choice([1, 24, 24 * 30]))))
+        timeline = ProductTimeline(sources)
+
+        for _ in range(200):
+            start = utc(2019, 12, 1) + timedelta(hours=random.randrange(100000))
+            end = start + timedelta(hours=random.choice([1, 48, 24 * 90]))
+            expected = [source for source in timeline.sources if source.start_time < end and source.end_time > start]
+            self.assertEqual(expected, timeline.overlapping(start, end))
+            self.assertEqual([source for source in timeline.sources if source.start_time <= start < source.end_time],
+                             timeline.at(start))
+        self.assertEqual([], ProductTimeline([]).overlapping(utc(2025, 1, 1), utc(2025, 1, 2)))
+
+    def test_rejects_query_times_without_a_time_zone(self):
+        query = IndexQuery([DAILY_ENTRY])
+
+        with self.assertRaisesRegex(ValueError, "no time zone"):
+            query.overlapping("daily", datetime(2025, 1, 2), utc(2025, 1, 3))
+        with self.assertRaisesRegex(ValueError, "no time zone"):
+            query.at("daily", datetime(2025, 1, 2))
+
+    def test_open_index_caches_loaded_indexes_until_file_changes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'index.json')
+            with open(path, 'w') as index_file:
+                json.dump([DAILY_ENTRY], index_file)
+
+            with patch.object(index_query, 'read_index', wraps=index_query.read_index) as mock_read_index:
+                first = open_index(path)
+                second = open_index(path)
+                with open(path, 'w') as index_file:
+                    json.dump([MAP_ENTRY], index_file)
+                os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+                reloaded = open_index(path)
+
+            self.assertIs(first, second)
+            self.assertEqual(2, mock_read_index.call_count)
+            self.assertEqual(["map"], reloaded.logical_sources)
+
+
+if __name__ == '__main__':
+    unittest.main()
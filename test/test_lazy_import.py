@@ -0,0 +1,18 @@
+import unittest
+from unittest.mock import patch
+
+from data_indexer.lazy_import import LazyModule
+
+
+class TestLazyModule(unittest.TestCase):
+    @patch('data_indexer.lazy_import.importlib.import_module')
+    def test_imports_module_on_first_attribute_access(self, mock_import_module):
+        module = LazyModule('spacepy.pycdf')
+        mock_import_module.assert_not_called()
+
+        self.assertIs(mock_import_module.return_value.CDF, module.CDF)
+        mock_import_module.assert_called_with('spacepy.pycdf')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,34 +1,300 @@
+import io
+import os
+import subprocess
 import sys
+import tempfile
 import unittest
-from unittest.mock import patch
+from contextlib import nullcontext
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch, call, sentinel
 
+from data_indexer.cdf_parser.cdf_global_parser import CdfGlobalInfo
+from data_indexer.cdf_parser.cdf_parser import CdfFileInfo
+from data_indexer.metrics import metrics
+
+from data_indexer.sharding import Shard, UNSHARDED
 from main import main
 
 
 class TestMain(unittest.TestCase):
-    @patch('main.imap_data_processor')
-    @patch('main.json.dump')
-    @patch('main.open')
-    def test_save_metadata_index_imap(self, mock_open, mock_json_dump, mock_data_processor):
+    def setUp(self):
+        checkpoint_store_patcher = patch('main.CheckpointStore')
+        self.mock_checkpoint_store = checkpoint_store_patcher.start()
+        self.addCleanup(checkpoint_store_patcher.stop)
+
+    @patch('main.encode_index_entry')
+    @patch('data_indexer.imap_data_processor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_save_metadata_index_imap(self, mock_index_writer, mock_iter_metadata_index, mock_encode_index_entry):
+        mock_iter_metadata_index.return_value = iter([sentinel.entry_1, sentinel.entry_2])
+        mock_encode_index_entry.side_effect = [sentinel.compact_entry_1, sentinel.compact_entry_2]
         with patch.object(sys, 'argv', ['main.py', 'imap']):
             main()
 
-        mock_json_dump.assert_called_with(mock_data_processor.get_metadata_index.return_value,
-                                          mock_open.return_value.__enter__.return_value, indent=2)
-        mock_open.assert_called_with('index_imap.v2.json', 'w')
-        mock_open.return_value.__exit__.assert_called()
+        self.assertEqual([call('index_imap.v2.json', 'json'), call('index_imap.v3.json', 'json')],
+                         mock_index_writer.call_args_list)
+        self.assertEqual([call(sentinel.entry_1), call(sentinel.compact_entry_1),
+                          call(sentinel.entry_2), call(sentinel.compact_entry_2)],
+                         mock_index_writer.return_value.__enter__.return_value.write.call_args_list)
+        mock_index_writer.return_value.__exit__.assert_called()
+
+    @patch('data_indexer.imap_data_processor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_passes_worker_count_to_imap_indexer(self, _mock_index_writer, mock_iter_metadata_index):
+        with patch.object(sys, 'argv', ['main.py', 'imap', '--workers', '4']):
+            main()
 
-    @patch('main.PspDataProcessor.get_metadata_index')
-    @patch('main.json.dump')
-    @patch('main.open')
-    def test_save_metadata_index_psp(self, mock_open, mock_json_dump, mock_get_metadata_index):
+        mock_iter_metadata_index.assert_called_once_with(
+            None, max_workers=4, shard=UNSHARDED, checkpoints=self.mock_checkpoint_store.return_value,
+            split_queries_by_instrument=False)
+
+    @patch('main.encode_index_entry')
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_save_metadata_index_psp(self, mock_index_writer, mock_iter_metadata_index, mock_encode_index_entry):
+        mock_iter_metadata_index.return_value = iter([sentinel.entry])
         with patch.object(sys, 'argv', ['main.py', 'psp']):
             main()
 
-        mock_json_dump.assert_called_with(mock_get_metadata_index.return_value,
-                                          mock_open.return_value.__enter__.return_value, indent=2)
-        mock_open.assert_called_with('index_psp.v2.json', 'w')
-        mock_open.return_value.__exit__.assert_called()
+        self.assertEqual([call('index_psp.v2.json', 'json'), call('index_psp.v3.json', 'json')],
+                         mock_index_writer.call_args_list)
+        self.assertEqual([call(sentinel.entry), call(mock_encode_index_entry.return_value)],
+                         mock_index_writer.return_value.__enter__.return_value.write.call_args_list)
+        mock_index_writer.return_value.__exit__.assert_called()
+
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_writes_ndjson_index(self, mock_index_writer, _mock_iter_metadata_index):
+        with patch.object(sys, 'argv', ['main.py', 'psp', '--format', 'ndjson']):
+            main()
+
+        self.assertEqual([call('index_psp.v2.ndjson', 'ndjson'), call('index_psp.v3.ndjson', 'ndjson')],
+                         mock_index_writer.call_args_list)
+
+    @patch('data_indexer.time_index.TimeIndexWriter')
+    @patch('data_indexer.utils.get_data_product_sources')
+    @patch('main.encode_index_entry')
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_writes_time_index_sidecar_when_requested(self, _mock_index_writer, mock_iter_metadata_index,
+                                                      _mock_encode_index_entry, mock_get_data_product_sources,
+                                                      mock_time_index_writer):
+        mock_iter_metadata_index.return_value = iter([{"logical_source": "psp_fld_l2_mag_rtn_1min"}])
+        with patch.object(sys, 'argv', ['main.py', 'psp', '--time-index']):
+            main()
+
+        mock_time_index_writer.return_value.add.assert_called_once_with(
+            "psp_fld_l2_mag_rtn_1min", mock_get_data_product_sources.return_value)
+        mock_time_index_writer.return_value.write.assert_called_once_with('index_psp.v2.timeindex')
+
+    @patch('data_indexer.cdf_downloader.psp_file_parser.enable_listing_cache')
+    @patch('data_indexer.http_client.enable_download_cache')
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_enables_download_cache_from_environment(self, _mock_index_writer, _mock_iter_metadata_index,
+                                                     mock_enable_download_cache, mock_enable_listing_cache):
+        environment = {'CAVA_INDEXER_CACHE_DIR': '/tmp/cache', 'CAVA_INDEXER_CACHE_MAX_BYTES': '1000'}
+        with patch.object(sys, 'argv', ['main.py', 'psp']), patch.dict(os.environ, environment):
+            main()
+
+        mock_enable_download_cache.assert_called_once_with('/tmp/cache', 1000)
+        mock_enable_listing_cache.assert_called_once_with('/tmp/cache/listings.json')
+
+    @patch('data_indexer.incremental_index.PreviousIndex.load')
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_incremental_mode_passes_previous_index(self, _mock_index_writer, mock_iter_metadata_index,
+                                                    mock_load_previous_index):
+        with patch.object(sys, 'argv', ['main.py', 'psp', '--incremental']):
+            main()
+
+        mock_load_previous_index.assert_called_once_with('index_psp.v2.json')
+        mock_iter_metadata_index.assert_called_once_with(
+            mock_load_previous_index.return_value, shard=UNSHARDED, checkpoints=self.mock_checkpoint_store.return_value)
+
+    @patch('main.metrics')
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_writes_metrics_reports_when_requested(self, _mock_index_writer, _mock_iter_metadata_index, mock_metrics):
+        mock_metrics.summary.return_value = ""
+        mock_metrics.report.return_value = {"counters": {}}
+        arguments = ['main.py', 'psp', '--metrics-report', 'metrics.json', '--prometheus-textfile', 'indexer.prom']
+        with patch.object(sys, 'argv', arguments):
+            main()
+
+        mock_metrics.write_json_report.assert_called_once_with('metrics.json')
+        mock_metrics.write_prometheus_textfile.assert_called_once_with('indexer.prom', {"indexer": "psp"})
+
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_prints_startup_timing_when_requested(self, _mock_index_writer, _mock_iter_metadata_index):
+        with patch.object(sys, 'argv', ['main.py', 'psp', '--timing']), \
+                patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            main()
+
+        self.assertIn("startup timing:", stdout.getvalue())
+        self.assertIn("load psp indexer:", stdout.getvalue())
+
+    def test_loads_only_the_requested_indexer(self):
+        script = ("import sys, main; main.load_psp_indexer(main.parse_arguments(['psp'])); "
+                  "print(' '.join(name for name in ['imap_data_access', 'spacepy.pycdf'] if name in sys.modules))")
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                cwd=Path(__file__).parent.parent).stdout
+
+        self.assertEqual("", output.strip())
+
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_sharded_run_writes_only_a_partial_index(self, mock_index_writer, mock_iter_metadata_index):
+        mock_iter_metadata_index.return_value = iter([sentinel.entry])
+        with patch.object(sys, 'argv', ['main.py', 'psp', '--shard', '1/3']):
+            main()
+
+        mock_iter_metadata_index.assert_called_once_with(
+            None, shard=Shard(1, 3), checkpoints=self.mock_checkpoint_store.return_value)
+        self.mock_checkpoint_store.assert_called_once_with('.indexer-checkpoints/index_psp.v2.shard-1-of-3', resume=False)
+        self.assertEqual([call('index_psp.v2.shard-1-of-3.json', 'json')], mock_index_writer.call_args_list)
+        self.assertEqual([call(sentinel.entry)],
+                         mock_index_writer.return_value.__enter__.return_value.write.call_args_list)
+
+    def test_rejects_invalid_shard(self):
+        for shard in ['3/3', '1', 'a/b']:
+            with self.subTest(shard), patch.object(sys, 'argv', ['main.py', 'psp', '--shard', shard]), \
+                    patch('sys.stderr', new_callable=io.StringIO), self.assertRaises(SystemExit):
+                main()
+
+    @patch('main.encode_index_entry')
+    @patch('main.merge_partial_indexes')
+    @patch('main.find_partial_indexes')
+    @patch('main.IndexWriter')
+    def test_merge_writes_the_merged_partial_indexes(self, mock_index_writer, mock_find_partial_indexes,
+                                                     mock_merge_partial_indexes, mock_encode_index_entry):
+        mock_find_partial_indexes.return_value = [sentinel.partial_1, sentinel.partial_2]
+        mock_merge_partial_indexes.return_value = [sentinel.entry]
+        with patch.object(sys, 'argv', ['main.py', 'merge', 'imap', '--format', 'ndjson']):
+            main()
+
+        mock_find_partial_indexes.assert_called_once_with(Path('.'), 'index_imap.v2')
+        mock_merge_partial_indexes.assert_called_once_with([sentinel.partial_1, sentinel.partial_2])
+        self.assertEqual([call('index_imap.v2.ndjson', 'ndjson'), call('index_imap.v3.ndjson', 'ndjson')],
+                         mock_index_writer.call_args_list)
+        self.assertEqual([call(sentinel.entry), call(mock_encode_index_entry.return_value)],
+                         mock_index_writer.return_value.__enter__.return_value.write.call_args_list)
+
+    @patch('main.metrics')
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_resumes_from_checkpoints_and_removes_them_once_the_index_is_written(self, _mock_index_writer,
+                                                                                 _mock_iter_metadata_index,
+                                                                                 mock_metrics):
+        mock_metrics.summary.return_value = ""
+        mock_metrics.report.return_value = {"counters": {"data_products_resumed": 3}}
+        with patch.object(sys, 'argv', ['main.py', 'psp', '--resume', '--checkpoint-dir', '/tmp/state']):
+            main()
+
+        self.mock_checkpoint_store.assert_called_once_with('/tmp/state/index_psp.v2', resume=True)
+        self.mock_checkpoint_store.return_value.remove_all.assert_called_once_with()
+
+    @patch('data_indexer.spooled_download.configure_spooling')
+    @patch('data_indexer.imap_data_processor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_configures_download_spooling_before_indexing(self, _mock_index_writer, mock_iter_metadata_index,
+                                                          mock_configure_spooling):
+        mock_iter_metadata_index.return_value = iter([])
+        with patch.object(sys, 'argv', ['main.py', 'imap', '--max-in-flight-download-bytes', '1024',
+                                        '--spool-dir', '/scratch']):
+            main()
+
+        mock_configure_spooling.assert_called_once_with(1024, '/scratch')
+
+    @patch('main.metrics')
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    @patch('main.IndexWriter')
+    def test_keeps_checkpoints_when_data_products_failed(self, mock_index_writer, _mock_iter_metadata_index,
+                                                         mock_metrics):
+        mock_index_writer.return_value.__exit__.return_value = False
+        mock_metrics.summary.return_value = ""
+        mock_metrics.report.return_value = {"counters": {"data_products_failed": 1}}
+        with patch.object(sys, 'argv', ['main.py', 'psp']), self.assertRaises(SystemExit) as exit_status:
+            main()
+
+        self.assertEqual(1, exit_status.exception.code)
+
+        self.mock_checkpoint_store.assert_called_once_with('.indexer-checkpoints/index_psp.v2', resume=False)
+        self.mock_checkpoint_store.return_value.remove_all.assert_not_called()
+
+
+class TestFailedDataProducts(unittest.TestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(temporary_directory.name)
+        metrics.collect()
+        self.addCleanup(metrics.collect)
+
+    @patch('data_indexer.psp_data_processor.PspDataProcessor.iter_metadata_index')
+    def test_failed_data_product_does_not_shrink_the_published_index(self, mock_iter_metadata_index):
+        published_index = b'[{"logical_source": "a"}, {"logical_source": "b"}]'
+        for path in ['index_psp.v2.json', 'index_psp.v3.json']:
+            Path(path).write_bytes(published_index)
+
+        def index_with_one_failed_data_product(*_args, **_kwargs):
+            yield {"logical_source": "a", "variables": [], "file_timeranges": []}
+            metrics.increment("data_products_failed")
+
+        mock_iter_metadata_index.side_effect = index_with_one_failed_data_product
+        with patch.object(sys, 'argv', ['main.py', 'psp']), patch('sys.stdout', new_callable=io.StringIO) as output, \
+                self.assertRaises(SystemExit) as exit_status:
+            main()
+
+        self.assertEqual(1, exit_status.exception.code)
+        self.assertIn("1 data products failed, so the previous index was kept", output.getvalue())
+        for path in ['index_psp.v2.json', 'index_psp.v3.json']:
+            self.assertEqual(published_index, Path(path).read_bytes())
+        self.assertEqual(['.indexer-checkpoints', 'index_psp.v2.json', 'index_psp.v3.json'], sorted(os.listdir('.')))
+
+
+class TestShardedRuns(unittest.TestCase):
+    def setUp(self):
+        temporary_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(temporary_directory.name)
+
+    @patch('data_indexer.imap_data_processor.CdfParser')
+    @patch('data_indexer.imap_data_processor.CdfMetadataDownloader.get_cdf_metadata')
+    @patch('data_indexer.imap_data_processor.imap_data_access.query')
+    def test_merged_index_is_identical_to_the_unsharded_index(self, mock_imap_query, mock_get_cdf_metadata,
+                                                              mock_cdf_parser):
+        # listed out of alphabetical order, as the archive returns them
+        products = [(instrument, descriptor) for instrument in ["swapi", "hit", "codice", "glows"]
+                    for descriptor in ["protons", "alphas", "electrons"]]
+        mock_imap_query.side_effect = lambda data_level: [
+            {'file_path': f"imap/{instrument}/{data_level}/imap_{instrument}_{data_level}_{descriptor}_20250101_v001.cdf",
+             'instrument': instrument, 'data_level': data_level, 'descriptor': descriptor,
+             'start_date': '20250101', 'version': 'v001'}
+            for instrument, descriptor in products if data_level in ("l3a", "l2")]
+        mock_get_cdf_metadata.side_effect = lambda url: nullcontext(url.rsplit('/', 1)[-1][:-len("_20250101_v001.cdf")])
+        mock_cdf_parser.parse_cdf.side_effect = lambda logical_source, _selector: CdfFileInfo(
+            CdfGlobalInfo(logical_source, logical_source, "v001", date(2025, 1, 2)), [])
+
+        def run(*arguments):
+            with patch.object(sys, 'argv', ['main.py', *arguments]), patch('sys.stdout', new_callable=io.StringIO):
+                main()
+
+        run('imap', '--workers', '1')
+        unsharded = {path: Path(path).read_bytes() for path in ['index_imap.v2.json', 'index_imap.v3.json']}
+        for path in unsharded:
+            os.remove(path)
+        for shard in ['0/3', '1/3', '2/3']:
+            run('imap', '--workers', '1', '--shard', shard)
+        run('merge', 'imap')
+
+        self.assertEqual(12, unsharded['index_imap.v2.json'].count(b'"logical_source"'))
+        for path, content in unsharded.items():
+            self.assertEqual(content, Path(path).read_bytes(), path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,69 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from data_indexer.metrics import Metrics, DOWNLOAD, PARSE
+
+
+class TestMetrics(unittest.TestCase):
+    @patch('data_indexer.metrics.time.perf_counter', side_effect=[0.0, 0.02, 1.0, 4.0])
+    def test_records_stage_timings_bytes_and_errors(self, _mock_perf_counter):
+        metrics = Metrics()
+
+        with metrics.stage(DOWNLOAD) as observation:
+            observation.bytes = 2048
+        with self.assertRaises(ValueError), metrics.stage(DOWNLOAD):
+            raise ValueError("truncated CDF")
+
+        download = metrics.report()["stages"][DOWNLOAD]
+        self.assertEqual(2, download["count"])
+        self.assertEqual(1, download["errors"])
+        self.assertEqual(2048, download["bytes"])
+        self.assertAlmostEqual(3.02, download["seconds"])
+        self.assertEqual(3.0, download["max_seconds"])
+        self.assertEqual([0, 0, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0], download["bucket_counts"])
+
+    def test_merges_metrics_collected_in_worker_processes(self):
+        parent_metrics = Metrics()
+        worker_metrics = Metrics()
+        parent_metrics.observe(PARSE, 0.5)
+        worker_metrics.observe(PARSE, 1.5, byte_count=10)
+        worker_metrics.increment("data_products_indexed")
+
+        parent_metrics.merge(worker_metrics.collect())
+
+        report = parent_metrics.report()
+        self.assertEqual(2, report["stages"][PARSE]["count"])
+        self.assertEqual(2.0, report["stages"][PARSE]["seconds"])
+        self.assertEqual(10, report["stages"][PARSE]["bytes"])
+        self.assertEqual({"data_products_indexed": 1}, report["counters"])
+        self.assertEqual({}, worker_metrics.report()["stages"])
+
+    def test_writes_json_report_and_prometheus_textfile(self):
+        metrics = Metrics()
+        metrics.observe(DOWNLOAD, 0.2, byte_count=100)
+        metrics.observe(DOWNLOAD, 7.0, error=True)
+        metrics.increment("data_products_indexed", 3)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metrics.write_json_report(str(Path(temp_dir) / 'metrics.json'))
+            metrics.write_prometheus_textfile(str(Path(temp_dir) / 'indexer.prom'), {"indexer": "imap"})
+            report = json.loads((Path(temp_dir) / 'metrics.json').read_text())
+            textfile = (Path(temp_dir) / 'indexer.prom').read_text().splitlines()
+
+        self.assertEqual(2, report["stages"][DOWNLOAD]["count"])
+        self.assertEqual(3.6, report["stages"][DOWNLOAD]["mean_seconds"])
+        self.assertEqual({"data_products_indexed": 3}, report["counters"])
+        self.assertIn('cava_indexer_stage_seconds_bucket{indexer="imap",stage="download",le="0.25"} 1', textfile)
+        self.assertIn('cava_indexer_stage_seconds_bucket{indexer="imap",stage="download",le="10"} 2', textfile)
+        self.assertIn('cava_indexer_stage_seconds_bucket{indexer="imap",stage="download",le="+Inf"} 2', textfile)
+        self.assertIn('cava_indexer_stage_seconds_count{indexer="imap",stage="download"} 2', textfile)
+        self.assertIn('cava_indexer_stage_errors_total{indexer="imap",stage="download"} 1', textfile)
+        self.assertIn('cava_indexer_stage_bytes_total{indexer="imap",stage="download"} 100', textfile)
+        self.assertIn('cava_indexer_data_products_indexed_total{indexer="imap"} 3', textfile)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from contextlib import nullcontext
 from datetime import date
 from unittest.mock import patch, call, sentinel, Mock
 
@@ -10,14 +11,15 @@ from data_indexer.cdf_parser.cdf_variable_parser import CdfVariableInfo
 from data_indexer.file_cadence.daily_file_cadence import DailyFileCadence
 from data_indexer.file_cadence.six_month_file_cadence import SixMonthFileCadence
 from data_indexer.psp_data_processor import PspDataProcessor
+from data_indexer.sharding import Shard, UNSHARDED_POSITION
 
 
 class TestPspDataProcessor(unittest.TestCase):
 
     @patch('data_indexer.psp_data_processor.CdfParser')
     @patch('data_indexer.psp_data_processor.PspDownloader')
-    @patch('data_indexer.psp_data_processor.get_with_retry')
-    def test_gets_filenames_and_downloads_the_first_file_in_list(self, mock_get_with_retry, mock_downloader,
+    @patch('data_indexer.psp_data_processor.CdfMetadataDownloader.get_cdf_metadata')
+    def test_gets_filenames_and_downloads_the_first_file_in_list(self, mock_get_cdf_metadata, mock_downloader,
                                                                  mock_cdf_parser):
         self.maxDiff = None
         mock_downloader.get_all_metadata.return_value = \
@@ -63,14 +65,14 @@ class TestPspDataProcessor(unittest.TestCase):
             summary_20181115_url
         ]
 
-        mock_get_with_retry.side_effect = [
-            Mock(content=b'some data 1'),
-            Mock(content=b'some data 2'),
-            Mock(content=b'some data 3'),
-            Mock(content=b'some data 4'),
+        mock_get_cdf_metadata.side_effect = [
+            nullcontext(sentinel.cdf_data_1),
+            nullcontext(sentinel.cdf_data_2),
+            nullcontext(sentinel.cdf_data_3),
+            nullcontext(sentinel.cdf_data_4),
         ]
 
-        mock_cdf_parser.parse_cdf_bytes.side_effect = [
+        mock_cdf_parser.parse_cdf.side_effect = [
             CdfFileInfo(
                 CdfGlobalInfo("psp_isois-epihi_l2-het-rates3600", "PSP Description 10", "10", date(2022, 11, 14)),
                 [CdfVariableInfo('a key into the CDF 1', 'a description v1', 'time_series', 'units', "axis_1")]),
@@ -103,7 +105,7 @@ class TestPspDataProcessor(unittest.TestCase):
             call(psp_isois_cda_base_url, 'psp_isois_l2-summary_20181115_v13.cdf', 'merged', 'summary', '2023')
         ])
 
-        mock_get_with_retry.assert_has_calls([
+        mock_get_cdf_metadata.assert_has_calls([
             call(het_rates3600_20190103_url),
             call(het_rates60_20190105_url),
             call(ephem_20181112_url),
@@ -204,14 +206,30 @@ class TestPspDataProcessor(unittest.TestCase):
                            }],
                          actual_index)
 
-        self.assertEqual(4, mock_cdf_parser.parse_cdf_bytes.call_count)
-        self.assertEqual(b'some data 1', mock_cdf_parser.parse_cdf_bytes.call_args_list[0].args[0])
-        self.assertEqual(b'some data 2', mock_cdf_parser.parse_cdf_bytes.call_args_list[1].args[0])
-        self.assertEqual(b'some data 3', mock_cdf_parser.parse_cdf_bytes.call_args_list[2].args[0])
-        self.assertEqual(b'some data 4', mock_cdf_parser.parse_cdf_bytes.call_args_list[3].args[0])
-
-        self.assertEqual(sentinel.variable_selector_1, mock_cdf_parser.parse_cdf_bytes.call_args_list[0].args[1])
-        self.assertEqual(sentinel.variable_selector_1, mock_cdf_parser.parse_cdf_bytes.call_args_list[1].args[1])
-
-        self.assertEqual(sentinel.variable_selector_2, mock_cdf_parser.parse_cdf_bytes.call_args_list[2].args[1])
-        self.assertEqual(sentinel.variable_selector_2, mock_cdf_parser.parse_cdf_bytes.call_args_list[3].args[1])
+        self.assertEqual(4, mock_cdf_parser.parse_cdf.call_count)
+        self.assertEqual(sentinel.cdf_data_1, mock_cdf_parser.parse_cdf.call_args_list[0].args[0])
+        self.assertEqual(sentinel.cdf_data_2, mock_cdf_parser.parse_cdf.call_args_list[1].args[0])
+        self.assertEqual(sentinel.cdf_data_3, mock_cdf_parser.parse_cdf.call_args_list[2].args[0])
+        self.assertEqual(sentinel.cdf_data_4, mock_cdf_parser.parse_cdf.call_args_list[3].args[0])
+
+        self.assertEqual(sentinel.variable_selector_1, mock_cdf_parser.parse_cdf.call_args_list[0].args[1])
+        self.assertEqual(sentinel.variable_selector_1, mock_cdf_parser.parse_cdf.call_args_list[1].args[1])
+
+        self.assertEqual(sentinel.variable_selector_2, mock_cdf_parser.parse_cdf.call_args_list[2].args[1])
+        self.assertEqual(sentinel.variable_selector_2, mock_cdf_parser.parse_cdf.call_args_list[3].args[1])
+
+    @patch('data_indexer.psp_data_processor.PspDataProcessor._get_index_entry')
+    @patch('data_indexer.psp_data_processor.PspDownloader.get_all_metadata')
+    def test_sharded_entries_record_their_position_in_an_unsharded_run(self, mock_get_all_metadata,
+                                                                        mock_get_index_entry):
+        mock_get_all_metadata.return_value = [
+            PspDirectoryInfo(psp_isois_cda_base_url, 'ISOIS', 'merged', {
+                'ephem': [PspFileInfo('link1', 'psp_isois_l2-ephem_20181111_v12.cdf', '2022')],
+                'summary': [PspFileInfo('link2', 'psp_isois_l2-summary_20181114_v13.cdf', '2023')]},
+                             sentinel.variable_selector, 'PSP', DailyFileCadence(), position=2)]
+        mock_get_index_entry.side_effect = lambda *_: {"logical_source": "product"}
+
+        index = PspDataProcessor.get_metadata_index(shard=Shard(0, 2))
+
+        mock_get_all_metadata.assert_called_once_with(Shard(0, 2))
+        self.assertEqual([[2, 0], [2, 1]], [entry[UNSHARDED_POSITION] for entry in index])
@@ -0,0 +1,96 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, Mock
+
+from data_indexer.http_client import RetryLater
+from data_indexer.retry_scheduler import RetryScheduler, ExecutorTask
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestRetryScheduler(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.calls = []
+        for name in ('monotonic', 'sleep'):
+            patcher = patch(f'data_indexer.retry_scheduler.time.{name}', side_effect=getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        random_patcher = patch('data_indexer.http_client.random.random', return_value=0.0)
+        random_patcher.start()
+        self.addCleanup(random_patcher.stop)
+
+    def task(self, name, outcomes):
+        outcomes = iter(outcomes)
+
+        def run():
+            self.calls.append((name, self.clock.now))
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            self.clock.now += 1
+            return outcome
+        return name, run
+
+    def test_runs_later_tasks_while_failed_task_is_parked_and_keeps_order(self):
+        scheduler = RetryScheduler()
+        tasks = [self.task("a", [RetryLater("a", retry_after=1.5), "result a"]),
+                 self.task("b", ["result b"]),
+                 self.task("c", ["result c"])]
+
+        results = list(scheduler.run(tasks))
+
+        self.assertEqual(["result a", "result b", "result c"], results)
+        self.assertEqual([("a", 0.0), ("b", 0.0), ("c", 1.0), ("a", 2.0)], self.calls)
+        self.assertEqual(1, scheduler.retry_count)
+        self.assertEqual([], scheduler.failures)
+
+    def test_waits_with_backoff_when_only_parked_tasks_remain(self):
+        scheduler = RetryScheduler()
+
+        results = list(scheduler.run([self.task("a", [RetryLater("a"), RetryLater("a"), "result a"])]))
+
+        self.assertEqual(["result a"], results)
+        self.assertEqual([("a", 0.0), ("a", 0.5), ("a", 1.5)], self.calls)
+
+    def test_reports_tasks_that_keep_failing(self):
+        scheduler = RetryScheduler(max_attempts=2)
+        tasks = [self.task("flaky.cdf", [RetryLater("flaky.cdf", reason="HTTP 503")] * 2),
+                 self.task("fine.cdf", ["result"])]
+
+        results = list(scheduler.run(tasks))
+
+        self.assertEqual(["result"], results)
+        self.assertEqual(["flaky.cdf"], [failure.key for failure in scheduler.failures])
+        self.assertIn("flaky.cdf: flaky.cdf is temporarily unavailable (HTTP 503) after 2 attempts",
+                      scheduler.summary())
+
+    def test_other_errors_are_not_retried(self):
+        scheduler = RetryScheduler()
+
+        with self.assertRaises(ValueError):
+            list(scheduler.run([self.task("a", [ValueError("bad cdf")])]))
+
+    def test_executor_task_resubmits_on_retry(self):
+        function = Mock(side_effect=[RetryLater("a"), "result"])
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            task = ExecutorTask(executor, function, "argument")
+            with self.assertRaises(RetryLater):
+                task()
+            self.assertEqual("result", task())
+
+        self.assertEqual(2, function.call_count)
+        function.assert_called_with("argument")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from data_indexer.sharding import Shard, find_partial_indexes, merge_partial_indexes, run_at_unsharded_position, \
+    UNSHARDED, UNSHARDED_POSITION
+
+
+def index_entry(mission: str, instrument: str, logical_source: str, url: str) -> dict:
+    return {"mission": mission, "instrument": instrument, "logical_source": logical_source,
+            "file_timeranges": [{"start_time": "2024-01-01T00:00:00", "end_time": "2024-01-02T00:00:00",
+                                 "url": url}]}
+
+
+def partial_index_entry(unsharded_position: list, *fields) -> dict:
+    return {**index_entry(*fields), UNSHARDED_POSITION: unsharded_position}
+
+
+class TestShard(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(Shard(2, 4), Shard.parse("2/4"))
+        self.assertEqual("2/4", str(Shard.parse("2/4")))
+        for text in ["4/4", "-1/4", "1", "1/0", "a/b"]:
+            with self.subTest(text), self.assertRaises(ValueError):
+                Shard.parse(text)
+
+    def test_every_key_belongs_to_exactly_one_shard(self):
+        keys = [f"mag/l3a/product-{number}" for number in range(200)]
+        shards = [Shard(index, 3) for index in range(3)]
+
+        owners = [[shard for shard in shards if shard.owns(key)] for key in keys]
+
+        self.assertTrue(all(len(key_owners) == 1 for key_owners in owners))
+        self.assertTrue(all(UNSHARDED.owns(key) for key in keys))
+        self.assertEqual([True, False, False, True], [Shard(0, 3).owns_position(position) for position in range(4)])
+
+    def test_records_the_unsharded_position_of_sharded_entries_only(self):
+        self.assertEqual({"logical_source": "a", UNSHARDED_POSITION: [2, 0]},
+                         run_at_unsharded_position([2, 0], lambda: {"logical_source": "a"}))
+        self.assertEqual({"logical_source": "a"}, run_at_unsharded_position(None, lambda: {"logical_source": "a"}))
+        self.assertIsNone(run_at_unsharded_position([2, 0], lambda: None))
+
+
+class TestPartialIndexes(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self.temporary_directory.name)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def write_partial_index(self, name: str, entries: list):
+        path = self.directory / name
+        if name.endswith('.ndjson'):
+            path.write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+        else:
+            path.write_text(json.dumps(entries))
+        return path
+
+    def test_finds_one_partial_index_per_shard_in_shard_order(self):
+        shard_1 = self.write_partial_index('index_psp.v2.shard-1-of-2.ndjson', [])
+        shard_0 = self.write_partial_index('index_psp.v2.shard-0-of-2.json', [])
+        self.write_partial_index('index_imap.v2.shard-0-of-1.json', [])
+        self.write_partial_index('index_psp.v2.json', [])
+
+        self.assertEqual([shard_0, shard_1], find_partial_indexes(self.directory, 'index_psp.v2'))
+
+    def test_rejects_incomplete_or_mixed_partial_indexes(self):
+        with self.assertRaises(FileNotFoundError):
+            find_partial_indexes(self.directory, 'index_psp.v2')
+
+        self.write_partial_index('index_psp.v2.shard-0-of-3.json', [])
+        with self.assertRaisesRegex(ValueError, "Missing partial indexes of index_psp.v2 for shards 1/3, 2/3"):
+            find_partial_indexes(self.directory, 'index_psp.v2')
+
+        self.write_partial_index('index_psp.v2.shard-0-of-2.json', [])
+        with self.assertRaisesRegex(ValueError, "different shard counts: 2, 3"):
+            find_partial_indexes(self.directory, 'index_psp.v2')
+
+    def test_merge_restores_the_unsharded_order_independently_of_the_shards(self):
+        epihi = ("PSP", "ISOIS-EPIHi", "psp_isois-epihi_l2-het-rates60", "https://cdaweb/epihi.cdf")
+        epihi_rates = ("PSP", "ISOIS-EPIHi", "psp_isois-epihi_l2-het-rates3600", "https://cdaweb/epihi_rates.cdf")
+        fields = ("PSP", "FIELDS", "psp_fld_l2_mag_rtn_1min", "https://cdaweb/fields.cdf")
+        omni = ("OMNI", "OMNI", "omni2_h0_mrg1hr", "https://cdaweb/omni.cdf")
+        first = self.write_partial_index('index_psp.v2.shard-0-of-2.json', [
+            partial_index_entry([0, 1], *epihi_rates), partial_index_entry([5, 0], *omni),
+            partial_index_entry([0, 0], *epihi)])
+        second = self.write_partial_index('index_psp.v2.shard-1-of-2.ndjson', [partial_index_entry([4, 0], *fields)])
+
+        expected = [index_entry(*epihi), index_entry(*epihi_rates), index_entry(*fields), index_entry(*omni)]
+        self.assertEqual(expected, merge_partial_indexes([first, second]))
+        self.assertEqual(expected, merge_partial_indexes([second, first]))
+
+    def test_merge_rejects_partial_indexes_without_unsharded_positions(self):
+        first = self.write_partial_index('index_psp.v2.shard-0-of-1.json', [
+            index_entry("PSP", "FIELDS", "psp_fld_l2_mag_rtn_1min", "https://cdaweb/fields.cdf")])
+
+        with self.assertRaisesRegex(ValueError, "has no unsharded_position"):
+            merge_partial_indexes([first])
+
+    def test_merge_rejects_a_product_in_two_partial_indexes(self):
+        fields = partial_index_entry([3, 0], "PSP", "FIELDS", "psp_fld_l2_mag_rtn_1min", "https://cdaweb/fields.cdf")
+        first = self.write_partial_index('index_psp.v2.shard-0-of-2.json', [fields])
+        second = self.write_partial_index('index_psp.v2.shard-1-of-2.json', [fields])
+
+        with self.assertRaisesRegex(ValueError, "psp_fld_l2_mag_rtn_1min appears in more than one partial index"):
+            merge_partial_indexes([first, second])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import hashlib
+import multiprocessing
+import tempfile
+import unittest
+from pathlib import Path
+
+from data_indexer.metrics import metrics
+from data_indexer.spooled_download import InFlightBytes, SpoolSettings, SpooledFile, spool
+
+
+class TestSpooledDownload(unittest.TestCase):
+    def setUp(self) -> None:
+        metrics.collect()
+
+    def test_spools_in_memory_under_the_ceiling_and_releases_it_on_close(self):
+        settings = SpoolSettings(InFlightBytes(max_bytes=10))
+
+        with spool([b'cdf ', b'bytes'], expected_size=9, settings=settings) as spooled_file:
+            self.assertTrue(spooled_file.in_memory)
+            self.assertEqual(9, settings.in_flight_bytes.reserved)
+            self.assertEqual(b'cdf bytes', spooled_file.file.read())
+            self.assertEqual(9, spooled_file.size)
+            self.assertEqual(hashlib.sha256(b'cdf bytes').hexdigest(), spooled_file.sha256)
+
+        self.assertEqual(0, settings.in_flight_bytes.reserved)
+
+    def test_spools_to_disk_when_the_ceiling_is_reached_or_the_size_is_unknown(self):
+        with tempfile.TemporaryDirectory() as spool_directory:
+            settings = SpoolSettings(InFlightBytes(max_bytes=10), spool_directory)
+            with spool([b'first'], expected_size=5, settings=settings) as first, \
+                    spool([b'second'], expected_size=6, settings=settings) as second, \
+                    spool([b'third'], settings=settings) as third:
+                self.assertEqual((True, False, False), (first.in_memory, second.in_memory, third.in_memory))
+                self.assertEqual(5, settings.in_flight_bytes.reserved)
+                self.assertEqual(b'second', second.file.read())
+
+        self.assertEqual(0, settings.in_flight_bytes.reserved)
+        self.assertEqual(2, metrics.collect().counters["downloads_spooled_to_disk"])
+
+    def test_releases_the_ceiling_when_the_download_fails(self):
+        settings = SpoolSettings(InFlightBytes(max_bytes=10))
+
+        def interrupted_download():
+            yield b'part'
+            raise ConnectionError("connection reset")
+
+        with self.assertRaises(ConnectionError):
+            spool(interrupted_download(), expected_size=8, settings=settings)
+        self.assertEqual(0, settings.in_flight_bytes.reserved)
+
+    def test_ceiling_is_shared_with_forked_processes(self):
+        in_flight_bytes = InFlightBytes(max_bytes=10)
+        context = multiprocessing.get_context('fork')
+        process = context.Process(target=in_flight_bytes.try_reserve, args=(7,))
+        process.start()
+        process.join()
+
+        self.assertEqual(7, in_flight_bytes.reserved)
+        self.assertFalse(in_flight_bytes.try_reserve(4))
+
+    def test_opens_a_file_already_on_disk_and_hashes_it_only_when_asked(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'cached.cdf'
+            path.write_bytes(b'cached cdf')
+            with SpooledFile.open(str(path), sha256='stored digest') as spooled_file:
+                self.assertEqual('stored digest', spooled_file.sha256)
+            with SpooledFile.open(str(path)) as spooled_file:
+                self.assertFalse(spooled_file.in_memory)
+                self.assertEqual(10, spooled_file.size)
+                self.assertEqual(b'cached', spooled_file.file.read(6))
+                self.assertEqual(hashlib.sha256(b'cached cdf').hexdigest(), spooled_file.sha256)
+                self.assertEqual(b' cdf', spooled_file.file.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from data_indexer.time_index import TimeIndexWriter, TimeIndex, to_epoch_microseconds
+from data_indexer.utils import DataProductSource
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class TestTimeIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, 'index.timeindex')
+
+    def write_and_open(self, writer: TimeIndexWriter) -> TimeIndex:
+        writer.write(self.path)
+        time_index = TimeIndex(self.path)
+        self.addCleanup(time_index.close)
+        return time_index
+
+    def test_finds_files_overlapping_interval(self):
+        writer = TimeIndexWriter()
+        daily_files = [DataProductSource(f"daily_{day}", utc(2025, 1, 1) + timedelta(days=day),
+                                         utc(2025, 1, 2) + timedelta(days=day)) for day in range(30)]
+        writer.add("daily_product", list(reversed(daily_files)))
+        writer.add("map_product", [DataProductSource("map_1", utc(2025, 1, 1), utc(2025, 7, 2, 15)),
+                                   DataProductSource("map_2", utc(2025, 7, 1), utc(2026, 1, 1))])
+
+        time_index = self.write_and_open(writer)
+
+        self.assertEqual(["daily_product", "map_product"], time_index.keys)
+        self.assertEqual(["daily_3", "daily_4"],
+                         time_index.find_urls("daily_product", utc(2025, 1, 4), utc(2025, 1, 5, 12)))
+        self.assertEqual([], time_index.find_urls("daily_product", utc(2025, 3, 1), utc(2025, 3, 2)))
+        self.assertEqual(["map_1", "map_2"], time_index.find_urls("map_product", utc(2025, 7, 2), utc(2025, 7, 3)))
+        self.assertEqual(["map_2"], time_index.find_urls("map_product", utc(2025, 7, 3), utc(2025, 7, 4)))
+
+    def test_long_file_is_found_even_when_later_files_end_earlier(self):
+        writer = TimeIndexWriter()
+        writer.add("product", [DataProductSource("long", utc(2025, 1, 1), utc(2025, 12, 31)),
+                               DataProductSource("short", utc(2025, 2, 1), utc(2025, 2, 2))])
+
+        time_index = self.write_and_open(writer)
+
+        self.assertEqual(["long"], time_index.find_urls("product", utc(2025, 6, 1), utc(2025, 6, 2)))
+
+    def test_returns_epoch_microseconds_with_urls(self):
+        writer = TimeIndexWriter()
+        start, end = utc(2024, 12, 10, 12, 59, 28, 319992), utc(2025, 1, 6, 19, 35, 54, 239992)
+        writer.add("carrington_product", [DataProductSource("https://example.com/ünïcode.cdf", start, end)])
+
+        time_index = self.write_and_open(writer)
+
+        self.assertEqual([("https://example.com/ünïcode.cdf", to_epoch_microseconds(start), to_epoch_microseconds(end))],
+                         time_index.find_files("carrington_product", utc(2025, 1, 1), utc(2025, 1, 2)))
+
+    def test_rejects_query_times_without_a_time_zone(self):
+        writer = TimeIndexWriter()
+        writer.add("product", [DataProductSource("file", utc(2025, 1, 1), utc(2025, 1, 2))])
+
+        time_index = self.write_and_open(writer)
+
+        with self.assertRaisesRegex(ValueError, "no time zone"):
+            time_index.find_urls("product", datetime(2025, 1, 1), datetime(2025, 1, 2))
+
+    def test_rejects_files_that_are_not_time_indexes(self):
+        with open(self.path, 'wb') as not_a_time_index:
+            not_a_time_index.write(bytes(64))
+
+        with self.assertRaises(ValueError):
+            TimeIndex(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -93,6 +93,17 @@ class TestUtils(unittest.TestCase):
         }
         self.assertEqual(expected, output)
 
+    def test_get_data_product_sources_from_index_entry(self):
+        data_product_sources = [DataProductSource("url_1", datetime(2025, 1, 1, tzinfo=timezone.utc),
+                                                  datetime(2025, 1, 2, tzinfo=timezone.utc)),
+                                DataProductSource("url_2", datetime(2025, 1, 2, 12, 30, 0, 500, tzinfo=timezone.utc),
+                                                  datetime(2025, 1, 3, tzinfo=timezone.utc))]
+        index_entry = utils.get_index_entry(
+            cdf_file_info=CdfFileInfo(CdfGlobalInfo("source", "source in human", "v123", date(2022, 7, 28)), []),
+            instrument="isois", mission="PSP", file_cadence=DailyFileCadence(), file_timeranges=data_product_sources)
+
+        self.assertEqual(data_product_sources, utils.get_data_product_sources(index_entry))
+
 
 if __name__ == '__main__':
     unittest.main()
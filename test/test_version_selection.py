@@ -0,0 +1,42 @@
+import unittest
+from operator import itemgetter
+
+from data_indexer.version_selection import select_latest_versions, select_latest_version_per_date
+
+
+def version_number(record: dict) -> int:
+    return int(record["version"].lstrip("v"))
+
+
+class TestVersionSelection(unittest.TestCase):
+    def test_keeps_highest_integer_version_per_group_and_start_date(self):
+        records = [
+            {"product": "b", "start_date": "20240102", "version": "v999"},
+            {"product": "a", "start_date": "20240102", "version": "v001"},
+            {"product": "b", "start_date": "20240102", "version": "v1000"},
+            {"product": "a", "start_date": "20240101", "version": "v002"},
+            {"product": "a", "start_date": "20240102", "version": "v003"},
+            {"product": "b", "start_date": "20240101", "version": "v001"},
+            {"product": "a", "start_date": "20240101", "version": "v001"},
+        ]
+
+        selected = select_latest_versions(iter(records), itemgetter("product"), itemgetter("start_date"),
+                                          version_number)
+
+        self.assertEqual(["b", "a"], list(selected))
+        self.assertEqual([records[3], records[4]], selected["a"])
+        self.assertEqual([records[5], records[2]], selected["b"])
+
+    def test_keeps_first_record_when_versions_are_equal(self):
+        first = {"start_date": "20240101", "version": "v002", "file_path": "first"}
+        second = {"start_date": "20240101", "version": "v002", "file_path": "second"}
+
+        self.assertEqual([first], select_latest_version_per_date([first, second], itemgetter("start_date"),
+                                                                 version_number))
+
+    def test_single_product_without_records(self):
+        self.assertEqual([], select_latest_version_per_date([], itemgetter("start_date"), version_number))
+
+
+if __name__ == '__main__':
+    unittest.main()